@@ -1,30 +1,146 @@
-from flask import Flask, render_template, jsonify, request
-import nmap
+from flask import Flask, Response, render_template, jsonify, request
 import psutil
 import socket
 import netifaces
 import time
 import threading
 import json
+import logging
 import os
-import subprocess
+import argparse
 from datetime import datetime
 import platform
+import ipaddress
+import shutil
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from discovery import DiscoveryEngine, NmapBackend, shard_label
+from arp_scan import ArpScanBackend
+from mac_resolver import MacResolver
+from dns_resolver import HostnameResolver
+from registry import DeviceRegistry
+from listing import SORT_FIELDS
+from netinfo import NetworkInfoProvider
+from traffic_store import TrafficStore, RANGES as TRAFFIC_RANGES
+from traffic_sampler import TrafficSampler
+from bandwidth import BandwidthAccounting
+from persistence import StateStore
+from events import EventBus, format_sse
+from http_cache import conditional_json, response_cache
+from firewall import Firewall, detect_backend
+from kick_scheduler import KickScheduler
+from concurrency import SingleFlight
+from segments import Segment, SegmentSet, parse_segment_spec
+from engine_link import EngineServer, EngineClient, EngineError
+from metrics import MetricsRegistry
+from logs import setup_logging
+from vendors import OuiIndex
+from fingerprint import ServiceProber
+from presence import PresenceLog, EVENT_TYPES as PRESENCE_EVENT_TYPES
+from fleet import FleetCollector, FleetSender
 
 app = Flask(__name__)
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 
+log = logging.getLogger('network_guardian')
+log_level = 'INFO'  # DEBUG also logs every discovered device
+log_rate_limit = 20  # Lines per second for each message template, the rest are counted and dropped
+
+# Prometheus metrics served on /metrics. Stage timers cover the hot paths of
+# a scan (sweep, dns, mac_lookup, merge) plus stats sampling and firewall commands.
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram('network_guardian_stage_seconds', 'Time spent in one run of a scan or sampling stage')
+scan_seconds = metrics.histogram('network_guardian_scan_duration_seconds', 'Duration of complete segment scans')
+scans_total = metrics.counter('network_guardian_scans_total', 'Completed segment scans')
+failed_shards_total = metrics.counter('network_guardian_scan_failed_shards_total', 'Discovery shards that failed')
+scan_hosts_per_second = metrics.gauge('network_guardian_scan_hosts_per_second', 'Addresses probed per second by the last scan')
+scan_hosts_up = metrics.gauge('network_guardian_scan_hosts_up', 'Hosts that answered the last scan')
+
 # Global variables to store data
-devices = []
-blocked_devices = []  # List to store blocked devices
+devices = DeviceRegistry(on_events=lambda events: record_presence(events))  # Indexed by IP and MAC
+blocked_devices = []  # List to store blocked devices (replaced, never mutated in place)
+blocked_lock = threading.Lock()  # Serializes writers of blocked_devices
 network_stats = {}
+stats_version = 0  # Bumped every time network_stats is replaced (used for ETags, sent as its 'version')
+# Part of every ETag: versions restart from zero with the process, so ETags
+# from before a restart must not match. Web workers take the engine's.
+etag_epoch = os.urandom(4).hex()
+stats_lock = threading.Lock()
+background_workers = 4  # Scans (and other background jobs) running at the same time
+background_pool = ThreadPoolExecutor(max_workers=background_workers, thread_name_prefix='background')
+scan_flight = SingleFlight(background_pool)  # One scan per segment; extra requests join it
 scan_interval = 60  # seconds
+scan_workers = 8  # Number of shards swept at the same time
+scan_shard_prefix = 24  # Target CIDR is split into shards of this size
+scan_shard_timeout = 120  # seconds before nmap gives up on a shard
+scan_backend = 'nmap'  # 'nmap' or 'arp' (raw-socket ARP sweep, needs root)
+arp_scan_rate = 500  # ARP requests per second for the 'arp' backend
+scan_mode = 'incremental'  # 'incremental' (re-probe due hosts) or 'full' (sweep every cycle)
+full_scan_interval = 900  # seconds between full sweeps in incremental mode
+# Interfaces/subnets to watch, e.g. ['eth0', 'eth1.20=10.20.0.0/24'] or dicts
+# with interface, cidr, name and scan_interval. Empty = the default route only.
+monitored_segments = []
+segments = SegmentSet()  # Filled by build_segments(), one scan worker each
+segments_lock = threading.Lock()
+database_path = 'network_guardian.db'  # SQLite file for devices and traffic history
+state_store = None  # Set by load_state()
+presence_path = 'presence'  # Directory of the device presence event log
+presence_max_bytes = 64 << 20  # Oldest presence segments are dropped above this size
+presence_max_age = 30 * 86400  # seconds presence events are kept
+presence_log = None  # Set by load_state()
+firewall = Firewall(detect_backend(), timer=lambda: stage_seconds.time(stage='firewall'))  # Batched nftables/ipset/netsh blocking
+kick_duration = 10.0  # seconds a kicked device stays blocked
+kick_scheduler = KickScheduler(on_expire=lambda ip: unblock_device(ip), max_jobs=4)
+event_bus = EventBus(history=1000)  # Deltas pushed to dashboards over /api/events
 last_scan_time = None
-traffic_history = {
-    'timestamps': [],
-    'download': [],
-    'upload': []
-}
+mac_resolver = MacResolver(ttl=600)  # IP -> MAC index shared between scans
+hostname_resolver = HostnameResolver(max_workers=32, positive_ttl=3600, negative_ttl=300)
+vendor_index = OuiIndex()  # MAC prefix -> vendor, bundled table plus any system OUI files
+service_probe_enabled = False  # Probe common TCP ports of new/changed hosts after discovery (opt-in)
+service_probe_concurrency = 256  # TCP connections in flight while probing
+service_probe_ttl = 86400  # seconds a device's probe result is reused (cached per MAC)
+traffic_store = TrafficStore()  # Ring buffers with downsampled retention tiers
+traffic_sample_interval = 1.0  # seconds between per-NIC counter samples
+traffic_persist_interval = 10  # seconds between traffic samples written to disk
+stats_refresh_interval = 5  # seconds between /api/stats refreshes outside scans
+last_persisted_sample = 0.0
+bandwidth_interval = 10  # seconds between conntrack reads for per-device bandwidth
+last_stats_refresh = 0.0
+engine_socket = 'network_guardian.sock'  # Engine <-> web worker socket (Unix socket path or loopback host:port)
+engine_token = None  # Shared secret web workers send to the engine (None: not checked)
+engine_server = None  # Set in the engine process by serve_engine()
+engine_client = None  # Set in web workers by create_app()
+fleet_collector = None  # FleetCollector when this instance accepts sensor pushes (--collector)
+fleet_sender = None  # FleetSender when this instance pushes to a collector (--push-to)
+fleet_site = None  # Site name reported to the collector (None: this machine's hostname)
+fleet_token = None  # Shared secret sensors send in X-Fleet-Token (None: not checked)
+fleet_push_interval = 10  # seconds between pushes to the collector
+fleet_batch_size = 2000  # Device records (and traffic samples) per push
+fleet_max_inflight = 4  # Pushes the collector applies at once, the rest get 503 + Retry-After
+
+# Fraction of reverse lookups answered from the cache since startup
+def dns_cache_hit_ratio():
+    lookups = hostname_resolver.hits + hostname_resolver.misses
+    return hostname_resolver.hits / lookups if lookups else 0.0
+
+# Registry size by status, counted when /metrics is scraped
+def devices_by_status():
+    counts = {'up': 0, 'down': 0, 'unknown': 0}
+    for device in devices:
+        counts[device.status] = counts.get(device.status, 0) + 1
+    return counts
+
+metrics.gauge('network_guardian_devices', 'Devices in the registry by status', fn=devices_by_status, label='status')
+metrics.gauge('network_guardian_registry_version', 'Device registry version', fn=lambda: devices.version)
+metrics.gauge('network_guardian_blocked_devices', 'Blocked devices', fn=lambda: len(blocked_devices))
+metrics.gauge('network_guardian_dns_cache_hit_ratio', 'Reverse DNS cache hit ratio', fn=dns_cache_hit_ratio)
+metrics.gauge('network_guardian_dns_cache_entries', 'Cached reverse DNS answers', fn=lambda: len(hostname_resolver.cache))
+metrics.gauge('network_guardian_mac_entries', 'Known IP to MAC mappings', fn=lambda: len(mac_resolver.entries))
+metrics.gauge('network_guardian_service_probe_queue', 'Hosts waiting for service probing', fn=lambda: len(service_prober.queue))
+metrics.gauge('network_guardian_service_probe_cached', 'Devices with a cached service probe result', fn=lambda: len(service_prober.cache))
+metrics.gauge('network_guardian_presence_segments', 'Segment files in the presence event log',
+              fn=lambda: len(presence_log.segments) if presence_log else 0)
 
 # Get hostname of the local machine
 def get_local_hostname():
@@ -33,8 +149,12 @@ def get_local_hostname():
     except:
         return "Unknown"
 
-# Get local machine IP and network details
+# Get local machine IP and network details (cached, see netinfo.py)
 def get_local_network_info():
+    return network_info_provider.get()
+
+# Read local machine IP and network details from the interfaces
+def compute_local_network_info():
     network_info = {}
     try:
         # Get local hostname first - this is the most important part
@@ -52,9 +172,8 @@ def get_local_network_info():
         local_ip = ip_info['addr']
         netmask = ip_info['netmask']
         
-        # Calculate network CIDR
-        netmask_bits = sum([bin(int(x)).count('1') for x in netmask.split('.')])
-        cidr = f"{local_ip.rsplit('.', 1)[0]}.0/{netmask_bits}"
+        # Calculate network CIDR (works for any mask, not just /24)
+        cidr = str(ipaddress.ip_interface(f"{local_ip}/{netmask}").network)
         
         network_info = {
             'local_ip': local_ip,
@@ -65,7 +184,7 @@ def get_local_network_info():
             'hostname': local_hostname
         }
     except Exception as e:
-        print(f"Error getting network info: {e}")
+        log.warning("Error getting network info: %s", e)
         # Fallback to simple method
         hostname = get_local_hostname()
         try:
@@ -82,10 +201,76 @@ def get_local_network_info():
             'hostname': hostname
         }
     
-    # Debug output to console
-    print(f"Local Network Info: {network_info}")
     return network_info
 
+# Interface snapshot, recomputed only when the kernel reports a change
+network_info_provider = NetworkInfoProvider(compute_local_network_info)
+
+# Network details for one configured interface (and subnet, if given)
+def interface_network_info(interface, cidr=None):
+    addresses = netifaces.ifaddresses(interface).get(netifaces.AF_INET, [])
+    if not addresses:
+        raise ValueError(f"Interface {interface} has no IPv4 address")
+    
+    # With a subnet given, use the interface address inside it
+    ip_info = addresses[0]
+    if cidr:
+        network = ipaddress.ip_network(cidr)
+        for address in addresses:
+            if ipaddress.ip_address(address['addr']) in network:
+                ip_info = address
+                break
+    local_ip = ip_info['addr']
+    netmask = ip_info['netmask']
+    
+    gateway_ip = 'Unknown'
+    for gateway in netifaces.gateways().get(netifaces.AF_INET, []):
+        if gateway[1] == interface:
+            gateway_ip = gateway[0]
+            break
+    
+    return {
+        'local_ip': local_ip,
+        'gateway_ip': gateway_ip,
+        'interface': interface,
+        'netmask': netmask,
+        'cidr': cidr or str(ipaddress.ip_interface(f"{local_ip}/{netmask}").network),
+        'hostname': get_local_hostname()
+    }
+
+# interface_network_info() cached until the kernel reports a network change
+def segment_network_info(interface, cidr=None):
+    return network_info_provider.cached((interface, cidr), lambda: interface_network_info(interface, cidr))
+
+# Create a segment for every configured interface/subnet, or one for the
+# default route interface when none are configured
+def build_segments():
+    with segments_lock:
+        if len(segments):
+            return
+        
+        for spec in monitored_segments:
+            try:
+                name, interface, cidr, interval = parse_segment_spec(spec)
+                segments.add(Segment(name, lambda interface=interface, cidr=cidr: segment_network_info(interface, cidr),
+                                     scan_interval=interval))
+            except ValueError as e:
+                log.warning("Skipping segment %s: %s", spec, e)
+        
+        if not len(segments):
+            if monitored_segments:
+                log.warning("No usable segments configured, watching the default route interface")
+            segments.add(Segment(get_local_network_info()['interface'], get_local_network_info))
+
+def primary_segment():
+    if not len(segments):
+        build_segments()
+    return segments.primary
+
+# Segment a device was last seen on (the primary one if unknown)
+def device_segment(device):
+    return segments.get(device.segment) or primary_segment()
+
 # Very simple function to attempt DNS resolution
 def simple_hostname_lookup(ip):
     try:
@@ -96,376 +281,446 @@ def simple_hostname_lookup(ip):
 
 # Improved function to get hostname
 def get_hostname(ip):
-    # Add timeout to prevent long lookups
-    socket.setdefaulttimeout(1)  # Set 1 second timeout for socket operations
+    # Cached, pooled reverse lookup - no process-wide socket timeout needed
+    hostname = hostname_resolver.resolve(ip)
+    return hostname if hostname else "Unknown"
+
+# Build device records for the hosts one discovery shard reported
+def build_device_infos(hosts, local_ip, local_hostname, segment=None):
+    discovered_devices = []
+
+    # Resolve the whole shard at once instead of one lookup per host
+    with stage_seconds.time(stage='dns'):
+        hostnames = hostname_resolver.resolve_many([result['ip'] for result in hosts])
+
+    for result in hosts:
+        host = result['ip']
+        hostname = hostnames.get(host) or "Unknown"
+
+        # If it's the local machine, use the hostname we already know
+        if host == local_ip:
+            hostname = local_hostname
+            log.debug("Local machine detected: %s with hostname %s", host, hostname)
+
+        device_info = {
+            'ip': host,
+            'hostname': hostname,
+            'status': result['status'],
+            'last_seen': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'first_seen': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'mac': result.get('mac', 'Unknown'),
+            'vendor': 'Unknown',
+            'blocked': False,
+            'is_local': (host == local_ip),  # Mark if this is the local machine
+            'segment': segment
+        }
+
+        # Per-device details only at DEBUG level
+        log.debug("Discovered device: %s", device_info)
+
+        # Use the MAC the discovery backend reported, else the neighbor table
+        if device_info['mac'] == 'Unknown':
+            device_info['mac'] = mac_resolver.lookup(host)
+        else:
+            device_info['mac'] = device_info['mac'].lower()
+        device_info['vendor'] = vendor_index.lookup(device_info['mac'])
+
+        # Check if device is in blocked list
+        if device_info['ip'] in blocked_devices or device_info['mac'] in blocked_devices:
+            device_info['blocked'] = True
+
+        discovered_devices.append(device_info)
+    return discovered_devices
+
+# Push a device delta to dashboard subscribers. Unchanged devices that were
+# seen again only get their IP sent, with the shared last_seen timestamp.
+def publish_device_delta(added=(), changed=(), gone=(), seen=()):
+    if not (added or changed or gone or seen):
+        return
     
-    # Try DNS resolution first (simple but effective when it works)
-    try:
-        hostname, _, _ = socket.gethostbyaddr(ip)
-        return hostname
-    except:
-        # If DNS resolution fails, check if it's the local machine
-        my_ip = get_local_network_info()['local_ip']
-        if ip == my_ip:
-            return get_local_hostname()
-        
-        # For non-local machines, just return Unknown without additional lookups
-        return "Unknown"
+    def records(ips):
+        return [device.to_dict() for device in (devices.get(ip) for ip in ips) if device is not None]
+    
+    event_bus.publish('devices', {
+        'added': records(added),
+        'changed': records(changed),
+        'gone': records(gone),
+        'seen': list(seen),
+        'last_seen': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'version': devices.version
+    })
+
+# Pick the discovery backend for the local subnet
+def make_discovery_backend(network_info):
+    if scan_backend == 'arp' and hasattr(socket, 'AF_PACKET'):
+        try:
+            interface = network_info['interface']
+            local_mac = netifaces.ifaddresses(interface)[netifaces.AF_LINK][0]['addr']
+            return ArpScanBackend(interface, network_info['local_ip'], local_mac, rate=arp_scan_rate)
+        except Exception as e:
+            log.warning("ARP scan unavailable (%s), falling back to nmap", e)
+    return NmapBackend()
 
 # Scan network for devices
-def scan_network():
+def scan_network(full=False, segment=None):
     global devices, last_scan_time
     
-    network_info = get_local_network_info()
+    segment = segment or primary_segment()
+    network_info = segment.info()
     cidr = network_info['cidr']
     local_ip = network_info['local_ip']
     local_hostname = network_info['hostname']
+    planner = segment.planner
     
-    print(f"Starting network scan for {cidr}")
-    print(f"Local IP: {local_ip}, Local Hostname: {local_hostname}")
-    
-    nm = nmap.PortScanner()
+    # Between full sweeps only hosts whose re-probe is due are scanned
+    planner.base_interval = segment.scan_interval or scan_interval
+    planner.full_interval = full_scan_interval
+    full = full or scan_mode == 'full' or planner.full_due(cidr)
+    started = time.perf_counter()
+    unprobed = set()  # Handed out by planner.due() and not observed yet
+    if full:
+        targets = None
+        probe_count = ipaddress.ip_network(cidr).num_addresses
+        log.info("Starting full network scan for %s on %s", cidr, segment.name)
+    else:
+        network = ipaddress.ip_network(cidr)
+        due = planner.due()
+        unprobed = set(due)
+        targets = [ip for ip in due if ipaddress.ip_address(ip) in network]
+        if not targets:
+            planner.retry(unprobed)
+            return set()
+        probe_count = len(targets)
+        log.info("Re-probing %d known hosts in %s on %s", len(targets), cidr, segment.name)
+    log.debug("Local IP: %s, Local Hostname: %s", local_ip, local_hostname)
     
     try:
-        # Use more intensive scan to get better device information
-        nm.scan(hosts=cidr, arguments='-sn')  # Ping scan
+        engine = DiscoveryEngine(
+            make_discovery_backend(network_info),
+            max_workers=scan_workers,
+            shard_prefix=scan_shard_prefix,
+            shard_timeout=scan_shard_timeout,
+            timer=lambda: stage_seconds.time(stage='sweep')
+        )
         
-        discovered_devices = []
-        for host in nm.all_hosts():
-            # Try to get hostname with our simplified function
-            hostname = get_hostname(host)
-            
-            # If it's the local machine, use the hostname we already know
-            if host == local_ip:
-                hostname = local_hostname
-                print(f"Local machine detected: {host} with hostname {hostname}")
-            
-            device_info = {
-                'ip': host,
-                'hostname': hostname,
-                'status': nm[host]['status']['state'],
-                'last_seen': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'first_seen': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'mac': 'Unknown',
-                'vendor': 'Unknown',
-                'blocked': False,
-                'is_local': (host == local_ip)  # Mark if this is the local machine
-            }
-            
-            # Print debug for the device
-            print(f"Discovered device: {device_info}")
-            
-            # Try to get MAC address from ARP table
-            try:
-                if os.name == 'posix':  # Linux/Mac
-                    cmd = f"arp -n {host} | grep -v Address | awk '{{print $3}}'"
-                    mac = subprocess.check_output(cmd, shell=True).decode().strip()
-                    if mac and mac != '(incomplete)':
-                        device_info['mac'] = mac
-                elif os.name == 'nt':  # Windows
-                    cmd = f"arp -a {host}"
-                    result = subprocess.check_output(cmd, shell=True).decode()
-                    for line in result.splitlines():
-                        if host in line:
-                            parts = line.split()
-                            if len(parts) >= 2:
-                                mac = parts[1].replace('-', ':')
-                                device_info['mac'] = mac
-            except Exception as e:
-                print(f"Error getting MAC for {host}: {e}")
-            
-            # Check if device is in blocked list
-            if device_info['ip'] in blocked_devices or device_info['mac'] in blocked_devices:
-                device_info['blocked'] = True
-            
-            discovered_devices.append(device_info)
-        
-        # Update existing devices with new information
-        for new_device in discovered_devices:
-            found = False
-            for existing_device in devices:
-                if existing_device['ip'] == new_device['ip']:
-                    existing_device['status'] = new_device['status']
-                    existing_device['last_seen'] = new_device['last_seen']
-                    
-                    # Update hostname if we have a better one
-                    if new_device['hostname'] != 'Unknown':
-                        existing_device['hostname'] = new_device['hostname']
-                    
-                    if new_device['mac'] != 'Unknown':
-                        existing_device['mac'] = new_device['mac']
-                    
-                    # Preserve blocked status
-                    new_device['blocked'] = existing_device['blocked']
-                    
-                    # Mark if this is the local machine
-                    existing_device['is_local'] = new_device['is_local']
-                    
-                    found = True
-                    break
-            
-            if not found:
-                devices.append(new_device)
+        # Merge each shard into the device table as soon as it finishes
+        seen_ips = set()
+        
+        def merge_shard(shard, hosts):
+            # One neighbor table read per shard instead of an arp process per host
+            with stage_seconds.time(stage='mac_lookup'):
+                mac_resolver.refresh()
+            discovered_devices = build_device_infos(hosts, local_ip, local_hostname, segment.name)
+            with stage_seconds.time(stage='merge'):
+                added, changed = devices.merge(discovered_devices)
+            if service_probe_enabled and (added or changed):
+                # Only new and changed hosts; MACs probed within the TTL come from the cache
+                cached = service_prober.submit([(ip, devices.get(ip).mac) for ip in added | changed])
+                if cached:
+                    apply_services(cached)
+            shard_ips = {d['ip'] for d in discovered_devices}
+            seen_ips.update(shard_ips)
+            publish_device_delta(added, changed, seen=shard_ips - added - changed)
+            log.debug("Shard %s finished: %d hosts up", shard_label(shard), len(hosts))
+        
+        if full:
+            _, failed_shards = engine.run(cidr, on_shard=merge_shard)
+            probed = {device.ip for device in devices.in_segment(segment.name)} | seen_ips
+        else:
+            _, failed_shards = engine.run_targets(targets, on_shard=merge_shard)
+            probed = set(targets)
+        
+        # Hosts in a failed shard were not really probed
+        def in_failed_shard(ip):
+            for shard in failed_shards:
+                if ip in shard if isinstance(shard, list) else ipaddress.ip_address(ip) in shard:
+                    return True
+            return False
+        
+        if failed_shards:
+            failed_shards_total.inc(len(failed_shards), segment=segment.name)
+            probed = {ip for ip in probed if not in_failed_shard(ip)}
+        planner.observe_many(probed, seen_ips)
+        unprobed -= probed
+        if full:
+            planner.record_full(cidr)
         
-        # Mark devices not seen in this scan as offline
-        for device in devices:
-            if device['ip'] not in [d['ip'] for d in discovered_devices]:
-                device['status'] = 'down'
+        # Mark probed devices on this segment that did not answer as offline
+        gone = devices.mark_gone(seen_ips, keep=lambda ip: ip not in probed, segment=segment.name)
+        publish_device_delta(gone=gone)
         
-        last_scan_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        last_scan_time = segment.last_scan_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
+        elapsed = time.perf_counter() - started
+        mode = 'full' if full else 'incremental'
+        scan_seconds.observe(elapsed, segment=segment.name, mode=mode)
+        scans_total.inc(segment=segment.name, mode=mode)
+        scan_hosts_per_second.set(probe_count / elapsed if elapsed > 0 else 0.0, segment=segment.name)
+        scan_hosts_up.set(len(seen_ips), segment=segment.name)
+        log.info("%s scan of %s finished in %.1f s: %d hosts up, %d went down",
+                 mode.capitalize(), segment.name, elapsed, len(seen_ips), len(gone))
+        
+        # IPs whose records changed, for persistence
+        return seen_ips | gone
         
     except Exception as e:
-        print(f"Error scanning network: {e}")
+        log.error("Error scanning network: %s", e)
+        return set()
+    finally:
+        # Due hosts that were not probed would otherwise wait for the next full sweep
+        if unprobed:
+            planner.retry(unprobed)
 
 # Get network statistics
+@stage_seconds.timed(stage='stats')
 def get_network_stats():
-    global network_stats, traffic_history
+    global network_stats, stats_version
     
     try:
-        net_io = psutil.net_io_counters()
+        # Rates and counters come from the traffic sampler thread
+        totals = traffic_sampler.totals
+        if totals is None:
+            net_io = psutil.net_io_counters()
+            totals = {
+                'bytes_sent': net_io.bytes_sent,
+                'bytes_recv': net_io.bytes_recv,
+                'packets_sent': net_io.packets_sent,
+                'packets_recv': net_io.packets_recv,
+                'upload_rate': 0,
+                'download_rate': 0
+            }
         
         # Get network info
         network_info = get_local_network_info()
         
-        # Calculate traffic rates (for display purposes)
-        if len(traffic_history['timestamps']) > 0:
-            last_bytes_sent = traffic_history['upload'][-1]
-            last_bytes_recv = traffic_history['download'][-1]
-            last_timestamp = traffic_history['timestamps'][-1]
-            
-            # Calculate time difference in seconds
-            time_diff = (datetime.now() - datetime.strptime(last_timestamp, "%Y-%m-%d %H:%M:%S")).total_seconds()
-            
-            # Calculate rates in bytes per second
-            upload_rate = (net_io.bytes_sent - last_bytes_sent) / time_diff if time_diff > 0 else 0
-            download_rate = (net_io.bytes_recv - last_bytes_recv) / time_diff if time_diff > 0 else 0
-        else:
-            upload_rate = 0
-            download_rate = 0
-        
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         # Get local hostname again to ensure it's current
         local_hostname = get_local_hostname()
         
         stats = {
-            'bytes_sent': net_io.bytes_sent,
-            'bytes_recv': net_io.bytes_recv,
-            'packets_sent': net_io.packets_sent,
-            'packets_recv': net_io.packets_recv,
-            'upload_rate': upload_rate,
-            'download_rate': download_rate,
+            'bytes_sent': totals['bytes_sent'],
+            'bytes_recv': totals['bytes_recv'],
+            'packets_sent': totals['packets_sent'],
+            'packets_recv': totals['packets_recv'],
+            'upload_rate': totals['upload_rate'],
+            'download_rate': totals['download_rate'],
             'local_ip': network_info['local_ip'],
             'gateway_ip': network_info['gateway_ip'],
             'interface': network_info['interface'],
             'hostname': local_hostname,  # Ensure we have current hostname
-            'active_devices': sum(1 for device in devices if device['status'] == 'up'),
-            'blocked_devices': sum(1 for device in devices if device['blocked']),
+            'active_devices': sum(1 for device in devices if device.status == 'up'),
+            'blocked_devices': sum(1 for device in devices if device.blocked),
             'total_devices': len(devices),
             'timestamp': timestamp
         }
         
-        # Debug output
-        print(f"Network stats updated. Local hostname: {local_hostname}")
-        
-        network_stats = stats
+        with stats_lock:
+            stats_version += 1
+            # Web workers take the version with the stats, so ETags agree across workers
+            stats['version'] = stats_version
+            network_stats = stats
+        event_bus.publish('stats', stats)
+            
+    except Exception as e:
+        log.error("Error getting network stats: %s", e)
+
+# Called by the traffic sampler after every sample (totals over all NICs)
+def record_traffic_sample(download_rate, upload_rate, bytes_recv, bytes_sent, timestamp):
+    global last_persisted_sample, last_stats_refresh
+    
+    # Update traffic history (raw samples plus 1m/15m/1h rollups)
+    traffic_store.add_sample(download_rate, upload_rate, bytes_recv, bytes_sent, timestamp=timestamp)
+    event_bus.publish('traffic', {
+        'timestamp': datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S"),
+        'download_rate': download_rate,
+        'upload_rate': upload_rate
+    })
+    
+    if timestamp - last_persisted_sample >= traffic_persist_interval:
+        last_persisted_sample = timestamp
+        if state_store is not None:
+            state_store.queue_sample(timestamp, download_rate, upload_rate, bytes_recv, bytes_sent)
+        if fleet_sender is not None:
+            fleet_sender.queue_sample(timestamp, download_rate, upload_rate, bytes_recv, bytes_sent)
+    
+    # Keep /api/stats rates fresh while a long scan is running
+    if timestamp - last_stats_refresh >= stats_refresh_interval:
+        last_stats_refresh = timestamp
+        get_network_stats()
+        for segment in segments:
+            sample_segment_stats(segment)
+
+# Per-NIC counters sampled every second on their own thread
+traffic_sampler = TrafficSampler(interval=traffic_sample_interval, on_sample=record_traffic_sample)
+
+# Copy per-device byte counts into the registry and push the changes
+def apply_bandwidth(usage):
+    changed = devices.apply_traffic(usage)
+    publish_device_delta(changed=changed)
+
+# Per-device bytes from one batched conntrack read every bandwidth_interval
+bandwidth = BandwidthAccounting(interval=bandwidth_interval, on_update=apply_bandwidth)
+
+# Store open ports found by the service prober, push and persist the changes
+def apply_services(results):
+    changed = devices.apply_services(results)
+    publish_device_delta(changed=changed)
+    save_state(changed)
+
+# Queue joined/left/changed events from the registry for the presence log
+def record_presence(events):
+    if presence_log is not None:
+        presence_log.record(events)
+
+# Second stage after discovery: TCP-connect probes of new and changed hosts
+service_prober = ServiceProber(concurrency=service_probe_concurrency, ttl=service_probe_ttl,
+                               on_results=apply_services, timer=lambda: stage_seconds.time(stage='service_probe'))
+
+# Sample one segment's interface counters into segment.stats
+@stage_seconds.timed(stage='segment_stats')
+def sample_segment_stats(segment):
+    try:
+        network_info = segment.info()
+        counters = traffic_sampler.latest(network_info['interface'])
+        if counters is None:
+            return
         
-        # Update traffic history (keep last 20 points for the chart)
-        traffic_history['timestamps'].append(timestamp)
-        traffic_history['download'].append(net_io.bytes_recv)
-        traffic_history['upload'].append(net_io.bytes_sent)
+        segment_devices = devices.in_segment(segment.name)
+        stats = {
+            'segment': segment.name,
+            'bytes_sent': int(counters['bytes_sent']),
+            'bytes_recv': int(counters['bytes_recv']),
+            'packets_sent': counters['packets_sent'],
+            'packets_recv': counters['packets_recv'],
+            'upload_rate': counters['upload_rate'],
+            'download_rate': counters['download_rate'],
+            'local_ip': network_info['local_ip'],
+            'gateway_ip': network_info['gateway_ip'],
+            'interface': network_info['interface'],
+            'cidr': network_info['cidr'],
+            'hostname': get_local_hostname(),
+            'active_devices': sum(1 for device in segment_devices if device.status == 'up'),
+            'blocked_devices': sum(1 for device in segment_devices if device.blocked),
+            'total_devices': len(segment_devices),
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        with stats_lock:
+            segment.stats = stats
+            segment.stats_version += 1
         
-        # Keep only the last 20 data points
-        if len(traffic_history['timestamps']) > 20:
-            traffic_history['timestamps'] = traffic_history['timestamps'][-20:]
-            traffic_history['download'] = traffic_history['download'][-20:]
-            traffic_history['upload'] = traffic_history['upload'][-20:]
-            
     except Exception as e:
-        print(f"Error getting network stats: {e}")
+        log.error("Error getting stats for segment %s: %s", segment.name, e)
 
 # Function to block a device - Updated for actual blocking
 def block_device(identifier):
     global devices, blocked_devices
     
-    for device in devices:
-        if device['ip'] == identifier or device['mac'] == identifier:
-            # Mark as blocked in our app data
-            device['blocked'] = True
-            if identifier not in blocked_devices:
-                blocked_devices.append(identifier)
-            
-            try:
-                target_ip = device['ip']
-                interface = get_local_network_info()['interface']
-                
-                # Implement actual blocking based on OS
-                if os.name == 'posix':  # Linux
-                    # Check if iptables is available
-                    try:
-                        subprocess.run(['which', 'iptables'], check=True, stdout=subprocess.PIPE)
-                        
-                        # Add rule to block the IP
-                        block_cmd = f"sudo iptables -A INPUT -s {target_ip} -j DROP"
-                        subprocess.run(block_cmd, shell=True, check=True)
-                        
-                        # Add rule to block outgoing connections
-                        block_out_cmd = f"sudo iptables -A OUTPUT -d {target_ip} -j DROP"
-                        subprocess.run(block_out_cmd, shell=True, check=True)
-                        
-                        print(f"Blocked IP {target_ip} using iptables")
-                    except subprocess.CalledProcessError:
-                        # If iptables fails, try using arptables for MAC address blocking
-                        if device['mac'] != 'Unknown':
-                            try:
-                                block_mac_cmd = f"sudo arptables -A INPUT --source-mac {device['mac']} -j DROP"
-                                subprocess.run(block_mac_cmd, shell=True)
-                                print(f"Blocked MAC {device['mac']} using arptables")
-                            except Exception as e:
-                                print(f"Failed to block using arptables: {e}")
-                        else:
-                            print("Failed to block: iptables unavailable and MAC unknown")
-                
-                elif os.name == 'nt':  # Windows
-                    # Use Windows Firewall to block the IP
-                    rule_name = f"Block_{target_ip.replace('.', '_')}"
-                    fw_cmd = f'netsh advfirewall firewall add rule name="{rule_name}" dir=in action=block remoteip={target_ip}'
-                    subprocess.run(fw_cmd, shell=True)
-                    
-                    # Block outgoing connections too
-                    fw_out_cmd = f'netsh advfirewall firewall add rule name="{rule_name}_out" dir=out action=block remoteip={target_ip}'
-                    subprocess.run(fw_out_cmd, shell=True)
-                    
-                    print(f"Blocked IP {target_ip} using Windows Firewall")
-                
-                # Store the blocking method used for later unblocking
-                device['blocking_method'] = 'iptables' if os.name == 'posix' else 'windows_firewall'
-                
-                return True
-                
-            except Exception as e:
-                print(f"Error while blocking device {identifier}: {e}")
-                # Still mark as blocked in our app even if system command failed
-                return True
-    
-    return False
+    device = devices.get(identifier)
+    if device is None:
+        return False
+    
+    # Mark as blocked in our app data. Store the blocking method used for
+    # later unblocking.
+    devices.update(device, blocked=True, blocking_method=firewall.name)
+    with blocked_lock:
+        if identifier not in blocked_devices:
+            blocked_devices = blocked_devices + [identifier]
+        save_blocked_state(device)
+    publish_device_delta(changed=[device.ip])
+    
+    try:
+        # Queued and applied in one batched firewall transaction
+        firewall.block([device.ip])
+        log.info("Blocking IP %s using %s", device.ip, firewall.name)
+        
+    except Exception as e:
+        log.error("Error while blocking device %s: %s", identifier, e)
+        # Still mark as blocked in our app even if system command failed
+    
+    return True
 
 # Function to unblock a device - Updated for actual unblocking
 def unblock_device(identifier):
     global devices, blocked_devices
     
-    for device in devices:
-        if device['ip'] == identifier or device['mac'] == identifier:
-            # Remove from blocked list
-            device['blocked'] = False
-            if identifier in blocked_devices:
-                blocked_devices.remove(identifier)
-            
-            try:
-                target_ip = device['ip']
-                
-                # Implement actual unblocking based on OS
-                if os.name == 'posix':  # Linux
-                    # Try to unblock with iptables
-                    try:
-                        # Remove the blocking rules
-                        unblock_cmd = f"sudo iptables -D INPUT -s {target_ip} -j DROP"
-                        subprocess.run(unblock_cmd, shell=True)
-                        
-                        unblock_out_cmd = f"sudo iptables -D OUTPUT -d {target_ip} -j DROP"
-                        subprocess.run(unblock_out_cmd, shell=True)
-                        
-                        print(f"Unblocked IP {target_ip} using iptables")
-                    except Exception as e1:
-                        print(f"Error unblocking with iptables: {e1}")
-                        
-                        # Try arptables if MAC is known
-                        if device['mac'] != 'Unknown':
-                            try:
-                                unblock_mac_cmd = f"sudo arptables -D INPUT --source-mac {device['mac']} -j DROP"
-                                subprocess.run(unblock_mac_cmd, shell=True)
-                                print(f"Unblocked MAC {device['mac']} using arptables")
-                            except Exception as e2:
-                                print(f"Error unblocking with arptables: {e2}")
-                
-                elif os.name == 'nt':  # Windows
-                    # Use Windows Firewall to unblock the IP
-                    rule_name = f"Block_{target_ip.replace('.', '_')}"
-                    fw_cmd = f'netsh advfirewall firewall delete rule name="{rule_name}"'
-                    subprocess.run(fw_cmd, shell=True)
-                    
-                    # Unblock outgoing connections too
-                    fw_out_cmd = f'netsh advfirewall firewall delete rule name="{rule_name}_out"'
-                    subprocess.run(fw_out_cmd, shell=True)
-                    
-                    print(f"Unblocked IP {target_ip} using Windows Firewall")
-                
-                return True
-                
-            except Exception as e:
-                print(f"Error while unblocking device {identifier}: {e}")
-                # Still mark as unblocked in our app even if system command failed
-                return True
-    
-    return False
+    device = devices.get(identifier)
+    if device is None:
+        return False
+    
+    # Remove from blocked list
+    devices.update(device, blocked=False)
+    with blocked_lock:
+        if identifier in blocked_devices:
+            blocked_devices = [entry for entry in blocked_devices if entry != identifier]
+        save_blocked_state(device)
+    publish_device_delta(changed=[device.ip])
+    
+    try:
+        firewall.unblock([device.ip])
+        log.info("Unblocking IP %s using %s", device.ip, firewall.name)
+        
+    except Exception as e:
+        log.error("Error while unblocking device %s: %s", identifier, e)
+        # Still mark as unblocked in our app even if system command failed
+    
+    return True
 
 # Function to kick (temporarily disconnect) a device - Updated for actual kicking
 def kick_device(identifier):
-    for device in devices:
-        if device['ip'] == identifier or device['mac'] == identifier:
-            # Mark as temporarily disconnected in our app data
-            device['status'] = 'down'
+    device = devices.get(identifier)
+    if device is None:
+        return False
+    
+    try:
+        target_ip = device.ip
+        target_mac = device.mac
+        network_info = device_segment(device).info()
+        gateway_ip = network_info['gateway_ip']
+        interface = network_info['interface']
+        
+        # Implement actual kicking using ARP spoofing
+        if os.name == 'posix':  # Linux
+            # Check if we have arping installed
+            if not shutil.which('arping'):
+                log.warning("arping not found, cannot perform kick operation")
+                return False
             
-            try:
-                target_ip = device['ip']
-                target_mac = device['mac']
-                gateway_ip = get_local_network_info()['gateway_ip']
-                interface = get_local_network_info()['interface']
-                
-                # Implement actual kicking using ARP spoofing
-                if os.name == 'posix':  # Linux
-                    try:
-                        # Check if we have arping installed
-                        subprocess.run(['which', 'arping'], check=True, stdout=subprocess.PIPE)
-                        
-                        # Send fake ARP packets to both the target and the gateway
-                        # To the target: pretend to be the gateway
-                        if target_mac != 'Unknown':
-                            spoof_cmd1 = f"sudo arping -c 5 -U -I {interface} -s {gateway_ip} {target_ip}"
-                            subprocess.Popen(spoof_cmd1, shell=True)
-                            
-                            # To the gateway: pretend to be the target
-                            spoof_cmd2 = f"sudo arping -c 5 -U -I {interface} -s {target_ip} {gateway_ip}"
-                            subprocess.Popen(spoof_cmd2, shell=True)
-                            
-                            print(f"Sent ARP spoofing packets to kick {target_ip}")
-                            
-                            # Block the device temporarily
-                            block_device(identifier)
-                            # Schedule unblocking after 10 seconds
-                            threading.Timer(10.0, lambda: unblock_device(identifier)).start()
-                            
-                            return True
-                        else:
-                            print(f"Cannot kick: MAC address unknown for {target_ip}")
-                            return False
-                    except subprocess.CalledProcessError:
-                        print("arping not found, cannot perform kick operation")
-                        return False
-                
-                elif os.name == 'nt':  # Windows
-                    # On Windows, we'll temporarily block and then unblock after a short time
-                    block_device(identifier)
-                    # Schedule unblocking after 10 seconds
-                    threading.Timer(10.0, lambda: unblock_device(identifier)).start()
-                    print(f"Kicked {target_ip} by temporarily blocking")
-                    return True
-                
-            except Exception as e:
-                print(f"Error while kicking device {identifier}: {e}")
+            if target_mac == 'Unknown':
+                log.warning("Cannot kick: MAC address unknown for %s", target_ip)
                 return False
-    
-    return False
+            
+            sudo = ['sudo', '-n'] if os.geteuid() != 0 else []
+            
+            # Send fake ARP packets to both the target and the gateway, on the
+            # bounded kick pool (repeated kicks of the same device are coalesced)
+            kick_scheduler.submit(target_ip, [
+                # To the target: pretend to be the gateway
+                sudo + ['arping', '-c', '5', '-U', '-I', interface, '-s', gateway_ip, target_ip],
+                # To the gateway: pretend to be the target
+                sudo + ['arping', '-c', '5', '-U', '-I', interface, '-s', target_ip, gateway_ip]
+            ])
+            log.info("Queued ARP spoofing packets to kick %s", target_ip)
+        
+        elif os.name != 'nt':
+            return False
+        
+        # Mark as temporarily disconnected in our app data
+        devices.update(device, status='down')
+        publish_device_delta(changed=[device.ip])
+        
+        # Block the device temporarily and unblock it after 10 seconds. A device
+        # that was already blocked by the user stays blocked.
+        if not device.blocked or kick_scheduler.cancel(target_ip):
+            block_device(target_ip)
+            kick_scheduler.schedule(target_ip, kick_duration)
+        
+        log.info("Kicked %s for %s seconds", target_ip, kick_duration)
+        return True
+        
+    except Exception as e:
+        log.error("Error while kicking device %s: %s", identifier, e)
+        return False
 
 # New function to get and display system information
 @app.route('/api/system-info')
@@ -494,37 +749,358 @@ def get_system_info():
     
     return jsonify(system_info)
 
-# Background task to periodically scan network and update stats
-def background_task():
+# Load the last known device table and blocked list from disk (fast, no scan)
+def load_state():
+    global state_store, blocked_devices, presence_log
+    try:
+        presence_log = PresenceLog(presence_path, max_bytes=presence_max_bytes, max_age=presence_max_age)
+    except Exception as e:
+        log.error("Error opening presence log: %s", e)
+        presence_log = None
+    try:
+        state_store = StateStore(database_path)
+        with blocked_lock:
+            saved = [identifier for identifier in state_store.load_blocked() if identifier not in blocked_devices]
+            blocked_devices = blocked_devices + saved
+        devices.load(state_store.load_devices())
+        log.info("Loaded %d devices from %s", len(devices), database_path)
+        
+        # Re-apply saved blocks (e.g. after a reboot) in a single transaction
+        firewall.reconcile(device.ip for device in devices if device.blocked)
+    except Exception as e:
+        log.error("Error loading saved state: %s", e)
+        state_store = None
+
+# Replay saved traffic history into the in-memory store
+def restore_traffic_history():
+    if state_store is None:
+        return
+    try:
+        for timestamp, download_rate, upload_rate, bytes_recv, bytes_sent in state_store.load_traffic(time.time() - 7 * 86400):
+            traffic_store.add_sample(download_rate, upload_rate, bytes_recv, bytes_sent, timestamp=timestamp)
+    except Exception as e:
+        log.error("Error restoring traffic history: %s", e)
+
+# Write changed devices, queued traffic samples and presence events in one batch
+def save_state(ips=None):
+    if presence_log is not None:
+        try:
+            presence_log.flush()
+        except Exception as e:
+            log.error("Error writing presence events: %s", e)
+    if state_store is None:
+        return
+    try:
+        if ips:
+            records = (devices.get(ip) for ip in ips)
+            state_store.save_devices([device.to_dict() for device in records if device is not None])
+        state_store.flush()
+    except Exception as e:
+        log.error("Error saving state: %s", e)
+
+# Persist a device's blocked flag together with the blocked list
+def save_blocked_state(device):
+    if state_store is None:
+        return
+    try:
+        state_store.save_devices([device.to_dict()])
+        state_store.save_blocked(blocked_devices)
+    except Exception as e:
+        log.error("Error saving blocked devices: %s", e)
+
+# Scan one segment, sample stats and persist the results. The primary
+# segment also samples the host-wide stats behind the traffic chart.
+def scan_and_save(full=False, segment=None):
+    segment = segment or primary_segment()
+    changed_ips = scan_network(full, segment)
+    sample_segment_stats(segment)
+    if segment is primary_segment():
+        get_network_stats()
+    save_state(changed_ips)
+
+# Background task to periodically scan one segment and update its stats
+def background_task(segment):
     while True:
         try:
-            scan_network()
-            get_network_stats()
+            # Runs on the shared pool; joins a scan of this segment that is already running
+            future, _ = scan_flight.submit(segment.name, scan_and_save, segment=segment)
+            future.result()
         except Exception as e:
-            print(f"Error in background task: {e}")
-        time.sleep(scan_interval)
+            log.error("Error in background task for %s: %s", segment.name, e)
+        time.sleep(segment.scan_interval or scan_interval)
 
-# Function to initialize the background task
+# Function to initialize the background tasks, one per segment
 def initialize():
-    thread = threading.Thread(target=background_task)
-    thread.daemon = True
-    thread.start()
+    network_info_provider.start()
+    
+    # Replay history before the sampler starts appending newer samples
+    restore_traffic_history()
+    traffic_sampler.start()
+    bandwidth.start()
+    build_segments()
+    
+    for segment in segments:
+        segment.thread = threading.Thread(target=background_task, args=(segment,), name=f"scan-{segment.name}")
+        segment.thread.daemon = True
+        segment.thread.start()
+        log.info("Watching segment %s", segment.name)
+
+# Push this instance's devices, traffic and stats to a fleet collector
+def start_fleet_sender(url):
+    global fleet_sender
+    fleet_sender = FleetSender(url, fleet_site or get_local_hostname(), devices, stats=lambda: network_stats,
+                               token=fleet_token, interval=fleet_push_interval, batch_size=fleet_batch_size)
+    fleet_sender.start()
+    log.info("Pushing to fleet collector %s as site %s", url, fleet_sender.site)
+
+# Accept pushes from fleet sensors on /api/fleet/push
+def start_fleet_collector():
+    global fleet_collector
+    fleet_collector = FleetCollector(max_inflight=fleet_max_inflight, stale_after=3 * fleet_push_interval)
+    log.info("Collecting fleet pushes on /api/fleet/push")
+
+# Engine state for a web worker that (re)connects
+def engine_snapshot():
+    with devices.lock:
+        version = devices.version
+        records = devices.snapshot()
+    with stats_lock:
+        stats = network_stats
+    return {'version': version, 'devices': records, 'stats': stats, 'epoch': etag_epoch}
+
+# Device records changed after a web worker's version
+def engine_devices_since(version):
+    with devices.lock:
+        changed, removed = devices.changed_since(version)
+        return {'version': devices.version, 'changed': changed, 'removed': removed}
+
+# Run a request forwarded by a web worker through this process's routes
+def engine_http(method, path, body, content_type, headers=None):
+    # Bodies travel as latin-1 text so binary (gzipped) bodies survive the JSON channel
+    response = app.test_client().open(path, method=method, data=body.encode('latin-1'),
+                                      content_type=content_type, headers=headers)
+    reply_headers = {name: response.headers[name] for name in FORWARDED_HEADERS if name in response.headers}
+    return [response.status_code, response.content_type, response.get_data(as_text=True), reply_headers]
+
+# Serve this process's state to web workers (python app.py --engine)
+def serve_engine():
+    global engine_server
+    engine_server = EngineServer(engine_socket, event_bus, engine_snapshot, {
+        'devices_since': engine_devices_since,
+        'http': engine_http
+    }, token=engine_token)
+    engine_server.start()
+    log.info("Engine listening on %s", engine_socket)
+
+# Web worker: replace the mirrored state with a full engine snapshot
+def apply_engine_snapshot(snapshot):
+    global network_stats, stats_version, etag_epoch
+    devices.sync(snapshot['devices'], version=snapshot['version'], reset=True)
+    etag_epoch = snapshot['epoch']
+    with stats_lock:
+        network_stats = snapshot['stats']
+        stats_version = network_stats.get('version', 0)
+    # Versions restart with the engine, don't serve bodies cached before
+    response_cache.clear()
+    # Dashboards on this worker may have missed changes, make them reload
+    event_bus.publish('reset', {'version': snapshot['version']})
+
+# Web worker: apply an engine event, then pass it on to this worker's dashboards
+def apply_engine_event(event_type, data):
+    global network_stats, stats_version
+    if event_type == 'devices' and data.get('version', 0) > devices.version:
+        # Pull every record changed since our version, not just the ones in the event
+        delta = engine_client.call('devices_since', devices.version)
+        devices.sync(delta['changed'], delta['removed'], version=delta['version'])
+    elif event_type == 'stats':
+        with stats_lock:
+            network_stats = data
+            stats_version = data.get('version', 0)
+    event_bus.publish(event_type, data)
+
+# App factory for production servers, e.g. gunicorn -k gthread 'app:create_app()'.
+# Web workers don't scan or sample: they mirror the engine process started
+# with `python app.py --engine` over its socket and forward writes to it.
+def create_app(socket_path=None, wait=5.0):
+    global engine_client
+    setup_logging(log_level, log_rate_limit)
+    if engine_client is None:
+        engine_client = EngineClient(socket_path or engine_socket, token=engine_token)
+        engine_client.follow(apply_engine_snapshot, apply_engine_event)
+        # Start with the engine's devices when it is up, don't hang when it isn't
+        engine_client.ready.wait(wait)
+    return app
+
+# Request/response headers passed between web workers and the engine
+FORWARDED_HEADERS = ('Content-Encoding', 'X-Fleet-Token', 'Retry-After')
+
+# Endpoints a web worker answers from its mirrored state
+WORKER_LOCAL_ENDPOINTS = {
+    'index', 'static', 'get_devices_api', 'stream_events', 'get_stats_api',
+    'get_hostname_api', 'get_system_info'
+}
+
+# In a web worker, hand everything else (scans, blocking, settings, history)
+# to the engine process
+@app.before_request
+def forward_to_engine():
+    if engine_client is None or request.endpoint is None:
+        return None
+    # Per-segment views need the engine's segment table
+    if request.endpoint in WORKER_LOCAL_ENDPOINTS and 'segment' not in request.args:
+        return None
+    try:
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+        status, content_type, body, reply_headers = engine_client.call(
+            'http', request.method, request.full_path, request.get_data().decode('latin-1'),
+            request.content_type, headers)
+    except (OSError, ValueError, EngineError) as e:
+        return jsonify({"status": "error", "message": f"Engine unavailable: {e}"}), 503
+    return Response(body, status=status, content_type=content_type, headers=reply_headers)
 
 # Routes
 @app.route('/')
 def index():
     return render_template('index.html')
 
+# Segment named by ?segment=, or (None, error response) for an unknown one
+def requested_segment():
+    name = request.args.get('segment')
+    if name is None:
+        return None, None
+    segment = segments.get(name)
+    if segment is None:
+        return None, (jsonify({"status": "error", "message": f"Unknown segment {name}"}), 404)
+    return segment, None
+
+# Query arguments that switch /api/devices to paged mode
+DEVICE_PAGE_ARGS = {'limit', 'cursor', 'sort', 'order', 'status', 'blocked', 'q'}
+
+# One page of devices from the registry's sort indexes (see get_devices_api)
+def devices_page(segment_name, version, headers):
+    args = request.args
+    sort = args.get('sort', 'ip')
+    order = args.get('order', 'asc')
+    if sort not in SORT_FIELDS or order not in ('asc', 'desc'):
+        return jsonify({"status": "error", "message": f"Invalid sort, expected one of {', '.join(SORT_FIELDS)} "
+                                                      "with order asc or desc"}), 400
+    try:
+        limit = min(max(int(args.get('limit', 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid limit"}), 400
+    blocked = args.get('blocked')
+    if blocked not in (None, 'true', 'false'):
+        return jsonify({"status": "error", "message": "Invalid blocked, expected true or false"}), 400
+    status = args.get('status')
+    prefix = args.get('q', '').strip().lower()
+    
+    def build_page():
+        records, cursor, total = devices.page(
+            sort, order == 'desc', args.get('cursor') or None, limit,
+            frozenset(status.split(',')) if status else None, segment_name,
+            None if blocked is None else blocked == 'true', prefix or None)
+        return {'version': version, 'total': total, 'next_cursor': cursor, 'devices': records}
+    
+    # Same query on the same version, same page (crc32 so every worker agrees)
+    return conditional_json('devices-page', f"devices-page-{etag_epoch}-{version}-{zlib.crc32(request.query_string)}",
+                            build_page, cacheable=False, headers=headers)
+
 @app.route('/api/devices')
 def get_devices_api():
-    return jsonify(devices)
+    segment, error = requested_segment()
+    if error:
+        return error
+    version = devices.version
+    headers = {'X-Devices-Version': str(version)}
+    segment_name = segment.name if segment else None
+    
+    # Delta mode: only the records changed after the given version
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({"status": "error", "message": "Invalid since version"}), 400
+        
+        def build_delta():
+            if since > version:
+                # A version from before a restart: the client must reload everything
+                return {'version': version, 'since': since, 'reset': True, 'changed': [], 'removed': []}
+            changed, removed = devices.changed_since(since, segment_name)
+            return {'version': version, 'since': since, 'reset': False, 'changed': changed, 'removed': removed}
+        
+        return conditional_json('devices-delta', f"devices-{etag_epoch}-{segment_name}-{version}-since-{since}",
+                                build_delta, cacheable=False, headers=headers)
+    
+    # Paged mode: ?limit= (default 100, at most 1000), ?cursor= from the
+    # previous page, ?sort=ip|hostname|last_seen|status, ?order=asc|desc,
+    # ?status=up,down, ?blocked=true|false and ?q= (hostname, IP or MAC prefix)
+    if DEVICE_PAGE_ARGS & request.args.keys():
+        return devices_page(segment_name, version, headers)
+    
+    if segment is not None:
+        # Only this segment's records are read, and its ETag only moves when they change
+        return conditional_json(f"devices-{segment_name}", f"devices-{etag_epoch}-{segment_name}-{devices.segment_version(segment_name)}",
+                                lambda: devices.to_list(segment_name), headers=headers)
+    
+    return conditional_json('devices', f"devices-{etag_epoch}-{version}", devices.snapshot, headers=headers)
+
+@app.route('/api/events')
+def stream_events():
+    # Server-Sent Events: the browser resumes with Last-Event-ID on reconnect
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        last_id = int(last_id)
+    except (TypeError, ValueError):
+        last_id = None
+    
+    def generate():
+        seq = last_id
+        if seq is None:
+            # Fresh subscriber: tell it where the stream starts
+            seq = event_bus.seq
+            yield format_sse(seq, 'hello', json.dumps({'seq': seq}))
+        
+        while True:
+            events, complete = event_bus.wait(seq, timeout=15)
+            if not complete:
+                # Missed events were dropped, the client must reload everything
+                seq = event_bus.seq
+                yield format_sse(seq, 'reset', json.dumps({'seq': seq}))
+                continue
+            if not events:
+                yield ': keepalive\n\n'
+                continue
+            for event_seq, event_type, payload in events:
+                yield format_sse(event_seq, event_type, payload)
+                seq = event_seq
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @app.route('/api/stats')
 def get_stats_api():
-    # Include hostname directly in the response 
-    stats = network_stats.copy()
-    stats['hostname'] = get_local_hostname()  # Ensure it's current
-    return jsonify(stats)
+    segment, error = requested_segment()
+    if error:
+        return error
+    if segment is not None:
+        return conditional_json(f"stats-{segment.name}", f"stats-{etag_epoch}-{segment.name}-{segment.stats_version}",
+                                lambda: segment.stats)
+    
+    def build_stats():
+        # Include hostname directly in the response 
+        stats = network_stats.copy()
+        stats['hostname'] = get_local_hostname()  # Ensure it's current
+        return stats
+    
+    return conditional_json('stats', f"stats-{etag_epoch}-{stats_version}", build_stats)
+
+@app.route('/metrics')
+def metrics_api():
+    # Prometheus text format; in web workers this is forwarded to the engine
+    return Response(metrics.render(), content_type=metrics.content_type)
 
 @app.route('/api/hostname')
 def get_hostname_api():
@@ -533,18 +1109,191 @@ def get_hostname_api():
 
 @app.route('/api/traffic-history')
 def get_traffic_history():
-    return jsonify(traffic_history)
+    # Without a range, return the last 20 raw samples like before
+    range_name = request.args.get('range')
+    if range_name is not None and range_name not in TRAFFIC_RANGES:
+        return jsonify({"status": "error", "message": f"Invalid range {range_name}"}), 400
+    return jsonify(traffic_store.query(range_name))
+
+@app.route('/api/bandwidth')
+def get_bandwidth():
+    # Top talkers over ?window= seconds, or ?ip= for one device's recent samples
+    if not bandwidth.available:
+        return jsonify({"status": "error", "message": "Connection tracking is not available"}), 503
+    
+    ip = request.args.get('ip')
+    if ip:
+        history = bandwidth.history(ip)
+        history['ip'] = ip
+        return jsonify(history)
+    
+    try:
+        top = min(max(int(request.args.get('top', 10)), 1), 1000)
+        window = max(int(request.args.get('window', 300)), bandwidth.interval)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid top or window"}), 400
+    
+    talkers = bandwidth.top(top, window)
+    for talker in talkers:
+        device = devices.get(talker['ip'])
+        talker['hostname'] = device.hostname if device else 'Unknown'
+        talker['mac'] = device.mac if device else 'Unknown'
+    return jsonify({'window': min(window, bandwidth.window), 'interval': bandwidth.interval, 'devices': talkers})
+
+@app.route('/api/presence')
+def presence_api():
+    # Presence events newest first: ?device=<ip|mac>, ?since=/?until= (Unix
+    # seconds, default the last 24 hours), ?type=joined,left and ?limit=
+    if presence_log is None:
+        return jsonify({"status": "error", "message": "Presence log is not available"}), 503
+    types = request.args.get('type')
+    types = set(types.split(',')) if types else None
+    if types and not types <= set(PRESENCE_EVENT_TYPES):
+        return jsonify({"status": "error", "message": f"Invalid type, expected {', '.join(PRESENCE_EVENT_TYPES)}"}), 400
+    try:
+        until = float(request.args['until']) if 'until' in request.args else time.time()
+        since = float(request.args['since']) if 'since' in request.args else until - 86400
+        limit = min(max(int(request.args.get('limit', 1000)), 1), 10000)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid since, until or limit"}), 400
+    device = request.args.get('device')
+    events = presence_log.query(device, since, until, types, limit)
+    return jsonify({'device': device, 'since': since, 'until': until, 'events': events})
+
+@app.route('/api/presence/flapping')
+def presence_flapping_api():
+    # Devices that joined or left at least ?min= times since ?since= (default
+    # the last 24 hours)
+    if presence_log is None:
+        return jsonify({"status": "error", "message": "Presence log is not available"}), 503
+    try:
+        min_count = max(int(request.args.get('min', 4)), 1)
+        until = float(request.args['until']) if 'until' in request.args else time.time()
+        since = float(request.args['since']) if 'since' in request.args else until - 86400
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid min, since or until"}), 400
+    flapping = presence_log.flapping(min_count, since, until)
+    for item in flapping:
+        device = devices.get(item['device'])
+        item['ip'] = device.ip if device else None
+        item['hostname'] = device.hostname if device else 'Unknown'
+    return jsonify({'since': since, 'until': until, 'min': min_count, 'devices': flapping})
+
+@app.route('/api/interface-traffic')
+def get_interface_traffic():
+    # Latest 1 s sample of every NIC, or ?interface= for that NIC's recent samples
+    name = request.args.get('interface')
+    if name is None:
+        return jsonify({nic: traffic_sampler.latest(nic) for nic in traffic_sampler.interfaces()})
+    
+    try:
+        points = min(max(int(request.args.get('points', 60)), 1), traffic_sampler.capacity)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid points"}), 400
+    history = traffic_sampler.history(name, points)
+    if history is None:
+        return jsonify({"status": "error", "message": f"Unknown interface {name}"}), 404
+    history['interface'] = name
+    return jsonify(history)
 
 @app.route('/api/scan')
 def trigger_scan():
-    threading.Thread(target=scan_network).start()
-    threading.Thread(target=get_network_stats).start()
+    segment, error = requested_segment()
+    if error:
+        return error
+    
+    # Always a full sweep, whatever the rescan schedule says. Requests for a
+    # segment that is already being scanned join that scan instead.
+    joined = []
+    for target in ([segment] if segment else segments):
+        _, was_running = scan_flight.submit(target.name, scan_and_save, full=True, segment=target)
+        if was_running:
+            # The running scan may be incremental, make the next one full
+            target.planner.request_full()
+            joined.append(target.name)
     return jsonify({
-        "status": "Scan initiated", 
+        "status": "Scan initiated",
+        "joined": joined,  # Segments whose running scan was joined
         "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "hostname": get_local_hostname()  # Include hostname in the response
     })
 
+@app.route('/api/scan-status')
+def scan_status():
+    segment, error = requested_segment()
+    if error:
+        return error
+    segment = segment or primary_segment()
+    status = segment.planner.stats()
+    status['segment'] = segment.name
+    status['scan_mode'] = scan_mode
+    status['last_scan_time'] = segment.last_scan_time
+    status['scan_running'] = scan_flight.running(segment.name)
+    status['service_probe'] = dict(service_prober.stats(), enabled=service_probe_enabled)
+    ip = request.args.get('ip')
+    if ip:
+        status['host'] = segment.planner.get(ip)
+    return jsonify(status)
+
+@app.route('/api/fleet/push', methods=['POST'])
+def fleet_push_api():
+    # Gzipped JSON batch from a sensor (see fleet.FleetSender)
+    if fleet_collector is None:
+        return jsonify({"status": "error", "message": "Not a fleet collector"}), 404
+    status, body, headers = fleet_collector.handle_push(
+        request.get_data(), request.headers.get('Content-Encoding'),
+        request.headers.get('X-Fleet-Token'), fleet_token)
+    return jsonify(body), status, headers
+
+@app.route('/api/fleet/devices')
+def fleet_devices_api():
+    # Devices of every site, ordered by site and IP, one page at a time:
+    # ?limit= (default 500), ?cursor= from the previous page, ?site=, ?status=
+    if fleet_collector is None:
+        return jsonify({"status": "error", "message": "Not a fleet collector"}), 404
+    try:
+        limit = min(max(int(request.args.get('limit', 500)), 1), 5000)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid limit"}), 400
+    items, cursor = fleet_collector.page(request.args.get('cursor'), limit,
+                                         request.args.get('site'), request.args.get('status'))
+    return jsonify({'devices': items, 'next_cursor': cursor})
+
+@app.route('/api/fleet/stats')
+def fleet_stats_api():
+    # Per-site and fleet-wide counts and rates on a collector, push status on a sensor
+    if fleet_collector is None and fleet_sender is None:
+        return jsonify({"status": "error", "message": "Fleet mode is off"}), 404
+    summary = fleet_collector.summary() if fleet_collector is not None else {}
+    if fleet_sender is not None:
+        summary['sender'] = fleet_sender.stats()
+    return jsonify(summary)
+
+@app.route('/api/fleet/traffic')
+def fleet_traffic_api():
+    # One site's traffic history: ?site=<name>&range=1h|6h|24h|7d
+    if fleet_collector is None:
+        return jsonify({"status": "error", "message": "Not a fleet collector"}), 404
+    name = request.args.get('site')
+    if name not in fleet_collector.sites:
+        return jsonify({"status": "error", "message": f"Unknown site {name}"}), 404
+    range_name = request.args.get('range')
+    if range_name is not None and range_name not in TRAFFIC_RANGES:
+        return jsonify({"status": "error", "message": f"Invalid range {range_name}"}), 400
+    return jsonify(fleet_collector.sites[name].traffic.query(range_name))
+
+@app.route('/api/segments')
+def segments_api():
+    result = []
+    for segment in segments:
+        try:
+            info = segment.describe()
+        except Exception as e:
+            info = {'name': segment.name, 'error': str(e)}
+        info['total_devices'] = len(devices.in_segment(segment.name))
+        result.append(info)
+    return jsonify(result)
+
 @app.route('/api/block-device', methods=['POST'])
 def block_device_api():
     data = request.get_json()
@@ -584,11 +1333,64 @@ def kick_device_api():
     else:
         return jsonify({"status": "error", "message": f"Device {identifier} not found"}), 404
 
+@app.route('/api/kick-queue')
+def kick_queue_api():
+    return jsonify(kick_scheduler.stats())
+
 @app.route('/api/update-settings', methods=['POST'])
 def update_settings():
-    global scan_interval
+    global scan_interval, scan_workers, scan_shard_timeout, scan_backend, arp_scan_rate
+    global scan_mode, full_scan_interval, service_probe_enabled
     data = request.get_json()
     new_interval = data.get('scan_interval')
+    new_workers = data.get('scan_workers')
+    new_shard_timeout = data.get('scan_shard_timeout')
+    new_backend = data.get('scan_backend')
+    new_rate = data.get('arp_scan_rate')
+    new_mode = data.get('scan_mode')
+    new_full_interval = data.get('full_scan_interval')
+    new_service_probe = data.get('service_probe_enabled')
+    scan_settings = (new_workers, new_shard_timeout, new_backend, new_rate, new_mode, new_full_interval,
+                     new_service_probe)
+    
+    # Discovery settings are optional
+    if new_workers is not None:
+        if not isinstance(new_workers, int) or not 1 <= new_workers <= 64:
+            return jsonify({"status": "error", "message": "Invalid scan workers"}), 400
+        scan_workers = new_workers
+    
+    if new_shard_timeout is not None:
+        if not isinstance(new_shard_timeout, int) or new_shard_timeout < 5:
+            return jsonify({"status": "error", "message": "Invalid shard timeout"}), 400
+        scan_shard_timeout = new_shard_timeout
+    
+    if new_backend is not None:
+        if new_backend not in ('nmap', 'arp'):
+            return jsonify({"status": "error", "message": "Invalid scan backend"}), 400
+        scan_backend = new_backend
+    
+    if new_rate is not None:
+        if not isinstance(new_rate, int) or not 10 <= new_rate <= 100000:
+            return jsonify({"status": "error", "message": "Invalid ARP scan rate"}), 400
+        arp_scan_rate = new_rate
+    
+    if new_mode is not None:
+        if new_mode not in ('incremental', 'full'):
+            return jsonify({"status": "error", "message": "Invalid scan mode"}), 400
+        scan_mode = new_mode
+    
+    if new_full_interval is not None:
+        if not isinstance(new_full_interval, int) or new_full_interval < 60:
+            return jsonify({"status": "error", "message": "Invalid full scan interval"}), 400
+        full_scan_interval = new_full_interval
+    
+    if new_service_probe is not None:
+        if not isinstance(new_service_probe, bool):
+            return jsonify({"status": "error", "message": "Invalid service probe setting"}), 400
+        service_probe_enabled = new_service_probe
+    
+    if new_interval is None and any(setting is not None for setting in scan_settings):
+        return jsonify({"status": "success", "message": "Scan settings updated"})
     
     if new_interval and isinstance(new_interval, int) and new_interval >= 30:
         scan_interval = new_interval
@@ -597,16 +1399,50 @@ def update_settings():
         return jsonify({"status": "error", "message": "Invalid scan interval"}), 400
 
 if __name__ == '__main__':
-    # Print initial hostname for debugging
-    hostname = get_local_hostname()
-    print(f"Starting application with hostname: {hostname}")
+    parser = argparse.ArgumentParser(description='Network Guardian')
+    parser.add_argument('--engine', action='store_true', help='Run the engine only, for web workers from create_app()')
+    parser.add_argument('--port', type=int, default=5000, help='HTTP port (default 5000)')
+    parser.add_argument('--data-dir', help='Directory for the database, presence log and engine socket')
+    parser.add_argument('--collector', action='store_true', help='Accept pushes from fleet sensors')
+    parser.add_argument('--push-to', metavar='URL', help='Push devices and traffic to a fleet collector')
+    parser.add_argument('--site', help='Site name reported to the collector (default: hostname)')
+    args = parser.parse_args()
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        database_path = os.path.join(args.data_dir, database_path)
+        presence_path = os.path.join(args.data_dir, presence_path)
+        engine_socket = os.path.join(args.data_dir, engine_socket)
+    fleet_site = args.site or fleet_site
+    
+    setup_logging(log_level, log_rate_limit)
     
-    # Initial scan
-    scan_network()
-    get_network_stats()
+    # Log initial hostname for debugging
+    hostname = get_local_hostname()
+    log.info("Starting application with hostname: %s", hostname)
     
-    # Start the background task before running the app
-    initialize()
+    # The debug reloader also runs this in its file watcher process. Only the
+    # serving process loads state, scans, persists and pushes: two would
+    # write the same database and presence log and keep resyncing the site.
+    debug = True
+    serving = args.engine or not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    if serving:
+        # Serve the last known devices right away, the background task rescans
+        load_state()
+        
+        # Start the background task before running the app
+        initialize()
+        if args.collector:
+            start_fleet_collector()
+        if args.push_to:
+            start_fleet_sender(args.push_to)
     
-    # Run Flask app
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    if args.engine:
+        # Engine only: web workers from create_app() serve the HTTP side
+        serve_engine()
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            engine_server.stop()
+    else:
+        # Run Flask app (development server, engine in the same process)
+        app.run(host='0.0.0.0', port=args.port, debug=debug)
\ No newline at end of file
@@ -0,0 +1,136 @@
+import ipaddress
+import socket
+import struct
+import threading
+import time
+
+ETH_P_ARP = 0x0806
+ARP_REQUEST = 1
+ARP_REPLY = 2
+BROADCAST_MAC = b'\xff' * 6
+SEND_BACKOFF = 0.001  # Seconds to wait when the socket's transmit queue is full
+
+
+class ArpScanError(Exception):
+    pass
+
+
+def mac_to_bytes(mac):
+    return bytes(int(part, 16) for part in mac.split(':'))
+
+
+def bytes_to_mac(data):
+    return ':'.join(f"{b:02x}" for b in data)
+
+
+# Ethernet frame carrying an ARP who-has for target_ip
+def build_arp_request(src_mac, src_ip, target_ip):
+    ethernet = BROADCAST_MAC + src_mac + struct.pack('!H', ETH_P_ARP)
+    arp = struct.pack(
+        '!HHBBH6s4s6s4s',
+        1, 0x0800, 6, 4, ARP_REQUEST,
+        src_mac, socket.inet_aton(src_ip),
+        b'\x00' * 6, socket.inet_aton(target_ip)
+    )
+    return ethernet + arp
+
+
+# (ip, mac) of the sender if frame is an ARP reply, otherwise None
+def parse_arp_reply(frame):
+    if len(frame) < 42 or frame[12:14] != b'\x08\x06':
+        return None
+    opcode = struct.unpack('!H', frame[20:22])[0]
+    if opcode != ARP_REPLY:
+        return None
+    return socket.inet_ntoa(frame[28:32]), bytes_to_mac(frame[22:28])
+
+
+def open_packet_socket(interface):
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+    sock.bind((interface, ETH_P_ARP))
+    return sock
+
+
+# Discovery backend that ARPs every address itself over an AF_PACKET socket.
+# Requests are paced to `rate` packets per second across all shards, replies
+# are matched while sending, and each result carries the MAC directly.
+# Only works for the directly attached subnet and needs CAP_NET_RAW. A sweep
+# that runs out of time raises ArpScanError like an nmap timeout, so the
+# addresses it never asked count as a failed shard, not as gone.
+class ArpScanBackend:
+    def __init__(self, interface, local_ip, local_mac, rate=500, reply_wait=1.0,
+                 socket_factory=open_packet_socket):
+        self.interface = interface
+        self.local_ip = local_ip
+        self.local_mac = local_mac.lower()
+        self.src_mac = mac_to_bytes(local_mac)
+        self.rate = rate
+        self.reply_wait = reply_wait
+        self.socket_factory = socket_factory
+        self.pace_lock = threading.Lock()
+        self.next_send = 0.0
+
+    # Reserve the next send slot shared by all concurrent sweeps
+    def _pace(self):
+        with self.pace_lock:
+            now = time.monotonic()
+            slot = max(now, self.next_send)
+            self.next_send = slot + 1.0 / self.rate
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _drain(self, sock, targets, found):
+        while True:
+            try:
+                frame = sock.recv(65535)
+            except (BlockingIOError, socket.timeout):
+                return
+            reply = parse_arp_reply(frame)
+            if reply and reply[0] in targets and reply[0] not in found:
+                found[reply[0]] = reply[1]
+
+    # Send a frame, backing off while the transmit queue is full
+    def _send(self, sock, frame, deadline, targets, found):
+        while True:
+            if deadline and time.monotonic() > deadline:
+                raise ArpScanError("ARP sweep timed out before every address was asked")
+            try:
+                sock.send(frame)
+                return
+            except BlockingIOError:
+                self._drain(sock, targets, found)
+                time.sleep(SEND_BACKOFF)
+
+    # Sweep a CIDR or a list of IPs
+    def sweep(self, hosts, timeout=0):
+        if isinstance(hosts, str):
+            # Every address in the shard: a shard's .0/.255 can be real hosts in
+            # the parent subnet, and nobody answers for the real broadcast anyway
+            targets = {str(ip) for ip in ipaddress.ip_network(hosts, strict=False)}
+        else:
+            targets = set(hosts)
+        found = {}
+
+        # The local machine never answers its own ARP requests
+        if self.local_ip in targets:
+            found[self.local_ip] = self.local_mac
+
+        deadline = time.monotonic() + timeout if timeout else None
+        sock = self.socket_factory(self.interface)
+        try:
+            sock.setblocking(False)
+            for ip in sorted(targets - set(found), key=lambda ip: socket.inet_aton(ip)):
+                self._pace()
+                self._send(sock, build_arp_request(self.src_mac, self.local_ip, ip), deadline, targets, found)
+                self._drain(sock, targets, found)
+
+            # Collect late replies
+            wait_until = time.monotonic() + self.reply_wait
+            while time.monotonic() < wait_until and len(found) < len(targets):
+                self._drain(sock, targets, found)
+                time.sleep(0.005)
+        finally:
+            sock.close()
+
+        return [{'ip': ip, 'status': 'up', 'mac': mac} for ip, mac in found.items()]
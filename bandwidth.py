@@ -0,0 +1,236 @@
+import heapq
+import ipaddress
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+PROC_CONNTRACK = '/proc/net/nf_conntrack'
+CONNTRACK_ACCT = '/proc/sys/net/netfilter/nf_conntrack_acct'
+ULA = ipaddress.ip_network('fc00::/7')
+
+# One conntrack entry with accounting, from /proc/net/nf_conntrack or
+# `conntrack -L [-o extended]`: the protocol (after the address family, if
+# any), the original tuple (src, dst, ports) with its byte count, then
+# the reply tuple's byte count
+FLOW = re.compile(
+    r'^(?:ipv[46] +\d+ +)?(\S+) +\d+ \d+ (?:\S+ )?src=(\S+) dst=(\S+) (\S+ \S+) .*?bytes=(\d+) '
+    r'(?:\[UNREPLIED\] )?src=\S+ dst=\S+ .*?bytes=(\d+)',
+    re.MULTILINE
+)
+
+
+# {(protocol, src, dst, ports): (original bytes, reply bytes)} for every
+# flow in a conntrack dump. TCP and UDP flows between the same addresses
+# and ports are separate entries.
+def parse_conntrack(text):
+    return {
+        (protocol, src, dst, port): (int(orig), int(reply))
+        for protocol, src, dst, port, orig, reply in FLOW.findall(text)
+    }
+
+
+def read_proc_conntrack(path=PROC_CONNTRACK):
+    with open(path) as f:
+        return f.read()
+
+
+def read_conntrack_tool():
+    result = subprocess.run(['conntrack', '-L', '-o', 'extended'], capture_output=True, text=True, timeout=30)
+    return result.stdout
+
+
+# /proc where it exists, the conntrack tool otherwise (None if neither)
+def default_reader():
+    if os.path.exists(PROC_CONNTRACK):
+        return read_proc_conntrack
+    if shutil.which('conntrack'):
+        return read_conntrack_tool
+    return None
+
+
+def accounting_enabled(path=CONNTRACK_ACCT):
+    try:
+        with open(path) as f:
+            return f.read().strip() == '1'
+    except OSError:
+        return False
+
+
+# Addresses whose traffic is accounted by default: RFC 1918 IPv4 plus
+# unique-local and link-local IPv6. String checks for IPv4 keep this cheap
+# for the (mostly public) remote end of every flow.
+def is_private(ip):
+    if ip.startswith(('10.', '192.168.')):
+        return True
+    if ip.startswith('172.'):
+        second = ip.split('.', 2)[1]
+        return second.isdigit() and 16 <= int(second) <= 31
+    if ':' in ip:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return address in ULA or address.is_link_local
+    return False
+
+
+# Per-device byte counts from kernel connection tracking. The whole table is
+# read in one batch every `interval` seconds (never per packet); each flow's
+# growth since the previous read is charged to the tracked address on either
+# end. Keeps `window` seconds of per-IP samples for top-talker queries.
+# Only traffic that passes through this host's conntrack is seen, i.e. the
+# sensor must be the router/gateway (or be forwarding kicked devices).
+class BandwidthAccounting:
+    def __init__(self, reader=None, interval=10, window=3600, is_tracked=is_private,
+                 on_update=None):
+        self.reader = reader if reader is not None else default_reader()
+        self.interval = interval
+        self.window = window
+        self.is_tracked = is_tracked
+        self.on_update = on_update
+        self.flows = {}  # flow key -> (original bytes, reply bytes) at the last read
+        self.series = {}  # ip -> deque of (timestamp, rx bytes, tx bytes)
+        self.totals = {}  # ip -> [rx bytes, tx bytes] since start
+        self.rates = {}  # ip -> (rx rate, tx rate) over the last interval
+        self.last_read = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def available(self):
+        return self.reader is not None
+
+    def start(self):
+        if self.thread is not None or not self.available:
+            return
+        if not accounting_enabled():
+            log.warning("Conntrack byte accounting is off; enable it with "
+                        "`sysctl -w net.netfilter.nf_conntrack_acct=1` for per-device bandwidth")
+        self.thread = threading.Thread(target=self._run, name='bandwidth', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                log.error("Error reading conntrack counters: %s", e)
+            time.sleep(self.interval)
+
+    # Charge each flow's growth since the last read to its tracked ends.
+    # Returns {ip: (rx bytes, tx bytes)} for this read.
+    def aggregate(self, flows):
+        previous = self.flows
+        is_tracked = self.is_tracked
+        usage = {}
+        for key, (orig, reply) in flows.items():
+            before = previous.get(key)
+            if before is None:
+                sent, received = orig, reply
+            else:
+                # A smaller count means the entry was recreated
+                sent = orig - before[0] if orig >= before[0] else orig
+                received = reply - before[1] if reply >= before[1] else reply
+            if not (sent or received):
+                continue
+
+            src, dst = key[1], key[2]
+            if is_tracked(src):
+                entry = usage.setdefault(src, [0, 0])
+                entry[0] += received
+                entry[1] += sent
+            if is_tracked(dst):
+                entry = usage.setdefault(dst, [0, 0])
+                entry[0] += sent
+                entry[1] += received
+        self.flows = flows
+        return usage
+
+    # Read and account the conntrack table once
+    def poll(self, now=None):
+        now = time.time() if now is None else now
+        flows = parse_conntrack(self.reader())
+
+        with self.lock:
+            first = self.last_read is None
+            elapsed = now - self.last_read if not first else 0
+            usage = self.aggregate(flows)
+            self.last_read = now
+            if first:
+                # Existing flows' counts predate us, only count growth from here
+                return {}
+
+            horizon = now - self.window
+            self.rates = {}
+            for ip, (rx, tx) in usage.items():
+                series = self.series.get(ip)
+                if series is None:
+                    series = self.series[ip] = deque()
+                series.append((now, rx, tx))
+                totals = self.totals.setdefault(ip, [0, 0])
+                totals[0] += rx
+                totals[1] += tx
+                if elapsed > 0:
+                    self.rates[ip] = (rx / elapsed, tx / elapsed)
+
+            # Drop samples (and idle devices) older than the window
+            for ip in list(self.series):
+                series = self.series[ip]
+                while series and series[0][0] < horizon:
+                    series.popleft()
+                if not series:
+                    del self.series[ip]
+
+        if self.on_update:
+            self.on_update(self.usage_snapshot())
+        return usage
+
+    # {ip: {rx_bytes, tx_bytes, rx_rate, tx_rate}} for every accounted device
+    def usage_snapshot(self):
+        with self.lock:
+            return {
+                ip: {
+                    'rx_bytes': totals[0],
+                    'tx_bytes': totals[1],
+                    'rx_rate': self.rates.get(ip, (0.0, 0.0))[0],
+                    'tx_rate': self.rates.get(ip, (0.0, 0.0))[1]
+                }
+                for ip, totals in self.totals.items()
+            }
+
+    # The n devices that moved the most bytes in the last `window` seconds
+    def top(self, n=10, window=None, now=None):
+        now = time.time() if now is None else now
+        since = now - min(window or self.window, self.window)
+        with self.lock:
+            sums = []
+            for ip, series in self.series.items():
+                rx = tx = 0
+                for timestamp, sample_rx, sample_tx in reversed(series):
+                    if timestamp < since:
+                        break
+                    rx += sample_rx
+                    tx += sample_tx
+                if rx or tx:
+                    sums.append((rx + tx, ip, rx, tx))
+        return [
+            {'ip': ip, 'rx_bytes': rx, 'tx_bytes': tx, 'total_bytes': total}
+            for total, ip, rx, tx in heapq.nlargest(n, sums)
+        ]
+
+    # Recent samples of one device as {timestamps, rx_bytes, tx_bytes}
+    def history(self, ip):
+        with self.lock:
+            series = list(self.series.get(ip, ()))
+        return {
+            'timestamps': [sample[0] for sample in series],
+            'rx_bytes': [sample[1] for sample in series],
+            'tx_bytes': [sample[2] for sample in series]
+        }
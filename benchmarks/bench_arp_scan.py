@@ -0,0 +1,81 @@
+# Run the raw-socket ARP backend against a stand-in packet socket that
+# answers for a fraction of the subnet, and report packet rate and accuracy.
+#
+# Usage: python benchmarks/bench_arp_scan.py [rate]
+import ipaddress
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from arp_scan import ArpScanBackend, ETH_P_ARP, ARP_REPLY  # noqa: E402
+from discovery import DiscoveryEngine  # noqa: E402
+
+LOCAL_MAC = '02:00:00:00:00:01'
+
+
+def is_alive(ip):
+    return int(ip.split('.')[-1]) % 3 == 0
+
+
+# Behaves like a bound AF_PACKET socket on a segment where every third host
+# answers ARP after a small delay
+class FakePacketSocket:
+    sent = 0
+    lock = threading.Lock()
+
+    def __init__(self, interface, latency=0.002):
+        self.latency = latency
+        self.replies = deque()
+
+    def setblocking(self, flag):
+        pass
+
+    def send(self, frame):
+        with FakePacketSocket.lock:
+            FakePacketSocket.sent += 1
+        target = socket.inet_ntoa(frame[38:42])
+        if is_alive(target):
+            mac = bytes([2, 0xaa, 0, 0, 0, int(target.split('.')[-1])])
+            reply = (b'\x02\x00\x00\x00\x00\x01' + mac + struct.pack('!H', ETH_P_ARP) +
+                     struct.pack('!HHBBH6s4s6s4s', 1, 0x0800, 6, 4, ARP_REPLY,
+                                 mac, socket.inet_aton(target), frame[6:12], frame[28:32]))
+            self.replies.append((time.monotonic() + self.latency, reply))
+        return len(frame)
+
+    def recv(self, size):
+        if self.replies and self.replies[0][0] <= time.monotonic():
+            return self.replies.popleft()[1]
+        raise BlockingIOError
+
+    def close(self):
+        pass
+
+
+def main():
+    rate = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for cidr in ('10.1.0.0/24', '10.1.0.0/22'):
+        FakePacketSocket.sent = 0
+        backend = ArpScanBackend('eth0', '10.1.0.1', LOCAL_MAC, rate=rate, reply_wait=0.05,
+                                 socket_factory=FakePacketSocket)
+        engine = DiscoveryEngine(backend, max_workers=4)
+
+        start = time.perf_counter()
+        hosts, failed = engine.run(cidr)
+        elapsed = time.perf_counter() - start
+
+        # Every answering host plus the local machine, each with its MAC
+        expected = {str(ip) for ip in ipaddress.ip_network(cidr) if is_alive(str(ip))} | {'10.1.0.1'}
+        found = {h['ip'] for h in hosts if h['mac'] != 'Unknown'}
+        print(f"{cidr:<14} {FakePacketSocket.sent:>5} requests in {elapsed:.3f} s "
+              f"({FakePacketSocket.sent / elapsed:.0f} pps, limit {rate}), "
+              f"found {len(found & expected)}/{len(expected)} hosts, {len(found - expected)} false positives")
+
+
+if __name__ == '__main__':
+    main()
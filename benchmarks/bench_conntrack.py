@@ -0,0 +1,71 @@
+# Time parsing and accounting a synthetic /proc/net/nf_conntrack dump.
+#
+# Usage: python benchmarks/bench_conntrack.py [entries]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bandwidth import BandwidthAccounting, parse_conntrack  # noqa: E402
+
+
+# /proc/net/nf_conntrack text with accounting on: a mix of TCP, UDP (some
+# unreplied) and ICMP flows between 250 LAN hosts and the internet
+def make_dump(entries, seed=1, growth=0):
+    rng = random.Random(seed)
+    lines = []
+    for i in range(entries):
+        lan = f"192.168.{i % 4}.{rng.randint(2, 254)}"
+        wan = f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        sport = 1024 + i % 60000
+        orig = 500 + i % 9000 + growth * (i % 7)
+        reply = 2000 + i % 50000 + growth * (i % 13)
+        kind = i % 10
+        if kind < 7:
+            lines.append(
+                f"ipv4     2 tcp      6 431999 ESTABLISHED src={lan} dst={wan} sport={sport} dport=443 "
+                f"packets={orig // 500} bytes={orig} src={wan} dst={lan} sport=443 dport={sport} "
+                f"packets={reply // 500} bytes={reply} [ASSURED] mark=0 zone=0 use=2"
+            )
+        elif kind < 9:
+            lines.append(
+                f"ipv4     2 udp      17 29 src={lan} dst={wan} sport={sport} dport=53 packets=1 bytes={orig} "
+                f"{'[UNREPLIED] ' if kind == 8 else ''}src={wan} dst={lan} sport=53 dport={sport} "
+                f"packets=1 bytes={0 if kind == 8 else reply} mark=0 zone=0 use=2"
+            )
+        else:
+            lines.append(
+                f"ipv4     2 icmp     1 29 src={lan} dst={wan} type=8 code=0 id={i % 65536} packets=1 bytes=84 "
+                f"src={wan} dst={lan} type=0 code=0 id={i % 65536} packets=1 bytes=84 mark=0 zone=0 use=2"
+            )
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    first = make_dump(entries)
+    second = make_dump(entries, growth=1000)
+    print(f"{entries} conntrack entries, {len(first) / 1e6:.1f} MB of text")
+
+    start = time.perf_counter()
+    flows = parse_conntrack(first)
+    parse_time = time.perf_counter() - start
+    print(f"parse:      {parse_time * 1000:8.1f} ms  ({len(flows) / parse_time:,.0f} flows/s, {len(flows)} flows)")
+
+    dumps = iter([first, second])
+    accounting = BandwidthAccounting(reader=lambda: next(dumps))
+    accounting.poll(now=0)
+    start = time.perf_counter()
+    usage = accounting.poll(now=10)
+    poll_time = time.perf_counter() - start
+    print(f"poll:       {poll_time * 1000:8.1f} ms  (parse + aggregate into {len(usage)} devices)")
+
+    start = time.perf_counter()
+    top = accounting.top(10, now=10)
+    print(f"top 10:     {(time.perf_counter() - start) * 1000:8.1f} ms  (largest: {top[0]['ip']}, {top[0]['total_bytes']} bytes)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Paged device listing on growing tables: one page of 100 devices with
+# different sorts, filters and searches, walking deep into the table, the
+# index catch-up after one /24 shard and after a full scan moved every
+# last_seen, and the unpaged /api/devices body for comparison.
+#
+# Usage: python benchmarks/bench_device_pages.py [sizes, e.g. 1000,10000,100000]
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from registry import DeviceRegistry  # noqa: E402
+
+QUERIES = (
+    ('ip', {}),
+    ('hostname desc', {'sort': 'hostname', 'descending': True}),
+    ('last_seen, up only', {'sort': 'last_seen', 'descending': True, 'status': frozenset(['up'])}),
+    ('blocked=true', {'blocked': True}),
+    ('blocked=false, status', {'sort': 'status', 'blocked': False}),
+    ('search "host-1"', {'prefix': 'host-1'}),
+)
+
+
+def make_devices(count, rng, last_seen='2024-01-01 00:00:00'):
+    return [{
+        'ip': f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+        'hostname': f"host-{i}" if rng.random() < 0.7 else 'Unknown',
+        'status': 'up' if rng.random() < 0.8 else 'down',
+        'last_seen': last_seen,
+        'first_seen': '2024-01-01 00:00:00',
+        'mac': f"02:00:{i >> 16 & 255:02x}:{i >> 8 & 255:02x}:{i & 255:02x}:01",
+        'vendor': 'Unknown',
+        'blocked': rng.random() < 0.01,
+        'is_local': False
+    } for i in range(count)]
+
+
+def timed(fn, repeat=200):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    sizes = [int(size) for size in (sys.argv[1] if len(sys.argv) > 1 else '1000,10000,100000').split(',')]
+    for size in sizes:
+        rng = random.Random(1)
+        registry = DeviceRegistry()
+        registry.merge(make_devices(size, rng))
+        print(f"{size:,} devices")
+
+        start = time.perf_counter()
+        registry.page()
+        print(f"  {'build indexes':<36}{(time.perf_counter() - start) * 1000:9.1f} ms")
+
+        for label, query in QUERIES:
+            ms, (records, cursor, total) = timed(lambda: registry.page(limit=100, **query))
+            print(f"  {'first page, ' + label:<36}{ms:9.3f} ms  ({total:,} match)")
+
+        # Deep pages: follow cursors to the middle of the table
+        cursor = None
+        for _ in range(size // 200):
+            _, cursor, _ = registry.page(limit=100, cursor=cursor)
+        if cursor:
+            ms, _ = timed(lambda: registry.page(limit=100, cursor=cursor))
+            print(f"  {'page at the middle':<36}{ms:9.3f} ms")
+
+        # A shard of an incremental scan sees 256 devices again
+        shard = make_devices(size, random.Random(1), last_seen='2024-01-01 00:00:30')[size // 2:size // 2 + 256]
+        registry.merge(shard)
+        start = time.perf_counter()
+        registry.page()
+        print(f"  {'catch-up after a shard':<36}{(time.perf_counter() - start) * 1000:9.1f} ms")
+
+        # A full scan sees every device again; the next page read catches up
+        rescanned = make_devices(size, random.Random(1), last_seen='2024-01-01 00:01:00')
+        registry.merge(rescanned)
+        start = time.perf_counter()
+        registry.page()
+        print(f"  {'catch-up after a scan':<36}{(time.perf_counter() - start) * 1000:9.1f} ms")
+
+        start = time.perf_counter()
+        body = json.dumps(registry.snapshot()).encode()
+        elapsed = time.perf_counter() - start
+        print(f"  {'unpaged list':<36}{elapsed * 1000:9.1f} ms  "
+              f"({len(body) / 1e6:.1f} MB, {len(gzip.compress(body, 5)) / 1e6:.1f} MB gzipped)")
+
+
+if __name__ == '__main__':
+    main()
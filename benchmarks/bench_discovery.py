@@ -0,0 +1,67 @@
+# Benchmark the sharded discovery engine against a fake scanner backend.
+#
+# Usage: python benchmarks/bench_discovery.py
+import ipaddress
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from discovery import DiscoveryEngine  # noqa: E402
+
+
+# Fake nmap backend: the cost of a sweep grows with the number of addresses
+# probed, plus a fixed startup overhead per nmap invocation
+class FakeScanner:
+    def __init__(self, per_address=0.00005, startup=0.02, up_ratio=0.3, seed=1):
+        self.per_address = per_address
+        self.startup = startup
+        self.up_ratio = up_ratio
+        self.seed = seed
+
+    def sweep(self, hosts, timeout=0):
+        network = ipaddress.ip_network(hosts, strict=False)
+        time.sleep(self.startup + network.num_addresses * self.per_address)
+
+        # Decide per address so results don't depend on how the CIDR was sharded
+        return [
+            {'ip': str(ip), 'status': 'up', 'mac': 'Unknown'}
+            for ip in network.hosts()
+            if random.Random(self.seed * 1000003 + int(ip)).random() < self.up_ratio
+        ]
+
+
+def run(cidr, engine):
+    first_result = []
+
+    def on_shard(shard, hosts):
+        if not first_result:
+            first_result.append(time.perf_counter())
+
+    start = time.perf_counter()
+    hosts, failed = engine.run(cidr, on_shard=on_shard)
+    elapsed = time.perf_counter() - start
+    return elapsed, first_result[0] - start, len(hosts), failed
+
+
+def main():
+    backend = FakeScanner()
+    targets = ['10.0.0.0/24', '10.0.0.0/20', '10.0.0.0/16']
+
+    print(f"{'target':<14} {'mode':<18} {'wall (s)':>9} {'first (s)':>10} {'hosts':>7} {'hosts/s':>10}")
+    for cidr in targets:
+        prefix = ipaddress.ip_network(cidr).prefixlen
+        modes = [
+            ('single sweep', DiscoveryEngine(backend, max_workers=1, shard_prefix=prefix)),
+            ('sharded x8', DiscoveryEngine(backend, max_workers=8, shard_prefix=24)),
+            ('sharded x32', DiscoveryEngine(backend, max_workers=32, shard_prefix=24)),
+        ]
+        for name, engine in modes:
+            elapsed, first, count, failed = run(cidr, engine)
+            print(f"{cidr:<14} {name:<18} {elapsed:>9.3f} {first:>10.3f} {count:>7} {count / elapsed:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# Fleet mode on loopback: one collector (the app's /api/fleet/* routes on a
+# local port) and several sensors, each with its own registry of fake
+# devices, pushing over HTTP. Times the initial full sync, a steady-state
+# delta, the drain after a collector outage (sensors back off, then the
+# busy collector paces them with 503 + Retry-After) and paging through the
+# whole fleet.
+#
+# Usage: python benchmarks/bench_fleet.py [sites] [devices per site]
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server  # noqa: E402
+
+import app  # noqa: E402
+from fleet import FleetCollector, FleetSender  # noqa: E402
+from registry import DeviceRegistry  # noqa: E402
+
+
+def make_devices(site, count, status='up', hostname='host'):
+    return [{
+        'ip': f"10.{site}.{i >> 8 & 255}.{i & 255}",
+        'hostname': f"{hostname}-{i}",
+        'status': status,
+        'last_seen': '2024-01-01 00:00:00',
+        'first_seen': '2024-01-01 00:00:00',
+        'mac': f"02:00:{site:02x}:00:{i >> 8 & 255:02x}:{i & 255:02x}",
+        'vendor': 'Unknown',
+        'blocked': False,
+        'is_local': False
+    } for i in range(count)]
+
+
+class Server:
+    def __init__(self, port=0):
+        self.server = make_server('127.0.0.1', port, app.app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Counts pushed bytes (compressed and raw)
+class CountingSender(FleetSender):
+    sent = 0
+    raw = 0
+
+    def _post(self, payload):
+        CountingSender.raw += len(json.dumps(payload, separators=(',', ':')))
+        CountingSender.sent += 1
+        return super()._post(payload)
+
+
+def wait_synced(sensors, timeout=120):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if all(s.acked_version == s.registry.version and not s.samples for s in sensors):
+            return time.perf_counter() - start
+        time.sleep(0.01)
+    raise RuntimeError("sensors did not catch up")
+
+
+def get(port, path):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}") as response:
+        return json.loads(response.read())
+
+
+def main():
+    site_count = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    per_site = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    logging.getLogger('fleet').setLevel(logging.ERROR)
+    app.fleet_collector = FleetCollector(max_inflight=2, retry_after=1, stale_after=30)
+    server = Server()
+    port = server.port
+
+    sensors = []
+    for site in range(site_count):
+        registry = DeviceRegistry()
+        registry.merge(make_devices(site, per_site))
+        sensor = CountingSender(f"http://127.0.0.1:{port}", f"site-{site}", registry, interval=0.2,
+                                batch_size=2000, max_backoff=1)
+        for second in range(60):
+            sensor.queue_sample(time.time() - 60 + second, 1e6, 2e5, second * 1e6, second * 2e5)
+        sensors.append(sensor)
+    total = site_count * per_site
+    print(f"{site_count} sites x {per_site:,} devices, collector on 127.0.0.1:{port} (2 pushes at once)")
+
+    for sensor in sensors:
+        sensor.start()
+    elapsed = wait_synced(sensors)
+    print(f"  initial sync:      {elapsed * 1000:8.0f} ms  {total / elapsed:9,.0f} devices/s  "
+          f"{CountingSender.sent} pushes, {CountingSender.raw / 1e6:.1f} MB JSON, "
+          f"{app.fleet_collector.rejected} turned away")
+
+    # Steady state: 1% of every site changes
+    start = time.perf_counter()
+    for site, sensor in enumerate(sensors):
+        changed = make_devices(site, per_site // 100, hostname='renamed')
+        sensor.registry.merge(changed)
+    elapsed = wait_synced(sensors)
+    print(f"  1% delta:          {elapsed * 1000:8.0f} ms  (push interval 200 ms)")
+
+    # Outage: the collector goes away while every sensor's devices change
+    server.stop()
+    for site, sensor in enumerate(sensors):
+        sensor.registry.merge(make_devices(site, per_site, status='down'))
+        sensor.queue_sample(time.time(), 1e6, 2e5, 1e9, 2e8)
+    time.sleep(2)
+    rejected = app.fleet_collector.rejected
+    start = time.perf_counter()
+    server = Server(port)
+    elapsed = wait_synced(sensors)
+    print(f"  drain after outage:{elapsed * 1000:8.0f} ms  "
+          f"{app.fleet_collector.rejected - rejected} pushes turned away while busy")
+
+    summary = get(port, '/api/fleet/stats')
+    assert summary['totals']['total_devices'] == total, summary['totals']
+    assert summary['totals']['active_devices'] == 0
+
+    start = time.perf_counter()
+    cursor = ''
+    seen = 0
+    pages = 0
+    while True:
+        page = get(port, f"/api/fleet/devices?limit=1000&cursor={cursor}")
+        seen += len(page['devices'])
+        pages += 1
+        if page['next_cursor'] is None:
+            break
+        cursor = urllib.request.quote(page['next_cursor'])
+    elapsed = time.perf_counter() - start
+    assert seen == total, seen
+    print(f"  page through fleet:{elapsed * 1000:8.0f} ms  ({pages} pages of 1000, {elapsed / pages * 1000:.1f} ms/page)")
+
+    for sensor in sensors:
+        sensor.stop()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Compare the old per-host `arp -n | grep | awk` lookup with the batched
+# neighbor-table resolver.
+#
+# Usage: python benchmarks/bench_mac_resolver.py [hosts]
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mac_resolver import MacResolver, parse_proc_net_arp  # noqa: E402
+
+
+# Synthesize a /proc/net/arp dump with `count` complete entries
+def fake_proc_net_arp(count):
+    lines = ['IP address       HW type     Flags       HW address            Mask     Device']
+    for i in range(count):
+        ip = f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+        mac = ':'.join(f"{b:02x}" for b in (2, 0, (i >> 24) & 255, (i >> 16) & 255, (i >> 8) & 255, i & 255))
+        lines.append(f"{ip:<16} 0x1         0x2         {mac}     *        eth0")
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    hosts = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    ips = [f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" for i in range(hosts)]
+
+    # Old path: three processes per host through the shell
+    sample = min(hosts, 200)
+    start = time.perf_counter()
+    for ip in ips[:sample]:
+        subprocess.run(f"arp -n {ip} | grep -v Address | awk '{{print $3}}'",
+                       shell=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    per_host = (time.perf_counter() - start) / sample
+    print(f"per-host subprocess: {per_host * 1000:.2f} ms/host, "
+          f"~{per_host * hosts:.2f} s for {hosts} hosts (measured on {sample})")
+
+    # New path: one table read, then dictionary lookups
+    dump = fake_proc_net_arp(hosts)
+    resolver = MacResolver(reader=lambda: parse_proc_net_arp(dump))
+    start = time.perf_counter()
+    resolver.refresh()
+    refreshed = time.perf_counter()
+    found = sum(1 for ip in ips if resolver.lookup(ip) != 'Unknown')
+    done = time.perf_counter()
+    print(f"batched resolver: refresh {(refreshed - start) * 1000:.2f} ms, "
+          f"lookups {(done - refreshed) / hosts * 1e6:.2f} us/host, "
+          f"total {(done - start) * 1000:.2f} ms for {hosts} hosts ({found} resolved)")
+    print(f"speedup: {per_host * hosts / (done - start):.0f}x")
+
+
+if __name__ == '__main__':
+    main()
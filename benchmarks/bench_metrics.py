@@ -0,0 +1,97 @@
+# Cost of the instrumentation and logging around a scan: one timer/counter
+# update, then a full scan of a fake /16 with every discovered device logged
+# (DEBUG without rate limiting, like the old per-device prints), DEBUG with
+# rate limiting, and the default INFO level. Prints the stage timings the
+# scan recorded on /metrics.
+#
+# Usage: python benchmarks/bench_metrics.py [cidr]
+import ipaddress
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from firewall import NullBackend  # noqa: E402
+from logs import LOG_FORMAT, RateLimitFilter  # noqa: E402
+from metrics import MetricsRegistry  # noqa: E402
+
+
+# Every third address answers
+class FakeScanner:
+    def sweep(self, hosts, timeout=0):
+        return [{'ip': str(ip), 'status': 'up', 'mac': 'Unknown'}
+                for ip in ipaddress.ip_network(hosts).hosts() if int(ip) % 3 == 0]
+
+
+def per_call(fn, n=200000):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e9
+
+
+def timed_scan(segment, level, rate_limited, log_file):
+    root = logging.getLogger()
+    handler = logging.StreamHandler(log_file)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    if rate_limited:
+        handler.addFilter(RateLimitFilter())
+    root.addHandler(handler)
+    root.setLevel(level)
+    app.devices.__init__()
+    try:
+        start = time.perf_counter()
+        app.scan_network(full=True, segment=segment)
+        return time.perf_counter() - start
+    finally:
+        root.removeHandler(handler)
+
+
+def main():
+    cidr = sys.argv[1] if len(sys.argv) > 1 else '10.77.0.0/16'
+
+    registry = MetricsRegistry()
+    counter = registry.counter('bench_total', 'Benchmark counter')
+    histogram = registry.histogram('bench_seconds', 'Benchmark histogram')
+
+    def timer():
+        with histogram.time(stage='bench'):
+            pass
+
+    print(f"counter inc:     {per_call(lambda: counter.inc(stage='bench')):6.0f} ns")
+    print(f"histogram timer: {per_call(timer):6.0f} ns")
+
+    app.make_discovery_backend = lambda network_info: FakeScanner()
+    app.hostname_resolver.lookup = lambda ip: None
+    app.mac_resolver.reader = lambda: {}
+    app.firewall.backend = NullBackend()
+    app.segments.add(app.Segment('bench', lambda: {
+        'local_ip': cidr.split('/')[0], 'gateway_ip': 'Unknown', 'interface': 'lo',
+        'netmask': 'Unknown', 'cidr': cidr, 'hostname': 'bench'
+    }))
+    segment = app.segments.get('bench')
+
+    print(f"\nfull scan of {cidr}:")
+    with tempfile.TemporaryFile('w') as log_file:
+        for label, level, rate_limited in (
+            ('DEBUG, every device', logging.DEBUG, False),
+            ('DEBUG, rate limited', logging.DEBUG, True),
+            ('INFO (default)', logging.INFO, True),
+        ):
+            before = log_file.tell()
+            elapsed = timed_scan(segment, level, rate_limited, log_file)
+            print(f"  {label:<22}{elapsed * 1000:9.0f} ms  {(log_file.tell() - before) / 1024:9.1f} KB logged")
+
+    print("\nstage timings recorded on /metrics:")
+    for line in app.metrics.render().splitlines():
+        if line.startswith(('network_guardian_stage_seconds_sum', 'network_guardian_stage_seconds_count',
+                            'network_guardian_scan_hosts_per_second')):
+            print(f"  {line}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# Presence log at scale: a week of join/leave/change events for a few
+# thousand devices (some of them flapping), written in scan-sized batches.
+# Times appending, reopening (index load), one device's events for the
+# week, the newest events of the last hour and the flapping query for the
+# last day.
+#
+# Usage: python benchmarks/bench_presence.py [events] [devices]
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from presence import PresenceLog  # noqa: E402
+
+WEEK = 7 * 86400
+
+
+def make_events(count, device_count, start, rng):
+    macs = [f"02:00:{i >> 16 & 255:02x}:{i >> 8 & 255:02x}:{i & 255:02x}:01" for i in range(device_count)]
+    flappers = macs[:device_count // 100]
+    step = WEEK / count
+    events = []
+    for i in range(count):
+        index = rng.randrange(device_count)
+        mac = rng.choice(flappers) if rng.random() < 0.5 else macs[index]
+        ip = f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+        kind = rng.random()
+        if kind < 0.45:
+            event = ('joined', None, None)
+        elif kind < 0.9:
+            event = ('left', None, None)
+        elif kind < 0.97:
+            event = ('hostname_changed', f"host-{index}", f"host-{index}-b")
+        else:
+            event = ('ip_changed', f"10.99.0.{index & 255}", ip)
+        events.append((start + i * step, event[0], ip, mac, event[1], event[2]))
+    return events, macs
+
+
+def timed(fn, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    device_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    rng = random.Random(1)
+    now = time.time()
+    events, macs = make_events(count, device_count, now - WEEK, rng)
+    directory = tempfile.mkdtemp(prefix='presence-bench-')
+
+    try:
+        presence = PresenceLog(directory, max_bytes=1 << 30, max_age=2 * WEEK)
+        start = time.perf_counter()
+        for offset in range(0, count, 500):
+            presence.record(events[offset:offset + 500])
+            presence.flush()
+        elapsed = time.perf_counter() - start
+        presence.close()
+        print(f"{count:,} events, {device_count:,} devices")
+        print(f"  append:             {count / elapsed:10,.0f} events/s")
+
+        start = time.perf_counter()
+        presence = PresenceLog(directory, max_bytes=1 << 30, max_age=2 * WEEK)
+        stats = presence.stats()
+        print(f"  reopen:             {(time.perf_counter() - start) * 1000:10.1f} ms  "
+              f"({stats['segments']} segments, {stats['bytes'] / 1e6:.1f} MB)")
+
+        quiet = macs[-1]
+        ms, result = timed(lambda: presence.query(quiet, now - WEEK, now, limit=10000))
+        print(f"  device, 7 days:     {ms:10.2f} ms  ({len(result)} events)")
+        ms, result = timed(lambda: presence.query(macs[0], now - WEEK, now, limit=100))
+        print(f"  flapper, newest 100:{ms:10.2f} ms  ({len(result)} events)")
+        ms, result = timed(lambda: presence.query(None, now - 3600, now, limit=100))
+        print(f"  last hour, 100:     {ms:10.2f} ms  ({len(result)} events)")
+        ms, result = timed(lambda: presence.flapping(20, now - 86400, now))
+        print(f"  flapping, 1 day:    {ms:10.2f} ms  ({len(result)} devices)")
+
+        # The same questions answered by reading the whole log
+        def full_scan():
+            matches = 0
+            for segment in presence.segments:
+                if segment.count:
+                    matches += sum(1 for event in segment.iter_range(0, now) if event[3] == quiet)
+            return matches
+        ms, result = timed(full_scan, repeat=1)
+        print(f"  device, full scan:  {ms:10.2f} ms  ({result} events)")
+        presence.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# Scaling benchmark: the old list merge from scan_network() vs DeviceRegistry.
+#
+# Usage: python benchmarks/bench_registry.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from registry import DeviceRegistry  # noqa: E402
+
+
+def make_devices(count, offset=0):
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    devices = []
+    for i in range(offset, offset + count):
+        devices.append({
+            'ip': f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+            'hostname': f"host-{i}",
+            'status': 'up',
+            'last_seen': now,
+            'first_seen': now,
+            'mac': f"02:00:00:{(i >> 16) & 255:02x}:{(i >> 8) & 255:02x}:{i & 255:02x}",
+            'vendor': 'Unknown',
+            'blocked': False,
+            'is_local': False
+        })
+    return devices
+
+
+# The merge and offline pass scan_network() used before the registry
+def list_merge(devices, discovered):
+    for new_device in discovered:
+        found = False
+        for existing_device in devices:
+            if existing_device['ip'] == new_device['ip']:
+                existing_device['status'] = new_device['status']
+                existing_device['last_seen'] = new_device['last_seen']
+                found = True
+                break
+        if not found:
+            devices.append(dict(new_device))
+
+    for device in devices:
+        if device['ip'] not in [d['ip'] for d in discovered]:
+            device['status'] = 'down'
+
+
+def main():
+    print(f"{'devices':>8} {'list merge (s)':>15} {'registry (s)':>13} {'lookup (us)':>12}")
+    for count in (1000, 10000, 100000):
+        known = make_devices(count)
+        # Next scan: 10% of devices gone, 10% new
+        rescan = make_devices(count, offset=count // 10)
+
+        if count <= 10000:
+            devices = [dict(d) for d in known]
+            start = time.perf_counter()
+            list_merge(devices, rescan)
+            list_time = f"{time.perf_counter() - start:.3f}"
+        else:
+            list_time = 'skipped'
+
+        registry = DeviceRegistry()
+        registry.merge(known)
+        start = time.perf_counter()
+        added, changed, gone = registry.apply_scan(rescan)
+        registry_time = time.perf_counter() - start
+
+        ips = [d['ip'] for d in rescan[:10000]]
+        start = time.perf_counter()
+        for ip in ips:
+            registry.get(ip)
+        lookup = (time.perf_counter() - start) / len(ips) * 1e6
+
+        print(f"{count:>8} {list_time:>15} {registry_time:>13.3f} {lookup:>12.2f}"
+              f"   (+{len(added)} ~{len(changed)} -{len(gone)})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# Service probe throughput against local stand-in hosts: every host is a
+# loopback address (127.0.0.x) with a few listening ports, the rest of the
+# probed ports are closed. Also times a resubmission answered from the per-MAC
+# cache and MAC vendor lookups in the OUI index.
+#
+# Closed ports on loopback answer at once; on a real network filtered ports
+# cost up to the probe timeout, which is what the concurrency limit hides.
+#
+# Usage: python benchmarks/bench_service_probe.py [hosts]
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fingerprint import ServiceProber  # noqa: E402
+from vendors import OuiIndex  # noqa: E402
+
+PORTS = 24
+OPEN_PER_HOST = 4
+
+
+# Listening sockets on `OPEN_PER_HOST` of the ports of every host (never
+# accepted: the kernel completes the handshake from the backlog)
+def start_listeners(hosts, ports, rng):
+    listeners = []
+    expected = {}
+    for ip in hosts:
+        expected[ip] = sorted(rng.sample(ports, OPEN_PER_HOST))
+        for port in expected[ip]:
+            sock = socket.socket()
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((ip, port))
+            sock.listen(1024)
+            listeners.append(sock)
+    return listeners, expected
+
+
+# Port numbers that are free on 127.0.0.1
+def free_ports(count):
+    socks = []
+    for _ in range(count):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        socks.append(sock)
+    ports = [sock.getsockname()[1] for sock in socks]
+    for sock in socks:
+        sock.close()
+    return ports
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(1)
+    hosts = [f"127.0.{i // 250}.{i % 250 + 2}" for i in range(count)]
+    ports = free_ports(PORTS)
+    listeners, expected = start_listeners(hosts, ports, rng)
+    port_names = {port: f"svc{port}" for port in ports}
+    print(f"{count} hosts x {PORTS} ports, {OPEN_PER_HOST} open per host")
+
+    try:
+        for concurrency in (16, 64, 256, 1024):
+            prober = ServiceProber(ports=port_names, concurrency=concurrency, timeout=2.0)
+            start = time.perf_counter()
+            results = prober.probe(hosts)
+            elapsed = time.perf_counter() - start
+            for ip in hosts:
+                assert [service['port'] for service in results[ip]] == expected[ip], ip
+            print(f"  concurrency {concurrency:5d}: {elapsed * 1000:8.0f} ms  "
+                  f"({count * PORTS / elapsed:8,.0f} probes/s, {count / elapsed:6,.0f} hosts/s)")
+
+        # Pipeline with the per-MAC cache: the second submission probes nothing
+        done = threading.Event()
+        received = {}
+
+        def on_results(batch):
+            received.update(batch)
+            if len(received) == count:
+                done.set()
+
+        prober = ServiceProber(ports=port_names, concurrency=256, timeout=2.0, on_results=on_results)
+        macs = [(ip, f"02:00:00:00:{i // 256:02x}:{i % 256:02x}") for i, ip in enumerate(hosts)]
+        start = time.perf_counter()
+        prober.submit(macs)
+        done.wait(60)
+        print(f"  pipeline, first pass:   {(time.perf_counter() - start) * 1000:8.1f} ms")
+        start = time.perf_counter()
+        hits = prober.submit(macs)
+        print(f"  pipeline, cached pass:  {(time.perf_counter() - start) * 1000:8.1f} ms  ({len(hits)} cache hits)")
+        assert len(hits) == count
+    finally:
+        for sock in listeners:
+            sock.close()
+
+    index = OuiIndex()
+    index.load()
+    macs = [':'.join(f"{rng.randrange(256):02x}" for _ in range(6)) for _ in range(100000)]
+    start = time.perf_counter()
+    for mac in macs:
+        index.lookup(mac)
+    elapsed = time.perf_counter() - start
+    print(f"vendor lookup: {len(macs) / elapsed:,.0f} lookups/s ({len(index)} prefixes)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+# Time from process start to the first /api/devices response:
+#   blocking    - initial scan finishes before the server starts (the old startup)
+#   background  - saved devices are served at once, the scan runs in the background
+#   worker      - a web worker from create_app() attaching to a running engine
+#   cold        - engine and worker started together
+#
+# Every server is a child process with a saved table of devices and a fake
+# discovery backend whose sweep takes a fixed time, so no root or nmap is needed.
+#
+# Usage: python benchmarks/bench_startup.py [devices] [scan seconds]
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# Fake sweep of the benchmark subnet that takes `seconds`
+class SlowScanner:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def sweep(self, hosts, timeout=0):
+        time.sleep(self.seconds)
+        return [{'ip': f"10.98.0.{i}", 'status': 'up', 'mac': f"02:00:00:00:00:{i:02x}"} for i in range(1, 51)]
+
+
+# Child process: set up the app like `python app.py` would, in one of the modes
+def serve(mode, port, database, engine_socket, scan_seconds):
+    import app
+    from firewall import NullBackend
+    from werkzeug.serving import make_server
+
+    app.database_path = database
+    app.engine_socket = engine_socket
+    app.firewall.backend = NullBackend()
+    app.make_discovery_backend = lambda network_info: SlowScanner(scan_seconds)
+    app.hostname_resolver.lookup = lambda ip: None
+    app.segments.add(app.Segment('bench', lambda: {
+        'local_ip': '10.98.0.1', 'gateway_ip': '10.98.0.254', 'interface': 'lo',
+        'netmask': '255.255.255.0', 'cidr': '10.98.0.0/24', 'hostname': 'bench'
+    }))
+
+    if mode == 'worker':
+        flask_app = app.create_app()
+    else:
+        app.load_state()
+        if mode == 'blocking':
+            app.scan_and_save(full=True)
+        app.initialize()
+        flask_app = app.app
+        if mode == 'engine':
+            app.serve_engine()
+            threading.Event().wait()
+    make_server('127.0.0.1', port, flask_app, threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def spawn(mode, port, database, engine_socket, scan_seconds):
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', mode, str(port), database, engine_socket, str(scan_seconds)],
+        cwd=os.path.dirname(database), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+# Poll until the server answers; returns (seconds since `start`, response)
+def first_response(port, start, path='/api/devices', timeout=60):
+    url = f"http://127.0.0.1:{port}{path}"
+    while time.perf_counter() - start < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                return time.perf_counter() - start, json.load(response)
+        except OSError:
+            time.sleep(0.005)
+    raise TimeoutError(f"No response from {url}")
+
+
+def stop(*processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    scan_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+
+    from persistence import StateStore
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'bench.db')
+        engine_socket = os.path.join(directory, 'engine.sock')
+        store = StateStore(database)
+        store.save_devices([
+            {'ip': f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}", 'hostname': f"host-{i}",
+             'status': 'up', 'last_seen': '2024-01-01 00:00:00', 'mac': f"02:00:{i // 65536 % 256:02x}:"
+             f"{i // 256 % 256:02x}:{i % 256:02x}:01", 'segment': 'bench'}
+            for i in range(count)
+        ])
+        store.flush()
+        store.close()
+
+        print(f"{count} saved devices, initial scan takes {scan_seconds:.1f} s")
+        print(f"{'mode':<12}{'first response':>16}{'devices':>10}")
+
+        for mode in ('blocking', 'background'):
+            port = free_port()
+            start = time.perf_counter()
+            process = spawn(mode, port, database, engine_socket, scan_seconds)
+            try:
+                elapsed, body = first_response(port, start)
+            finally:
+                stop(process)
+            print(f"{mode:<12}{elapsed * 1000:>13.0f} ms{len(body):>10}")
+
+        # Worker attaching to an engine that is already running
+        engine = spawn('engine', 0, database, engine_socket, scan_seconds)
+        try:
+            while not os.path.exists(engine_socket):
+                time.sleep(0.01)
+            port = free_port()
+            start = time.perf_counter()
+            worker = spawn('worker', port, database, engine_socket, scan_seconds)
+            try:
+                elapsed, body = first_response(port, start)
+                print(f"{'worker':<12}{elapsed * 1000:>13.0f} ms{len(body):>10}")
+                # Routes the worker doesn't serve itself go through the engine
+                _, status = first_response(port, start, '/api/scan-status')
+                assert status['segment'] == 'bench', status
+            finally:
+                stop(worker)
+        finally:
+            stop(engine)
+
+        # Engine and worker starting at the same time
+        port = free_port()
+        start = time.perf_counter()
+        engine = spawn('engine', 0, database, engine_socket, scan_seconds)
+        worker = spawn('worker', port, database, engine_socket, scan_seconds)
+        try:
+            elapsed, body = first_response(port, start)
+            print(f"{'cold':<12}{elapsed * 1000:>13.0f} ms{len(body):>10}")
+        finally:
+            stop(worker, engine)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--serve']:
+        mode, port, database, engine_socket, scan_seconds = sys.argv[2:7]
+        serve(mode, int(port), database, engine_socket, float(scan_seconds))
+    else:
+        main()
@@ -0,0 +1,55 @@
+# Measure the cost of one traffic sample (read + per-NIC rates + ring buffer
+# append) for hosts with many interfaces, e.g. VLAN-heavy sensors.
+#
+# Usage: python benchmarks/bench_traffic_sampler.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from traffic_sampler import TrafficSampler, parse_proc_net_dev, read_psutil_counters  # noqa: E402
+
+HEADER = (
+    "Inter-|   Receive                                                |  Transmit\n"
+    " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed\n"
+)
+
+
+# Synthetic /proc/net/dev text with `nics` interfaces whose counters grow by `step`
+def make_proc_net_dev(nics, step):
+    lines = [HEADER]
+    for i in range(nics):
+        base = (i + 1) * 1000 + step * 1500
+        lines.append(f"eth0.{i}: {base} {step} 0 0 0 0 0 0 {base // 2} {step} 0 0 0 0 0 0\n")
+    return ''.join(lines)
+
+
+def main():
+    samples = 1000
+    print(f"{'interfaces':>10} {'parse (us)':>11} {'sample (us)':>12}")
+    for nics in (4, 64, 512):
+        texts = [make_proc_net_dev(nics, step) for step in range(samples)]
+
+        start = time.perf_counter()
+        for text in texts:
+            parse_proc_net_dev(text)
+        parse_us = (time.perf_counter() - start) / samples * 1e6
+
+        feed = iter(texts)
+        sampler = TrafficSampler(reader=lambda: parse_proc_net_dev(next(feed)))
+        start = time.perf_counter()
+        for i in range(samples):
+            sampler.sample(now=float(i), timestamp=float(i))
+        sample_us = (time.perf_counter() - start) / samples * 1e6
+
+        print(f"{nics:>10} {parse_us:>11.1f} {sample_us:>12.1f}")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        read_psutil_counters()
+    print(f"psutil pernic read on this host: {(time.perf_counter() - start) / 100 * 1e6:.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# Feed a week of 1-second traffic samples into TrafficStore, then measure
+# memory and query latency for each dashboard range.
+#
+# Usage: python benchmarks/bench_traffic_store.py [days]
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from traffic_store import RANGES, TrafficStore  # noqa: E402
+
+
+def main():
+    days = float(sys.argv[1]) if len(sys.argv) > 1 else 7
+    samples = int(days * 86400)
+
+    tracemalloc.start()
+    store = TrafficStore()
+    after_init = tracemalloc.get_traced_memory()[0]
+
+    start_ts = time.time() - samples
+    recv = sent = 0
+    start = time.perf_counter()
+    for i in range(samples):
+        down = 50000 + 40000 * math.sin(i / 600)
+        up = 10000 + 5000 * math.cos(i / 900)
+        recv += int(down)
+        sent += int(up)
+        store.add_sample(down, up, recv, sent, timestamp=start_ts + i)
+    ingest = time.perf_counter() - start
+    after_ingest = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"ingested {samples} samples in {ingest:.2f} s ({samples / ingest:.0f} samples/s)")
+    print(f"memory: {after_init / 1024:.0f} KiB after init, {after_ingest / 1024:.0f} KiB after {days:g} days")
+
+    for range_name in [None] + list(RANGES):
+        runs = 200
+        start = time.perf_counter()
+        for _ in range(runs):
+            result = store.query(range_name)
+        elapsed = (time.perf_counter() - start) / runs
+        print(f"range {str(range_name):<5} {len(result['timestamps']):>4} points  {elapsed * 1e6:8.1f} us/query")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+# Scan pipeline regression suite. Runs the real scan pipeline (sweep, dns,
+# mac_lookup, merge, stats) against simulated networks of several sizes,
+# then loads the API from many clients while scans keep running. Each
+# measurement is the median of --repeat runs after --warmup untimed ones,
+# compared with a stored baseline: a scan result that got slower (or lower
+# throughput) by more than a factor of 1 + --threshold fails the run with
+# exit code 1. API results under load are only reported: they depend on how
+# threads get scheduled against the scan loop and swing by 2x or more
+# between runs. --check-api also checks their p50 latencies against
+# 1 + --api-threshold.
+#
+# Baselines are machine specific and never committed. The baseline file
+# (benchmarks/baseline.json, ignored by git) holds one baseline per
+# configuration (options, Python version, platform); the first run of a
+# configuration records its baseline, later runs compare with it.
+# tests/test_regression.py runs a small configuration this way.
+#
+# Usage: python benchmarks/regression.py [--sizes 10,1000,10000,100000] [--save]
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from firewall import NullBackend  # noqa: E402
+from rescan import RescanPlanner  # noqa: E402
+from simnet import SimulatedNetwork  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+ENDPOINTS = {
+    'devices': lambda: '/api/devices',
+    'devices_since': lambda: f"/api/devices?since={max(0, app.devices.version - 50)}",
+    'devices_page': lambda: '/api/devices?limit=100&sort=last_seen&order=desc&status=up',
+    'stats': lambda: '/api/stats',
+    'scan_status': lambda: '/api/scan-status',
+    'metrics': lambda: '/metrics',
+}
+# Differences below these are noise whatever the threshold says
+NOISE_FLOOR = {'s': 0.02, 'ms': 2.0, '/s': 0.0}
+# Results that are reported but never fail a run
+REPORT_ONLY_SUFFIXES = ('.rate', '.p95')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scan pipeline benchmark against a simulated network")
+    parser.add_argument('--sizes', default='10,1000,10000', help="comma separated host counts (up to 100000)")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per size, the median is reported")
+    parser.add_argument('--warmup', type=int, default=1, help="untimed runs per size before the measured ones")
+    parser.add_argument('--sweep-latency', type=float, default=0.02, help="seconds added to every sweep")
+    parser.add_argument('--probe-latency', type=float, default=0.0, help="seconds added per address swept")
+    parser.add_argument('--dns-latency', type=float, default=0.001, help="seconds per reverse lookup")
+    parser.add_argument('--loss', type=float, default=0.02, help="probability an up host does not answer")
+    parser.add_argument('--api-seconds', type=float, default=5.0, help="seconds of each API load run (0 to skip)")
+    parser.add_argument('--api-clients', type=int, default=16)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.4, help="allowed relative degradation")
+    parser.add_argument('--check-api', action='store_true', help="also fail on API p50 latencies under load")
+    # Latency under load depends on thread scheduling and varies more between runs
+    parser.add_argument('--api-threshold', type=float, default=1.0, help="allowed degradation of api.* p50s")
+    return parser.parse_args(argv)
+
+
+def stage_totals():
+    totals = {}
+    for name, key, value in app.stage_seconds.samples():
+        if name.endswith('_sum'):
+            totals[dict(key)['stage']] = value
+    return totals
+
+
+# Point every outside dependency of the pipeline at the simulated network
+# and start from an empty device table (cleared in place, so the presence
+# hook stays attached)
+def install(network):
+    scanner = network.scanner()
+    app.make_discovery_backend = lambda network_info: scanner
+    app.get_local_network_info = network.network_info
+    app.hostname_resolver.lookup = network.resolve
+    app.mac_resolver.reader = network.neighbor_table
+    app.traffic_sampler.reader = network.counters
+    app.firewall.backend = NullBackend()
+    app.scan_mode = 'incremental'
+    app.devices.clear()
+    app.response_cache.clear()
+    app.hostname_resolver.cache.clear()
+    app.mac_resolver.entries.clear()
+    app.traffic_sampler.nics.clear()
+    app.traffic_sampler.last_time = None
+    app.traffic_sampler.totals = None
+
+    segment = app.segments.get('sim')
+    if segment is None:
+        segment = app.Segment('sim', network.network_info)
+        app.segments.add(segment)
+    segment.info = network.network_info
+    # Every known host is due again right after a scan, so the incremental
+    # scan re-probes all of them
+    segment.scan_interval = 1e-6
+    segment.planner = RescanPlanner()
+    return segment
+
+
+def sample_traffic(network, seconds=1.0):
+    network.step(seconds)
+    app.traffic_sampler.sample()
+
+
+def run_size(args, size, seed):
+    network = SimulatedNetwork(hosts=size, sweep_latency=args.sweep_latency, probe_latency=args.probe_latency,
+                               dns_latency=args.dns_latency, loss=args.loss, seed=seed)
+    segment = install(network)
+    addresses = network.network.num_addresses
+    sample_traffic(network)
+    results = {}
+
+    before = stage_totals()
+    start = time.perf_counter()
+    app.scan_network(full=True, segment=segment)
+    elapsed = time.perf_counter() - start
+    after = stage_totals()
+    results['full_scan'] = (elapsed, 's', 'lower')
+    results['full_scan_rate'] = (addresses / elapsed, '/s', 'higher')
+    for stage in ('sweep', 'dns', 'mac_lookup', 'merge'):
+        results[f"stage.{stage}"] = (after.get(stage, 0.0) - before.get(stage, 0.0), 's', 'lower')
+
+    # Rescan of every known host after some churn; DNS answers are cached now
+    sample_traffic(network)
+    known = len(app.devices)
+    start = time.perf_counter()
+    app.scan_network(segment=segment)
+    elapsed = time.perf_counter() - start
+    results['incremental_scan'] = (elapsed, 's', 'lower')
+    results['incremental_scan_rate'] = (known / elapsed, '/s', 'higher')
+
+    before = stage_totals()
+    app.get_network_stats()
+    app.sample_segment_stats(segment)
+    after = stage_totals()
+    for stage in ('stats', 'segment_stats'):
+        results[f"stage.{stage}"] = (after.get(stage, 0.0) - before.get(stage, 0.0), 's', 'lower')
+    return results, network
+
+
+def api_load(args, network, segment, seconds):
+    stop = threading.Event()
+    latencies = {name: [] for name in ENDPOINTS}
+    errors = []
+
+    def scan_loop():
+        full = True
+        while not stop.is_set():
+            sample_traffic(network)
+            app.scan_network(full=full, segment=segment)
+            app.get_network_stats()
+            full = not full
+
+    # Each client keeps requesting one endpoint, so fast ones don't queue behind slow ones
+    def client(index):
+        test_client = app.app.test_client()
+        name = list(ENDPOINTS)[index % len(ENDPOINTS)]
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = test_client.get(ENDPOINTS[name]())
+            response.get_data()
+            latencies[name].append(time.perf_counter() - start)
+            if response.status_code >= 500:
+                errors.append((name, response.status_code))
+
+    threads = [threading.Thread(target=scan_loop, daemon=True)]
+    threads += [threading.Thread(target=client, args=(i,), daemon=True) for i in range(args.api_clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=60)
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise RuntimeError(f"API errors under load: {errors[:10]}")
+
+    results = {}
+    for name, values in latencies.items():
+        values.sort()
+        if not values:
+            continue
+        results[f"api.{name}.rate"] = (len(values) / elapsed, '/s', 'higher')
+        results[f"api.{name}.p50"] = (values[len(values) // 2] * 1000, 'ms', 'lower')
+        results[f"api.{name}.p95"] = (values[int(len(values) * 0.95)] * 1000, 'ms', 'lower')
+    return results
+
+
+def median_results(runs):
+    merged = {}
+    for name, (_, unit, better) in runs[0].items():
+        merged[name] = {
+            'value': statistics.median(run[name][0] for run in runs),
+            'unit': unit,
+            'better': better
+        }
+    return merged
+
+
+def format_value(value, unit):
+    if unit == 's':
+        return f"{value * 1000:10.1f} ms"
+    if unit == 'ms':
+        return f"{value:10.2f} ms"
+    return f"{value:10,.0f} {unit}"
+
+
+# Returns the names that got worse than the baseline by more than the
+# threshold. Worse is a ratio both ways: with a threshold of 0.4 a time may
+# grow to 1.4x and a rate may drop to 1/1.4 of the baseline.
+def compare(results, baseline, threshold, api_threshold, check_api=False):
+    regressions = []
+    for name, result in results.items():
+        api = name.startswith('api.')
+        factor = 1 + (api_threshold if api else threshold)
+        base = baseline.get(name)
+        if base is None:
+            print(f"  {name:<34}{format_value(result['value'], result['unit'])}  (new)")
+            continue
+        value, reference = result['value'], base['value']
+        change = (value - reference) / reference if reference else 0.0
+        checked = not name.endswith(REPORT_ONLY_SUFFIXES) and (check_api or not api)
+        if result['better'] == 'lower':
+            worse = value > reference * factor and value - reference > NOISE_FLOOR[result['unit']]
+        else:
+            worse = value * factor < reference
+        worse = worse and checked
+        marker = '  REGRESSION' if worse else ('' if checked else '  (not checked)')
+        print(f"  {name:<34}{format_value(value, result['unit'])}  "
+              f"baseline {format_value(reference, result['unit']).strip():>12}  {change:+7.1%}{marker}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+# Baselines are stored per configuration under a readable key
+def config_key(config):
+    return ','.join(f"{name}={config[name]}" for name in sorted(config))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    logging.basicConfig(level=logging.WARNING)
+    app.log.setLevel(logging.WARNING)
+
+    config = {
+        'sweep_latency': args.sweep_latency,
+        'probe_latency': args.probe_latency,
+        'dns_latency': args.dns_latency,
+        'loss': args.loss,
+        'api_clients': args.api_clients,
+        'python': sys.version.split()[0],
+        'platform': f"{platform.system()}-{platform.machine()}"
+    }
+    results = {}
+    network = None
+    for size in sizes:
+        for _ in range(args.warmup):
+            run_size(args, size, seed=1)
+        runs = []
+        for repeat in range(args.repeat):
+            run, network = run_size(args, size, seed=repeat + 1)
+            runs.append(run)
+        merged = median_results(runs)
+        print(f"{size:,} hosts in {network.cidr}: full scan {format_value(merged['full_scan']['value'], 's').strip()}, "
+              f"{merged['full_scan_rate']['value']:,.0f} addresses/s, "
+              f"incremental {format_value(merged['incremental_scan']['value'], 's').strip()}")
+        results.update({f"{size}.{name}": result for name, result in merged.items()})
+
+    # API load against the largest network, with scans running underneath
+    if args.api_seconds > 0:
+        segment = app.segments.get('sim')
+        if args.warmup:
+            api_load(args, network, segment, min(args.api_seconds, 1.0))
+        runs = [api_load(args, network, segment, args.api_seconds) for _ in range(args.repeat)]
+        merged = median_results(runs)
+        print(f"API under load ({args.api_clients} clients, {len(app.devices):,} devices, scans running):")
+        for name in ENDPOINTS:
+            if f"api.{name}.rate" in merged:
+                print(f"  {name:<14}{merged[f'api.{name}.rate']['value']:8,.0f} req/s  "
+                      f"p50 {merged[f'api.{name}.p50']['value']:7.2f} ms  p95 {merged[f'api.{name}.p95']['value']:7.2f} ms")
+        results.update(merged)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    key = config_key(config)
+    baseline = baselines.get(key)
+    if baseline is None or args.save:
+        baselines[key] = results
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Baseline for {key} written to {args.baseline}")
+        return 0
+
+    print(f"Compared with {args.baseline} [{key}] (threshold {args.threshold:.0%}"
+          f"{f', API p50 {args.api_threshold:.0%}' if args.check_api else ''}):")
+    regressions = compare(results, baseline, args.threshold, args.api_threshold, args.check_api)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+# Simulated network for benchmarks: a deterministic set of hosts (IPs, MACs,
+# hostnames) in a subnet sized to fit them, plus fake backends for every
+# outside dependency of the scan pipeline:
+#
+#   scanner()         discovery backend with DiscoveryEngine's sweep(hosts, timeout)
+#   resolve(ip)       reverse DNS for HostnameResolver(lookup=...)
+#   neighbor_table()  ARP/neighbor table for MacResolver(reader=...)
+#   counters()        per-NIC counters for TrafficSampler(reader=...)
+#   network_info()    segment details in the shape of get_local_network_info()
+#
+# `sweep_latency` is added to every sweep call and `probe_latency` per
+# address swept (a /24 of nmap -sn is a second or two on a real LAN),
+# `dns_latency` to every reverse lookup. Every answer of an up host is lost
+# with probability `loss`, independently per sweep, like dropped pings.
+# step() moves time forward: hosts come and go with probability `churn` and
+# NIC counters grow.
+import ipaddress
+import math
+import random
+import threading
+import time
+
+NICS = ('eth0', 'wlan0', 'lo')
+
+
+class SimulatedNetwork:
+    def __init__(self, hosts=1000, density=0.5, up_ratio=0.9, named_ratio=0.7, sweep_latency=0.0,
+                 probe_latency=0.0, dns_latency=0.0, loss=0.0, churn=0.01, seed=1):
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.sweep_latency = sweep_latency
+        self.probe_latency = probe_latency
+        self.dns_latency = dns_latency
+        self.loss = loss
+        self.churn = churn
+        self.up_ratio = up_ratio
+
+        # Smallest 10.x subnet that holds the hosts at the given density
+        prefix = min(30, 32 - math.ceil(math.log2(max(hosts / density, 4))))
+        self.network = ipaddress.ip_network(f"10.0.0.0/{prefix}")
+        self.cidr = str(self.network)
+        addresses = self.network.num_addresses - 2
+        first = int(self.network.network_address) + 1
+        offsets = self.rng.sample(range(addresses), min(hosts, addresses))
+        self.local_ip = str(ipaddress.ip_address(first + offsets[0]))
+        self.gateway_ip = str(ipaddress.ip_address(first))
+
+        self.hosts = {}  # ip -> [mac, hostname or None, up]
+        for index, offset in enumerate(offsets):
+            ip = str(ipaddress.ip_address(first + offset))
+            mac = f"02:00:{index >> 24 & 255:02x}:{index >> 16 & 255:02x}:{index >> 8 & 255:02x}:{index & 255:02x}"
+            hostname = f"host-{index}.lan" if self.rng.random() < named_ratio else None
+            self.hosts[ip] = [mac, hostname, self.rng.random() < up_ratio]
+        self.hosts[self.local_ip][2] = True
+
+        self.counter_values = {nic: [0, 0, 0, 0] for nic in NICS}
+        self.sweeps = 0
+        self.lookups = 0
+        self.lock = threading.Lock()
+
+    def up_hosts(self):
+        return [ip for ip, (_, _, up) in self.hosts.items() if up]
+
+    # Hosts come and go; NIC counters grow by `seconds` worth of traffic
+    def step(self, seconds=1.0):
+        for ip, host in self.hosts.items():
+            if ip != self.local_ip and self.rng.random() < self.churn:
+                host[2] = not host[2] if host[2] else self.rng.random() < self.up_ratio
+        with self.lock:
+            for nic, values in self.counter_values.items():
+                rate = 0 if nic == 'lo' else 1_000_000
+                values[0] += int(rate * seconds)
+                values[1] += int(rate * seconds / 1000)
+                values[2] += int(rate * seconds / 5)
+                values[3] += int(rate * seconds / 5000)
+
+    def network_info(self):
+        return {
+            'local_ip': self.local_ip,
+            'gateway_ip': self.gateway_ip,
+            'interface': 'eth0',
+            'netmask': str(self.network.netmask),
+            'cidr': self.cidr,
+            'hostname': 'simulated'
+        }
+
+    # Discovery backend: answers like NmapBackend.sweep()
+    def scanner(self):
+        return SimulatedScanner(self)
+
+    def resolve(self, ip):
+        if self.dns_latency:
+            time.sleep(self.dns_latency)
+        with self.lock:
+            self.lookups += 1
+        host = self.hosts.get(ip)
+        return host[1] if host else None
+
+    # Every up host the kernel has talked to recently, like /proc/net/arp
+    def neighbor_table(self):
+        return {ip: mac for ip, (mac, _, up) in self.hosts.items() if up}
+
+    def counters(self):
+        with self.lock:
+            return {nic: tuple(values) for nic, values in self.counter_values.items()}
+
+
+class SimulatedScanner:
+    def __init__(self, network):
+        self.network = network
+
+    def sweep(self, hosts, timeout=0):
+        network = self.network
+        with network.lock:
+            network.sweeps += 1
+            rng = random.Random(f"{network.seed}-{network.sweeps}")
+        if isinstance(hosts, str):
+            shard = ipaddress.ip_network(hosts, strict=False)
+            count = shard.num_addresses
+            first = int(shard.network_address)
+            candidates = (str(ipaddress.IPv4Address(first + i)) for i in range(count))
+        else:
+            count = len(hosts)
+            candidates = hosts
+        delay = network.sweep_latency + network.probe_latency * count
+        if delay:
+            time.sleep(delay)
+
+        results = []
+        for ip in candidates:
+            host = network.hosts.get(ip)
+            if host is None or not host[2]:
+                continue
+            if network.loss and rng.random() < network.loss:
+                continue
+            # nmap only reports MACs on the local segment as root; leave them to the neighbor table
+            results.append({'ip': ip, 'status': 'up', 'mac': 'Unknown'})
+        return results
@@ -0,0 +1,138 @@
+# Hammer the API from many threads while scans are running: device and
+# stats reads, scan requests and block/unblock. Checks that nothing
+# errors, scans of a segment never overlap, scan requests join the running
+# scan, and the thread count stays bounded.
+#
+# Runs against a fake discovery backend, so no root, nmap or firewall is needed.
+# A short version runs under pytest (tests/test_api_stress.py).
+#
+# Usage: python benchmarks/stress_api.py [seconds]
+import ipaddress
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from firewall import NullBackend  # noqa: E402
+
+CLIENTS = 16
+HOSTS = 2000
+
+
+# Slow fake sweep that also records how many sweeps of a segment overlap
+class FakeScanner:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.sweeps = 0
+
+    def sweep(self, hosts, timeout=0):
+        with self.lock:
+            self.active += 1
+            self.sweeps += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(0.05)
+            if isinstance(hosts, str):
+                hosts = [str(ip) for ip in ipaddress.ip_network(hosts).hosts()]
+            rng = random.Random()
+            return [{'ip': ip, 'status': 'up', 'mac': f"02:00:00:00:{i // 256 % 256:02x}:{i % 256:02x}"}
+                    for i, ip in enumerate(hosts) if rng.random() < 0.3]
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def client(stop, errors, counts):
+    test_client = app.app.test_client()
+    rng = random.Random()
+    while not stop.is_set():
+        roll = rng.random()
+        ip = f"10.99.{rng.randint(0, 7)}.{rng.randint(1, 250)}"
+        if roll < 0.4:
+            response = test_client.get('/api/devices')
+        elif roll < 0.55:
+            response = test_client.get(f"/api/devices?since={max(0, app.devices.version - 5)}")
+        elif roll < 0.75:
+            response = test_client.get('/api/stats')
+        elif roll < 0.8:
+            response = test_client.get('/api/scan')
+        elif roll < 0.9:
+            response = test_client.post('/api/block-device', json={'identifier': ip})
+        else:
+            response = test_client.post('/api/unblock-device', json={'identifier': ip})
+        counts[0] += 1
+        # Unknown devices answer 404, anything 5xx is a bug
+        if response.status_code >= 500:
+            errors.append((response.request.path, response.status_code))
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    scanner = FakeScanner()
+    app.make_discovery_backend = lambda network_info: scanner
+    app.hostname_resolver.lookup = lambda ip: None
+    app.firewall.backend = NullBackend()
+    app.scan_shard_prefix = 24
+    cidr = f"10.99.0.0/{32 - (HOSTS - 1).bit_length()}"
+    app.segments.add(app.Segment('stress', lambda: {
+        'local_ip': '10.99.0.1', 'gateway_ip': '10.99.0.254', 'interface': 'lo',
+        'netmask': 'Unknown', 'cidr': cidr, 'hostname': 'stress'
+    }))
+    segment = app.segments.get('stress')
+    app.scan_mode = 'full'
+
+    base_threads = threading.active_count()
+    stop = threading.Event()
+    errors = []
+    counts = [0]
+
+    # Background scan loop plus API clients
+    def scan_loop():
+        while not stop.is_set():
+            future, _ = app.scan_flight.submit(segment.name, app.scan_and_save, segment=segment)
+            future.result()
+
+    threads = [threading.Thread(target=scan_loop, daemon=True)]
+    threads += [threading.Thread(target=client, args=(stop, errors, counts), daemon=True) for _ in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+
+    max_threads = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        max_threads = max(max_threads, threading.active_count())
+        time.sleep(0.05)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=30)
+    elapsed = time.perf_counter() - start
+
+    shards = len(list(ipaddress.ip_network(cidr).subnets(new_prefix=24)))
+    print(f"{counts[0]} requests in {elapsed:.1f} s ({counts[0] / elapsed:.0f}/s) from {CLIENTS} clients")
+    print(f"{len(app.devices)} devices, registry version {app.devices.version}, {scanner.sweeps} shard sweeps")
+    print(f"max concurrent shard sweeps {scanner.max_active} (limit {min(app.scan_workers, shards)})")
+    print(f"threads: base {base_threads}, max {max_threads}")
+
+    assert not errors, errors[:10]
+    # Indexes still agree with the table
+    assert sum(len(ips) for ips in app.devices.by_segment.values()) == len(app.devices)
+    assert len(app.devices.snapshot()) == len(app.devices)
+    # Joined scan requests never start a second scan of the segment
+    assert scanner.max_active <= min(app.scan_workers, shards), scanner.max_active
+    # Clients, the scan loop, the background pool, one scan's shard workers,
+    # the DNS pool and a few single service threads (firewall, timers)
+    dns_workers = app.hostname_resolver.pool._max_workers
+    limit = base_threads + CLIENTS + 1 + app.background_workers + app.scan_workers + dns_workers + 4
+    assert max_threads <= limit, (max_threads, limit)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# Stress the kick scheduler: 1,000 kicks (with repeats) must not create more
+# than a bounded number of threads or child processes. A scaled-down version
+# runs under pytest (tests/test_kick_scheduler.py).
+#
+# Usage: python benchmarks/stress_kick.py
+import glob
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kick_scheduler import KickScheduler  # noqa: E402
+
+MAX_JOBS = 4
+
+
+# Direct children of this process, read from /proc (Linux only)
+def child_count():
+    children = set()
+    for path in glob.glob(f"/proc/{os.getpid()}/task/*/children"):
+        with open(path) as f:
+            children.update(f.read().split())
+    return len(children)
+
+
+def main():
+    expired = []
+    scheduler = KickScheduler(
+        on_expire=expired.append,
+        max_jobs=MAX_JOBS,
+        # Stand-in for arping: a short-lived real process
+        runner=lambda args: subprocess.run(['sleep', '0.01'])
+    )
+
+    base_threads = threading.active_count()
+    max_threads = max_children = 0
+    ips = [f"10.0.{i // 250}.{i % 250 + 1}" for i in range(800)]
+    kicks = ips + ips[:200]  # 1,000 kicks, 200 of them repeats
+
+    start = time.perf_counter()
+    for ip in kicks:
+        scheduler.submit(ip, [['arping', ip], ['arping', ip]])
+        scheduler.schedule(ip, 0.5)
+        max_threads = max(max_threads, threading.active_count())
+        max_children = max(max_children, child_count())
+
+    while scheduler.stats()['pending_unblocks'] or scheduler.stats()['running_jobs']:
+        max_threads = max(max_threads, threading.active_count())
+        max_children = max(max_children, child_count())
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(kicks)} kicks in {elapsed:.2f} s, {len(expired)} unblocks fired")
+    print(f"threads: base {base_threads}, max {max_threads}; max child processes {max_children}")
+    print(f"final queue: {scheduler.stats()}")
+
+    # One timer thread plus the bounded job pool
+    assert max_threads <= base_threads + 1 + MAX_JOBS, max_threads
+    assert max_children <= MAX_JOBS, max_children
+    # Repeated kicks are coalesced into a single unblock per device
+    assert len(expired) == len(ips), len(expired)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import threading
+
+
+# Runs at most one call per key at a time on a shared executor. A call for a
+# key that is already running joins it and gets the same future instead of
+# starting the work again.
+class SingleFlight:
+    def __init__(self, executor):
+        self.executor = executor
+        self.inflight = {}  # key -> future
+        self.lock = threading.Lock()
+
+    # Returns (future, joined)
+    def submit(self, key, fn, *args, **kwargs):
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is not None:
+                return future, True
+            future = self.executor.submit(fn, *args, **kwargs)
+            self.inflight[key] = future
+        # Outside the lock: a future that already finished runs this right here
+        future.add_done_callback(lambda f: self._done(key, f))
+        return future, False
+
+    def _done(self, key, future):
+        with self.lock:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+    def running(self, key):
+        with self.lock:
+            return key in self.inflight
+
+    def keys(self):
+        with self.lock:
+            return list(self.inflight)
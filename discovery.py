@@ -0,0 +1,104 @@
+import ipaddress
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+
+log = logging.getLogger(__name__)
+
+
+# Split a CIDR into shards of at most /shard_prefix so they can be swept in parallel
+def split_cidr(cidr, shard_prefix=24):
+    network = ipaddress.ip_network(cidr, strict=False)
+    if network.prefixlen >= shard_prefix:
+        return [network]
+    return list(network.subnets(new_prefix=shard_prefix))
+
+
+# Short description of a shard for log messages
+def shard_label(shard):
+    if isinstance(shard, list):
+        return f"{len(shard)} targets" if len(shard) != 1 else shard[0]
+    return str(shard)
+
+
+# Discovery backend that runs an nmap ping sweep through python-nmap
+class NmapBackend:
+    def __init__(self, arguments='-sn'):
+        # Imported here so fake backends (benchmarks) don't need nmap installed
+        import nmap
+        self.nmap = nmap
+        self.arguments = arguments
+
+    # Sweep one shard (a CIDR or a list of IPs) and return
+    # [{'ip', 'status', 'mac'}] for every host that answered
+    def sweep(self, hosts, timeout=0):
+        if not isinstance(hosts, str):
+            hosts = ' '.join(hosts)
+        nm = self.nmap.PortScanner()
+        nm.scan(hosts=hosts, arguments=self.arguments, timeout=timeout)
+
+        results = []
+        for host in nm.all_hosts():
+            results.append({
+                'ip': host,
+                'status': nm[host]['status']['state'],
+                # nmap only reports the MAC when running as root on the local segment
+                'mac': nm[host].get('addresses', {}).get('mac', 'Unknown')
+            })
+        return results
+
+
+# Sharded discovery engine: sweeps shards on a bounded worker pool and
+# reports each shard's hosts as soon as that shard finishes. `timer()` returns
+# a context manager wrapped around every backend sweep (e.g. a metrics timer).
+class DiscoveryEngine:
+    def __init__(self, backend, max_workers=8, shard_prefix=24, shard_timeout=120, timer=nullcontext):
+        self.backend = backend
+        self.max_workers = max(1, int(max_workers))
+        self.shard_prefix = shard_prefix
+        self.shard_timeout = shard_timeout
+        self.timer = timer
+
+    def _sweep_shard(self, shard):
+        with self.timer():
+            if isinstance(shard, list):
+                return self.backend.sweep(shard, timeout=self.shard_timeout)
+            return self.backend.sweep(str(shard), timeout=self.shard_timeout)
+
+    # Sweep the whole CIDR. on_shard(shard, hosts) is called from the calling
+    # thread for every shard that finishes, so callers can merge without locking.
+    # Returns (all_hosts, failed_shards).
+    def run(self, cidr, on_shard=None):
+        return self._run_shards(split_cidr(cidr, self.shard_prefix), on_shard)
+
+    # Probe only the given IPs, in batches of up to one shard's worth of
+    # addresses. Shards are lists of IPs here. Returns (all_hosts, failed_shards).
+    def run_targets(self, ips, on_shard=None):
+        ips = list(ips)
+        batch_size = 2 ** (32 - self.shard_prefix)
+        shards = [ips[i:i + batch_size] for i in range(0, len(ips), batch_size)]
+        if not shards:
+            return [], []
+        return self._run_shards(shards, on_shard)
+
+    def _run_shards(self, shards, on_shard):
+        all_hosts = []
+        failed_shards = []
+
+        workers = min(self.max_workers, len(shards))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='discovery') as pool:
+            futures = {pool.submit(self._sweep_shard, shard): index for index, shard in enumerate(shards)}
+            for future in as_completed(futures):
+                shard = shards[futures[future]]
+                try:
+                    hosts = future.result()
+                except Exception as e:
+                    log.error("Error scanning shard %s: %s", shard_label(shard), e)
+                    failed_shards.append(shard)
+                    continue
+
+                all_hosts.extend(hosts)
+                if on_shard:
+                    on_shard(shard, hosts)
+
+        return all_hosts, failed_shards
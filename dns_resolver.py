@@ -0,0 +1,100 @@
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+# Default reverse lookup, returns None when the address has no PTR record
+def reverse_lookup(ip):
+    try:
+        hostname, _, _ = socket.gethostbyaddr(ip)
+        return hostname
+    except (socket.herror, socket.gaierror, OSError):
+        return None
+
+
+# Concurrent reverse-DNS resolver with an LRU cache. Names are cached for
+# `positive_ttl` seconds and failures for `negative_ttl` seconds, so hosts
+# without PTR records are not looked up again on every scan. Lookups run on
+# a thread pool and never touch the process-wide socket timeout.
+class HostnameResolver:
+    def __init__(self, max_workers=32, positive_ttl=3600, negative_ttl=300,
+                 max_entries=10000, timeout=2.0, lookup=reverse_lookup):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.lookup = lookup
+        self.cache = OrderedDict()  # ip -> (hostname or None, expires_at)
+        self.pending = {}  # ip -> future for lookups still in flight
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dns')
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, ip, now):
+        entry = self.cache.get(ip)
+        if entry is None:
+            return False, None
+        if entry[1] < now:
+            del self.cache[ip]
+            return False, None
+        self.cache.move_to_end(ip)
+        return True, entry[0]
+
+    def _store(self, ip, future):
+        try:
+            hostname = future.result()
+        except Exception:
+            hostname = None
+        ttl = self.positive_ttl if hostname else self.negative_ttl
+        with self.lock:
+            self.pending.pop(ip, None)
+            self.cache[ip] = (hostname, time.monotonic() + ttl)
+            self.cache.move_to_end(ip)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+
+    # Resolve a batch of IPs at once. Returns {ip: hostname or None}; lookups
+    # that don't finish within the timeout return None now and are cached
+    # when they complete.
+    def resolve_many(self, ips):
+        results = {}
+        futures = {}
+        submitted = []
+        now = time.monotonic()
+
+        with self.lock:
+            for ip in ips:
+                found, hostname = self._cached(ip, now)
+                if found:
+                    self.hits += 1
+                    results[ip] = hostname
+                    continue
+
+                self.misses += 1
+                future = self.pending.get(ip)
+                if future is None:
+                    future = self.pool.submit(self.lookup, ip)
+                    self.pending[ip] = future
+                    submitted.append((ip, future))
+                futures[ip] = future
+
+        # Outside the lock: a lookup that already finished runs the callback
+        # right here, and _store takes the lock
+        for ip, future in submitted:
+            future.add_done_callback(lambda f, ip=ip: self._store(ip, f))
+
+        if futures:
+            wait(futures.values(), timeout=self.timeout)
+            for ip, future in futures.items():
+                if future.done() and not future.exception():
+                    results[ip] = future.result()
+                else:
+                    results[ip] = None
+
+        return results
+
+    def resolve(self, ip):
+        return self.resolve_many([ip])[ip]
@@ -0,0 +1,224 @@
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class EngineError(Exception):
+    pass
+
+
+# "host:port" is TCP (loopback only, for systems without Unix sockets),
+# anything else is a Unix socket path. The engine serves its state and
+# runs writes for anyone who connects, so other hosts are refused.
+def parse_address(address):
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit() and os.sep not in address:
+        host = host or '127.0.0.1'
+        if host != 'localhost':
+            try:
+                loopback = ipaddress.ip_address(host).is_loopback
+            except ValueError:
+                loopback = False
+            if not loopback:
+                raise ValueError(f"Engine address {address} is not on loopback")
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+def send_json(wfile, message):
+    wfile.write(json.dumps(message).encode() + b'\n')
+    wfile.flush()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline() or b'null')
+            if not isinstance(message, dict):
+                return
+            token = self.server.engine.token
+            if token and not hmac.compare_digest(str(message.get('token') or ''), token):
+                send_json(self.wfile, {'error': "Invalid engine token"})
+                return
+            if message.get('op') == 'subscribe':
+                self.server.engine.stream(self.wfile)
+            else:
+                self.server.engine.answer(message, self.wfile)
+        except (OSError, ValueError):
+            # Worker went away or sent garbage
+            pass
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TcpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+# Local socket the engine process serves its state on. Web workers either
+# subscribe (a snapshot followed by every event published on `event_bus`,
+# one JSON object per line) or make one call to a named handler per
+# connection ({"op": name, "args": [...]} -> {"result": ...} or {"error": ...}).
+# With a `token`, every request must carry it ({"token": ...}).
+class EngineServer:
+    def __init__(self, address, event_bus, snapshot, handlers, keepalive=15, mode=0o660, token=None):
+        self.address = address
+        self.event_bus = event_bus
+        self.snapshot = snapshot
+        self.handlers = handlers
+        self.keepalive = keepalive
+        self.mode = mode
+        self.token = token
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        family, target = parse_address(self.address)
+        if family == socket.AF_UNIX:
+            # Socket left behind by an engine that did not shut down cleanly
+            if os.path.exists(target):
+                os.unlink(target)
+            self.server = _UnixServer(target, _Handler)
+            os.chmod(target, self.mode)
+        else:
+            self.server = _TcpServer(target, _Handler)
+        self.server.engine = self
+        self.thread = threading.Thread(target=self.server.serve_forever, name='engine-server', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        family, target = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(target):
+            os.unlink(target)
+
+    # Snapshot, then events as they are published. A subscriber that falls
+    # behind the bus history gets a fresh snapshot instead of the missed events.
+    def stream(self, wfile):
+        seq = self.event_bus.seq
+        send_json(wfile, dict(self.snapshot(), type='snapshot'))
+        while True:
+            events, complete = self.event_bus.wait(seq, timeout=self.keepalive)
+            if not complete:
+                seq = self.event_bus.seq
+                send_json(wfile, dict(self.snapshot(), type='snapshot'))
+                continue
+            if not events:
+                send_json(wfile, {'type': 'ping'})
+                continue
+            # Payloads are already JSON, splice them in without decoding
+            wfile.write(''.join(
+                f'{{"type": {json.dumps(event_type)}, "data": {payload}}}\n'
+                for _, event_type, payload in events
+            ).encode())
+            wfile.flush()
+            seq = events[-1][0]
+
+    def answer(self, message, wfile):
+        handler = self.handlers.get(message.get('op'))
+        if handler is None:
+            send_json(wfile, {'error': f"Unknown operation {message.get('op')!r}"})
+            return
+        try:
+            reply = {'result': handler(*message.get('args', []))}
+        except Exception as e:
+            reply = {'error': str(e)}
+        send_json(wfile, reply)
+
+
+# Web worker side of the engine socket
+class EngineClient:
+    def __init__(self, address, timeout=30, retry_delay=1.0, keepalive=15, token=None):
+        self.address = address
+        self.token = token
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.keepalive = keepalive
+        self.ready = threading.Event()  # Set once the first snapshot was applied
+        self.connected = False
+        self.thread = None
+
+    def _connect(self, timeout):
+        family, target = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(target)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _request(self, op, **fields):
+        if self.token:
+            fields['token'] = self.token
+        return json.dumps(dict(fields, op=op)).encode() + b'\n'
+
+    # One call on its own connection (connecting to a local socket is cheap)
+    def call(self, op, *args):
+        with self._connect(self.timeout) as sock:
+            sock.sendall(self._request(op, args=args))
+            with sock.makefile('rb') as reader:
+                line = reader.readline()
+        if not line:
+            raise EngineError(f"Engine closed the connection during {op}")
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise EngineError(reply['error'])
+        return reply['result']
+
+    # Follow the engine's state on a background thread: `on_snapshot(message)`
+    # for every full snapshot (the first one, and after every reconnect) and
+    # `on_event(event_type, data)` for every event in between
+    def follow(self, on_snapshot, on_event):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._follow, args=(on_snapshot, on_event),
+                                       name='engine-follow', daemon=True)
+        self.thread.start()
+
+    def _follow(self, on_snapshot, on_event):
+        delay = 0.05
+        while True:
+            try:
+                # The engine pings every `keepalive` seconds, silence means it is gone
+                with self._connect(self.keepalive * 3) as sock:
+                    sock.sendall(self._request('subscribe'))
+                    with sock.makefile('rb') as reader:
+                        for line in reader:
+                            message = json.loads(line)
+                            message_type = message.get('type')
+                            if message_type == 'snapshot':
+                                on_snapshot(message)
+                                if not self.connected:
+                                    log.info("Following engine at %s", self.address)
+                                self.connected = True
+                                self.ready.set()
+                                delay = 0.05
+                            elif message_type is None:
+                                raise EngineError(message.get('error', "Unexpected message from engine"))
+                            elif message_type != 'ping':
+                                on_event(message_type, message['data'])
+                raise EngineError("Engine closed the connection")
+            except Exception as e:
+                # Connection trouble, or a callback failed: resync from a fresh snapshot
+                if self.connected:
+                    log.warning("Lost connection to engine at %s: %s", self.address, e)
+                self.connected = False
+            # Retry quickly while the engine is starting, then every `retry_delay`
+            time.sleep(delay)
+            delay = min(delay * 2, self.retry_delay)
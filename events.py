@@ -0,0 +1,45 @@
+import json
+import threading
+from collections import deque
+
+
+# In-memory event log for the push channel. Every event gets a sequence
+# number; subscribers resume from the last number they saw, and the last
+# `history` events are kept so short disconnects can be replayed.
+class EventBus:
+    def __init__(self, history=1000):
+        self.events = deque(maxlen=history)  # (seq, event_type, json payload)
+        self.seq = 0
+        self.condition = threading.Condition()
+
+    def publish(self, event_type, data):
+        payload = json.dumps(data)
+        with self.condition:
+            self.seq += 1
+            self.events.append((self.seq, event_type, payload))
+            self.condition.notify_all()
+            return self.seq
+
+    # Events after `seq`. Returns (events, complete); complete is False when
+    # some of them were already dropped and the subscriber must resync.
+    def since(self, seq):
+        with self.condition:
+            if seq == self.seq:
+                return [], True
+            if seq > self.seq:
+                # Sequence from before a restart
+                return [], False
+            oldest = self.events[0][0] if self.events else self.seq + 1
+            if seq < oldest - 1:
+                return [], False
+            return [event for event in self.events if event[0] > seq], True
+
+    # Block until there are events after `seq` or the timeout expires
+    def wait(self, seq, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq != seq, timeout=timeout)
+        return self.since(seq)
+
+
+def format_sse(seq, event_type, payload):
+    return f"id: {seq}\nevent: {event_type}\ndata: {payload}\n\n"
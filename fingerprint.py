@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+log = logging.getLogger(__name__)
+
+# Ports probed by default and the service usually behind them
+COMMON_PORTS = {
+    21: 'ftp', 22: 'ssh', 23: 'telnet', 25: 'smtp', 53: 'dns', 80: 'http',
+    110: 'pop3', 139: 'netbios', 143: 'imap', 443: 'https', 445: 'smb',
+    548: 'afp', 554: 'rtsp', 631: 'ipp', 1883: 'mqtt', 3306: 'mysql',
+    3389: 'rdp', 5000: 'upnp', 5900: 'vnc', 8008: 'http-alt', 8080: 'http-proxy',
+    8443: 'https-alt', 9100: 'jetdirect', 62078: 'iphone-sync'
+}
+
+# Protocols where the server talks first, so one short read names the software
+BANNER_PORTS = frozenset((21, 22, 23, 25, 110, 143, 3306))
+
+
+# TCP-connect one port. Returns None when closed/filtered, otherwise the
+# first line the server sent on a banner port ('' when there is none).
+async def probe_port(ip, port, timeout, read_banner=False):
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    banner = ''
+    try:
+        if read_banner:
+            try:
+                data = await asyncio.wait_for(reader.read(256), timeout)
+                lines = data.decode(errors='replace').strip().splitlines()
+                banner = lines[0][:100] if lines else ''
+            except (OSError, asyncio.TimeoutError):
+                pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+    return banner
+
+
+# Second-stage service discovery: TCP-connect probes of a host's common
+# ports from one asyncio loop on a background thread, at most `concurrency`
+# connections in flight. Results are cached per MAC (per IP when the MAC is
+# unknown) for `ttl` seconds, so a device is only probed again once it
+# expires, however often it drops off and comes back. `timer()` returns a
+# context manager wrapped around every probed batch.
+class ServiceProber:
+    def __init__(self, ports=None, concurrency=256, timeout=1.0, ttl=86400,
+                 batch_size=256, max_entries=10000, on_results=None, timer=nullcontext):
+        self.ports = dict(ports or COMMON_PORTS)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.max_entries = max_entries
+        self.on_results = on_results
+        self.timer = timer
+        self.cache = {}  # MAC or IP -> (services, expires_at)
+        self.queue = deque()  # (ip, cache key) waiting to be probed
+        self.pending = set()  # IPs queued or being probed
+        self.condition = threading.Condition()
+        self.thread = None
+        self.probed = 0
+        self.cache_hits = 0
+
+    @staticmethod
+    def cache_key(ip, mac):
+        return mac if mac and mac != 'Unknown' else ip
+
+    def _cached(self, key, now):
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        if entry[1] < now:
+            del self.cache[key]
+            return None
+        return entry[0]
+
+    # Queue [(ip, mac)] for probing. Hosts with a fresh cache entry are not
+    # probed again; returns {ip: services} for them.
+    def submit(self, hosts):
+        hits = {}
+        now = time.monotonic()
+        with self.condition:
+            for ip, mac in hosts:
+                key = self.cache_key(ip, mac)
+                services = self._cached(key, now)
+                if services is not None:
+                    self.cache_hits += 1
+                    hits[ip] = services
+                    continue
+                if ip not in self.pending:
+                    self.pending.add(ip)
+                    self.queue.append((ip, key))
+            if self.queue:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name='service-prober', daemon=True)
+                    self.thread.start()
+                self.condition.notify()
+        return hits
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.queue)
+                batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+
+            try:
+                with self.timer():
+                    results = loop.run_until_complete(self.probe_many([ip for ip, _ in batch]))
+            except Exception as e:
+                log.error("Error probing services: %s", e)
+                results = {}
+
+            expires = time.monotonic() + self.ttl
+            with self.condition:
+                for ip, key in batch:
+                    self.pending.discard(ip)
+                    if ip in results:
+                        self.cache[key] = (results[ip], expires)
+                if len(self.cache) > self.max_entries:
+                    # Keep the entries that expire last
+                    newest = sorted(self.cache.items(), key=lambda item: item[1][1])[-self.max_entries:]
+                    self.cache = dict(newest)
+                self.probed += len(results)
+
+            if results and self.on_results:
+                try:
+                    self.on_results(results)
+                except Exception as e:
+                    log.error("Error applying service probe results: %s", e)
+
+    # Probe every port of every IP. Returns {ip: [{'port', 'service', 'banner'?}]}
+    # with the open ports of each host, in port order.
+    async def probe_many(self, ips):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def probe(ip, port):
+            async with semaphore:
+                return await probe_port(ip, port, self.timeout, port in BANNER_PORTS)
+
+        ports = sorted(self.ports)
+        answers = await asyncio.gather(*(probe(ip, port) for ip in ips for port in ports))
+        results = {}
+        for index, ip in enumerate(ips):
+            services = []
+            for port, banner in zip(ports, answers[index * len(ports):(index + 1) * len(ports)]):
+                if banner is None:
+                    continue
+                service = {'port': port, 'service': self.ports[port]}
+                if banner:
+                    service['banner'] = banner
+                services.append(service)
+            results[ip] = services
+        return results
+
+    # Blocking probe of a list of IPs, bypassing the queue and cache
+    def probe(self, ips):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.probe_many(list(ips)))
+        finally:
+            loop.close()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'queued': len(self.queue),
+                'cached': len(self.cache),
+                'probed': self.probed,
+                'cache_hits': self.cache_hits
+            }
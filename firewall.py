@@ -0,0 +1,268 @@
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from contextlib import nullcontext
+
+log = logging.getLogger(__name__)
+
+TABLE = 'network_guardian'
+SET_NAME = 'ng_blocked'
+
+
+class FirewallError(Exception):
+    pass
+
+
+# Runs firewall commands. Swap it for a fake to test without root.
+class CommandRunner:
+    def __init__(self, use_sudo=None):
+        if use_sudo is None:
+            use_sudo = os.name == 'posix' and os.geteuid() != 0
+        self.use_sudo = use_sudo
+
+    def run(self, args, input=None):
+        if self.use_sudo:
+            args = ['sudo', '-n'] + list(args)
+        result = subprocess.run(args, input=input, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise FirewallError(f"{' '.join(args)} failed: {result.stderr.strip()}")
+        return result.stdout
+
+
+# nftables: blocked addresses live in one named set matched by three rules,
+# so kernel matching is a set lookup however many devices are blocked.
+# Each change is one `nft -f -` transaction.
+class NftablesBackend:
+    name = 'nftables'
+
+    def __init__(self, runner):
+        self.runner = runner
+
+    # Recreate the table atomically so restarts don't duplicate rules
+    def setup(self):
+        self.runner.run(['nft', '-f', '-'], input=(
+            f"table inet {TABLE}\n"
+            f"delete table inet {TABLE}\n"
+            f"table inet {TABLE} {{\n"
+            f"  set {SET_NAME} {{ type ipv4_addr; }}\n"
+            f"  chain input {{ type filter hook input priority 0; ip saddr @{SET_NAME} drop; }}\n"
+            f"  chain output {{ type filter hook output priority 0; ip daddr @{SET_NAME} drop; }}\n"
+            f"  chain forward {{ type filter hook forward priority 0; "
+            f"ip saddr @{SET_NAME} drop; ip daddr @{SET_NAME} drop; }}\n"
+            f"}}\n"
+        ))
+
+    def apply(self, add, remove):
+        lines = []
+        if add:
+            lines.append(f"add element inet {TABLE} {SET_NAME} {{ {', '.join(sorted(add))} }}")
+        if remove:
+            # Deleting a missing element fails the whole batch, so re-add first
+            lines.append(f"add element inet {TABLE} {SET_NAME} {{ {', '.join(sorted(remove))} }}")
+            lines.append(f"delete element inet {TABLE} {SET_NAME} {{ {', '.join(sorted(remove))} }}")
+        if lines:
+            self.runner.run(['nft', '-f', '-'], input='\n'.join(lines) + '\n')
+
+    def replace(self, ips):
+        lines = [f"flush set inet {TABLE} {SET_NAME}"]
+        if ips:
+            lines.append(f"add element inet {TABLE} {SET_NAME} {{ {', '.join(sorted(ips))} }}")
+        self.runner.run(['nft', '-f', '-'], input='\n'.join(lines) + '\n')
+
+
+# ipset + iptables: one hash:ip set referenced by a fixed set of rules;
+# changes go through a single `ipset restore`
+class IpsetBackend:
+    name = 'ipset'
+
+    RULES = (
+        ['INPUT', '-m', 'set', '--match-set', SET_NAME, 'src', '-j', 'DROP'],
+        ['OUTPUT', '-m', 'set', '--match-set', SET_NAME, 'dst', '-j', 'DROP'],
+        ['FORWARD', '-m', 'set', '--match-set', SET_NAME, 'src', '-j', 'DROP'],
+        ['FORWARD', '-m', 'set', '--match-set', SET_NAME, 'dst', '-j', 'DROP'],
+    )
+
+    def __init__(self, runner):
+        self.runner = runner
+
+    def setup(self):
+        self.runner.run(['ipset', 'restore', '-exist'], input=f"create {SET_NAME} hash:ip\n")
+        for rule in self.RULES:
+            try:
+                self.runner.run(['iptables', '-C'] + rule)
+            except FirewallError:
+                self.runner.run(['iptables', '-I'] + rule)
+
+    def apply(self, add, remove):
+        lines = [f"add {SET_NAME} {ip}" for ip in sorted(add)]
+        lines += [f"del {SET_NAME} {ip}" for ip in sorted(remove)]
+        if lines:
+            self.runner.run(['ipset', 'restore', '-exist'], input='\n'.join(lines) + '\n')
+
+    def replace(self, ips):
+        # Build a new set and swap it in atomically
+        tmp = f"{SET_NAME}_new"
+        lines = [f"create {tmp} hash:ip", f"flush {tmp}"]
+        lines += [f"add {tmp} {ip}" for ip in sorted(ips)]
+        lines += [f"swap {tmp} {SET_NAME}", f"destroy {tmp}"]
+        self.runner.run(['ipset', 'restore', '-exist'], input='\n'.join(lines) + '\n')
+
+
+# Windows Firewall: one inbound and one outbound rule whose remoteip list is
+# rewritten on every change
+class WindowsFirewallBackend:
+    name = 'windows_firewall'
+    RULE = 'NetworkGuardian_Block'
+
+    def __init__(self, runner):
+        self.runner = runner
+        self.current = set()
+
+    def setup(self):
+        pass
+
+    def apply(self, add, remove):
+        self.replace((self.current | set(add)) - set(remove))
+
+    def replace(self, ips):
+        for direction in ('in', 'out'):
+            name = f"{self.RULE}_{direction}"
+            try:
+                self.runner.run(['netsh', 'advfirewall', 'firewall', 'delete', 'rule', f"name={name}"])
+            except FirewallError:
+                pass  # Rule did not exist yet
+            if ips:
+                self.runner.run(['netsh', 'advfirewall', 'firewall', 'add', 'rule', f"name={name}",
+                                 f"dir={direction}", 'action=block', f"remoteip={','.join(sorted(ips))}"])
+        self.current = set(ips)
+
+
+# Used when no supported firewall tool is available
+class NullBackend:
+    name = 'none'
+
+    def setup(self):
+        log.warning("No supported firewall (nft, ipset/iptables, netsh) found; blocking is app-level only")
+
+    def apply(self, add, remove):
+        pass
+
+    def replace(self, ips):
+        pass
+
+
+# Pick the best available backend without spawning any processes
+def detect_backend(runner=None):
+    runner = runner or CommandRunner()
+    if os.name == 'nt':
+        return WindowsFirewallBackend(runner)
+    if shutil.which('nft'):
+        return NftablesBackend(runner)
+    if shutil.which('ipset') and shutil.which('iptables'):
+        return IpsetBackend(runner)
+    return NullBackend()
+
+
+# Desired-state firewall. block()/unblock() queue changes; a single worker
+# applies everything queued so far in one transaction, so a burst of calls
+# costs one command instead of several per device. Commands run outside
+# `lock`, so callers only wait to queue their change; `apply_lock` keeps
+# commands serialized. `timer()` returns a context manager wrapped around
+# every firewall command (e.g. a metrics timer).
+class Firewall:
+    def __init__(self, backend, batch_delay=0.05, timer=nullcontext):
+        self.backend = backend
+        self.batch_delay = batch_delay
+        self.timer = timer
+        self.desired = set()
+        self.pending_add = set()
+        self.pending_remove = set()
+        self.ready = False
+        self.lock = threading.Lock()
+        self.apply_lock = threading.Lock()  # Held while a command runs; taken before `lock`
+        self.wakeup = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.thread = None
+
+    @property
+    def name(self):
+        return self.backend.name
+
+    def _ensure_setup(self):
+        if not self.ready:
+            self.backend.setup()
+            self.ready = True
+
+    def _start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._worker, name='firewall', daemon=True)
+            self.thread.start()
+
+    def block(self, ips):
+        with self.lock:
+            for ip in ips:
+                self.desired.add(ip)
+                self.pending_remove.discard(ip)
+                self.pending_add.add(ip)
+            self.idle.clear()
+            self._start()
+        self.wakeup.set()
+
+    def unblock(self, ips):
+        with self.lock:
+            for ip in ips:
+                self.desired.discard(ip)
+                self.pending_add.discard(ip)
+                self.pending_remove.add(ip)
+            self.idle.clear()
+            self._start()
+        self.wakeup.set()
+
+    # Wait until queued changes have been applied
+    def flush(self, timeout=None):
+        return self.idle.wait(timeout)
+
+    # Make the kernel state match `ips` exactly, in one transaction
+    def reconcile(self, ips):
+        with self.apply_lock:
+            with self.lock:
+                self.desired = set(ips)
+                self.pending_add.clear()
+                self.pending_remove.clear()
+                desired = set(self.desired)
+            try:
+                self._ensure_setup()
+                with self.timer():
+                    self.backend.replace(desired)
+            except (FirewallError, OSError) as e:
+                log.error("Error reconciling firewall: %s", e)
+
+    def _worker(self):
+        while True:
+            self.wakeup.wait()
+            # Give a burst of calls a moment to pile up
+            self.wakeup.clear()
+            if self.batch_delay:
+                time.sleep(self.batch_delay)
+
+            # Take the batch and apply it without a reconcile in between,
+            # but let block()/unblock() queue more while the command runs
+            with self.apply_lock:
+                with self.lock:
+                    add, self.pending_add = self.pending_add, set()
+                    remove, self.pending_remove = self.pending_remove, set()
+                if add or remove:
+                    try:
+                        self._ensure_setup()
+                        with self.timer():
+                            self.backend.apply(add, remove)
+                        log.info("Firewall (%s): blocked %d, unblocked %d", self.name, len(add), len(remove))
+                    except (FirewallError, OSError) as e:
+                        log.error("Error applying firewall changes: %s", e)
+            with self.lock:
+                if not (self.pending_add or self.pending_remove):
+                    self.idle.set()
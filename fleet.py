@@ -0,0 +1,355 @@
+import gzip
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import zlib
+from bisect import bisect_right
+from collections import deque
+
+from listing import ip_sort_key
+from registry import DeviceRegistry
+from traffic_store import TrafficStore, format_timestamp
+
+log = logging.getLogger(__name__)
+
+PUSH_PATH = '/api/fleet/push'
+
+
+class FleetError(Exception):
+    def __init__(self, message, status=400, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+# Decompress and parse a pushed batch, refusing bodies that inflate past
+# `max_bytes` (compressed bombs) before they are fully expanded
+def decode_push(data, encoding, max_bytes):
+    if encoding == 'gzip':
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            data = decompressor.decompress(data, max_bytes)
+        except zlib.error as e:
+            raise FleetError(f"Bad gzip body: {e}")
+        if decompressor.unconsumed_tail:
+            raise FleetError("Push too large", 413)
+    elif encoding:
+        raise FleetError(f"Unsupported encoding {encoding}", 415)
+    if len(data) > max_bytes:
+        raise FleetError("Push too large", 413)
+    try:
+        payload = json.loads(data)
+    except ValueError as e:
+        raise FleetError(f"Bad JSON: {e}")
+    if not isinstance(payload, dict) or not payload.get('site') or not payload.get('instance'):
+        raise FleetError("Push needs a site and an instance")
+    return payload
+
+
+# Sensor side: pushes this instance's device changes, traffic samples and
+# stats to a collector every `interval` seconds, gzipped. Device changes are
+# read from the registry's change log after the version the collector last
+# acknowledged, so an outage costs one delta of the latest state of every
+# changed device, not a queue of every update. Traffic samples wait in a
+# bounded buffer (oldest dropped). After an outage the backlog goes out in
+# pages of `batch_size` records back to back; a collector that is busy
+# answers 503/429 with Retry-After and the sensor waits, otherwise failures
+# back off exponentially up to `max_backoff`. A 409 (the collector lost
+# track, e.g. it restarted) triggers a full resync from version 0.
+class FleetSender:
+    def __init__(self, url, site, registry, stats=lambda: None, token=None, interval=10,
+                 batch_size=2000, max_samples=8640, timeout=30, max_backoff=300):
+        self.url = url.rstrip('/') + PUSH_PATH
+        self.site = site
+        self.registry = registry
+        self.stats_fn = stats
+        self.token = token
+        self.interval = interval
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.instance = uuid.uuid4().hex  # New on every start, so the collector sees restarts
+        self.acked_version = None  # None until the first (full) push is acknowledged
+        self.samples = deque(maxlen=max_samples)  # (seq, timestamp, down, up, recv, sent)
+        self.sample_seq = 0
+        self.acked_sample = 0
+        self.dropped_samples = 0
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.stopped = False
+        self.pushes = 0
+        self.failures = 0
+        self.last_push = None
+        self.last_error = None
+
+    def queue_sample(self, timestamp, download_rate, upload_rate, bytes_recv, bytes_sent):
+        with self.lock:
+            if len(self.samples) == self.samples.maxlen:
+                self.dropped_samples += 1
+            self.sample_seq += 1
+            self.samples.append((self.sample_seq, timestamp, download_rate, upload_rate, bytes_recv, bytes_sent))
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='fleet-sender', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.wake.set()
+
+    def _run(self):
+        delay = 0
+        failures = 0
+        while not self.stopped:
+            if delay:
+                self.wake.wait(delay)
+                self.wake.clear()
+                if self.stopped:
+                    return
+            try:
+                more = self.push_once()
+                failures = 0
+                delay = 0 if more else self.interval
+            except FleetError as e:
+                self.failures += 1
+                self.last_error = str(e)
+                if e.status in (429, 503):
+                    # Told when to come back; jitter spreads sensors that reconnect together
+                    delay = (e.retry_after or self.interval) * random.uniform(1.0, 1.5)
+                    log.info("Collector busy, retrying in %.1f s", delay)
+                else:
+                    failures += 1
+                    delay = min(self.interval * 2 ** (failures - 1), self.max_backoff) * random.uniform(0.5, 1.0)
+                    log.warning("Fleet push failed (%s), retrying in %.0f s", e, delay)
+
+    # Build and send one batch. Returns True when more is waiting (send the
+    # next page right away).
+    def push_once(self):
+        reset = self.acked_version is None
+        base = 0 if reset else self.acked_version
+        records, removed, reached, more = self.registry.changes_page(base, self.batch_size)
+        with self.lock:
+            samples = [sample for sample in self.samples if sample[0] > self.acked_sample][:self.batch_size]
+        payload = {
+            'site': self.site,
+            'instance': self.instance,
+            'base': base,
+            'version': reached,
+            'reset': reset,
+            'devices': records,
+            'removed': removed,
+            'samples': samples,
+            'stats': self.stats_fn()
+        }
+        answer = self._post(payload)
+        if answer.get('resync'):
+            log.info("Collector asked for a full resync of site %s", self.site)
+            self.acked_version = None
+            return True
+
+        self.acked_version = answer['version']
+        acked_sample = answer.get('sample', 0)
+        with self.lock:
+            self.acked_sample = acked_sample
+            while self.samples and self.samples[0][0] <= acked_sample:
+                self.samples.popleft()
+            more_samples = bool(self.samples)
+        self.pushes += 1
+        self.last_push = time.time()
+        self.last_error = None
+        return more or (more_samples and len(samples) == self.batch_size)
+
+    def _post(self, payload):
+        body = gzip.compress(json.dumps(payload, separators=(',', ':')).encode(), compresslevel=6)
+        headers = {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+        if self.token:
+            headers['X-Fleet-Token'] = self.token
+        request = urllib.request.Request(self.url, data=body, headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 409:
+                return {'resync': True}
+            try:
+                retry_after = float(e.headers.get('Retry-After', self.interval))
+            except ValueError:
+                retry_after = self.interval
+            raise FleetError(f"HTTP {e.code} from collector", e.code, retry_after)
+        except (OSError, ValueError) as e:
+            raise FleetError(f"Collector unreachable: {e}", 0)
+
+    def stats(self):
+        with self.lock:
+            pending_samples = len(self.samples)
+        return {
+            'url': self.url,
+            'site': self.site,
+            'acked_version': self.acked_version,
+            'local_version': self.registry.version,
+            'pending_samples': pending_samples,
+            'dropped_samples': self.dropped_samples,
+            'pushes': self.pushes,
+            'failures': self.failures,
+            'last_push': format_timestamp(self.last_push) if self.last_push else None,
+            'last_error': self.last_error
+        }
+
+
+# One sensor's view on the collector: its own registry (mirrored with the
+# sensor's version numbers), traffic history and latest stats
+class Site:
+    def __init__(self, name):
+        self.name = name
+        self.registry = DeviceRegistry()
+        self.traffic = TrafficStore()
+        self.instance = None
+        self.sample = 0  # Last traffic sample sequence number applied
+        self.stats = None
+        self.last_push = None
+        self.lock = threading.Lock()  # Serializes pushes of this site
+        self._sorted = (-1, [], [])  # (version, sort keys, records) for paging
+
+    def sorted_devices(self):
+        version = self.registry.version
+        if self._sorted[0] != version:
+            records = sorted(self.registry.snapshot(), key=lambda record: ip_sort_key(record['ip']))
+            self._sorted = (version, [ip_sort_key(record['ip']) for record in records], records)
+        return self._sorted[1], self._sorted[2]
+
+
+# Collector side: a registry per site (so pushes from different sites never
+# contend on one lock), fed by sensor pushes. At most `max_inflight` pushes
+# are applied at once; the rest are turned away with 503 and Retry-After so
+# a fleet reconnecting after an outage drains at the collector's pace.
+class FleetCollector:
+    def __init__(self, max_inflight=4, max_push_bytes=64 << 20, retry_after=5, stale_after=60):
+        self.sites = {}
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_inflight)
+        self.max_push_bytes = max_push_bytes
+        self.retry_after = retry_after
+        self.stale_after = stale_after
+        self.rejected = 0
+        self.pushes = 0
+
+    def site(self, name):
+        with self.lock:
+            site = self.sites.get(name)
+            if site is None:
+                site = self.sites[name] = Site(name)
+            return site
+
+    # Handle one HTTP push body. Returns (status, body, headers).
+    def handle_push(self, data, encoding, token=None, expected_token=None):
+        if expected_token and not hmac.compare_digest(token or '', expected_token):
+            return 403, {'status': 'error', 'message': 'Bad fleet token'}, {}
+        if not self.slots.acquire(blocking=False):
+            self.rejected += 1
+            retry = self.retry_after * random.uniform(0.5, 1.5)
+            return 503, {'status': 'error', 'message': 'Collector busy'}, {'Retry-After': f"{retry:.0f}"}
+        try:
+            answer = self.ingest(decode_push(data, encoding, self.max_push_bytes))
+            return (409 if answer.get('resync') else 200), answer, {}
+        except FleetError as e:
+            return e.status, {'status': 'error', 'message': str(e)}, {}
+        finally:
+            self.slots.release()
+
+    # Apply a decoded push. A delta must start at the version the collector
+    # has for the site from the same sensor instance; anything else gets
+    # {'resync': True} (HTTP 409) and the sensor starts over.
+    def ingest(self, payload):
+        site = self.site(payload['site'])
+        with site.lock:
+            if payload.get('reset'):
+                site.instance = payload['instance']
+                site.sample = 0
+                site._sorted = (-1, [], [])  # Versions start over with a new instance
+                site.registry.sync(payload.get('devices', ()), payload.get('removed', ()),
+                                   version=payload['version'], reset=True)
+            elif payload['instance'] != site.instance or payload.get('base') != site.registry.version:
+                return {'resync': True, 'version': site.registry.version}
+            else:
+                site.registry.sync(payload.get('devices', ()), payload.get('removed', ()), version=payload['version'])
+
+            for seq, timestamp, download_rate, upload_rate, bytes_recv, bytes_sent in payload.get('samples', ()):
+                # Samples re-sent after a lost acknowledgement are skipped
+                if seq > site.sample:
+                    site.traffic.add_sample(download_rate, upload_rate, bytes_recv, bytes_sent, timestamp=timestamp)
+                    site.sample = seq
+            if payload.get('stats') is not None:
+                site.stats = payload['stats']
+            site.last_push = time.time()
+            self.pushes += 1
+            return {'version': site.registry.version, 'sample': site.sample}
+
+    def site_names(self):
+        with self.lock:
+            return sorted(self.sites)
+
+    # One page of the fleet's devices ordered by site, then IP. The cursor is
+    # the last "site|ip" returned; the next cursor is None after the last page.
+    def page(self, cursor=None, limit=500, site=None, status=None):
+        after_site = after_ip = None
+        if cursor:
+            after_site, _, after_ip = cursor.rpartition('|')
+        names = [site] if site is not None else self.site_names()
+        items = []
+        for name in names:
+            if after_site is not None and name < after_site:
+                continue
+            with self.lock:
+                current = self.sites.get(name)
+            if current is None:
+                continue
+            keys, records = current.sorted_devices()
+            start = bisect_right(keys, ip_sort_key(after_ip)) if name == after_site else 0
+            for record in records[start:]:
+                if status is not None and record['status'] != status:
+                    continue
+                items.append(dict(record, site=name))
+                if len(items) >= limit:
+                    return items, f"{name}|{record['ip']}"
+        return items, None
+
+    # Per-site device counts, sensor stats and freshness, plus fleet totals
+    def summary(self):
+        now = time.time()
+        sites = []
+        totals = {'sites': 0, 'online_sites': 0, 'total_devices': 0, 'active_devices': 0,
+                  'blocked_devices': 0, 'download_rate': 0.0, 'upload_rate': 0.0}
+        for name in self.site_names():
+            site = self.sites[name]
+            records = site.registry.snapshot()
+            online = site.last_push is not None and now - site.last_push < self.stale_after
+            traffic = site.traffic.last()
+            entry = {
+                'site': name,
+                'online': online,
+                'last_push': format_timestamp(site.last_push) if site.last_push else None,
+                'version': site.registry.version,
+                'total_devices': len(records),
+                'active_devices': sum(1 for record in records if record['status'] == 'up'),
+                'blocked_devices': sum(1 for record in records if record['blocked']),
+                'download_rate': traffic['download_rate'] if traffic else 0.0,
+                'upload_rate': traffic['upload_rate'] if traffic else 0.0,
+                'stats': site.stats
+            }
+            sites.append(entry)
+            totals['sites'] += 1
+            totals['online_sites'] += online
+            for field in ('total_devices', 'active_devices', 'blocked_devices'):
+                totals[field] += entry[field]
+            if online:
+                totals['download_rate'] += entry['download_rate']
+                totals['upload_rate'] += entry['upload_rate']
+        return {'totals': totals, 'sites': sites, 'pushes': self.pushes, 'rejected': self.rejected}
@@ -0,0 +1,63 @@
+import gzip
+import json
+import threading
+
+from flask import Response, request
+
+GZIP_MIN_SIZE = 1024  # bytes; smaller bodies are sent uncompressed
+
+
+# Keeps the last serialized (and gzipped) body for each endpoint so repeated
+# polls of an unchanged resource skip both JSON encoding and compression
+class ResponseCache:
+    def __init__(self):
+        self.entries = {}  # key -> (etag, raw body, gzipped body or None)
+        self.lock = threading.Lock()
+
+    def get(self, key, etag, build):
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and entry[0] == etag:
+            return entry[1], entry[2]
+
+        raw = json.dumps(build()).encode()
+        compressed = gzip.compress(raw, compresslevel=5) if len(raw) >= GZIP_MIN_SIZE else None
+        with self.lock:
+            self.entries[key] = (etag, raw, compressed)
+        return raw, compressed
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+# JSON response with a weak ETag: answers If-None-Match with 304, reuses the
+# cached body while the ETag is unchanged and gzips large bodies when the
+# client accepts it. `build` is only called when the body must be rebuilt.
+def conditional_json(key, etag, build, cacheable=True, headers=None):
+    extra_headers = dict(headers or {})
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304, headers=extra_headers)
+        response.set_etag(etag, weak=True)
+        return response
+
+    if cacheable:
+        raw, compressed = response_cache.get(key, etag, build)
+    else:
+        raw = json.dumps(build()).encode()
+        compressed = gzip.compress(raw, compresslevel=5) if len(raw) >= GZIP_MIN_SIZE else None
+
+    response = Response(mimetype='application/json', headers=extra_headers)
+    if compressed is not None and request.accept_encodings['gzip']:
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response.set_data(raw)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag, weak=True)
+    return response
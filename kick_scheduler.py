@@ -0,0 +1,103 @@
+import heapq
+import logging
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+
+def run_command(args):
+    subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+
+
+# Owns every pending kick: one timer thread keeps the unblock deadlines in a
+# heap, and a bounded pool runs the arping jobs. Kicking a device that is
+# already pending just moves its deadline and doesn't start another job.
+class KickScheduler:
+    def __init__(self, on_expire, max_jobs=4, runner=run_command):
+        self.on_expire = on_expire
+        self.runner = runner
+        self.heap = []  # (deadline, key); stale entries are skipped when popped
+        self.deadlines = {}  # key -> current deadline
+        self.jobs = set()  # keys with a queued or running job
+        self.running = 0
+        self.condition = threading.Condition()
+        self.pool = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix='kick')
+        self.thread = None
+
+    def _start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._timer, name='kick-timer', daemon=True)
+            self.thread.start()
+
+    # Call on_expire(key) after `delay` seconds. Returns False when the key
+    # was already pending (its deadline is extended instead).
+    def schedule(self, key, delay):
+        deadline = time.monotonic() + delay
+        with self.condition:
+            coalesced = key in self.deadlines
+            self.deadlines[key] = deadline
+            heapq.heappush(self.heap, (deadline, key))
+            self._start()
+            self.condition.notify()
+        return not coalesced
+
+    def cancel(self, key):
+        with self.condition:
+            return self.deadlines.pop(key, None) is not None
+
+    # Run a list of commands for `key` on the bounded pool. Returns False
+    # when a job for that key is already queued or running.
+    def submit(self, key, commands):
+        with self.condition:
+            if key in self.jobs:
+                return False
+            self.jobs.add(key)
+        self.pool.submit(self._run_job, key, commands)
+        return True
+
+    def _run_job(self, key, commands):
+        with self.condition:
+            self.running += 1
+        try:
+            for args in commands:
+                self.runner(args)
+        except Exception as e:
+            log.error("Error running kick job for %s: %s", key, e)
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.jobs.discard(key)
+
+    def _timer(self):
+        while True:
+            with self.condition:
+                while True:
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    deadline, key = self.heap[0]
+                    if self.deadlines.get(key) != deadline:
+                        heapq.heappop(self.heap)  # Cancelled or extended
+                        continue
+                    wait = deadline - time.monotonic()
+                    if wait <= 0:
+                        heapq.heappop(self.heap)
+                        del self.deadlines[key]
+                        break
+                    self.condition.wait(wait)
+
+            try:
+                self.on_expire(key)
+            except Exception as e:
+                log.error("Error expiring kick for %s: %s", key, e)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'pending_unblocks': len(self.deadlines),
+                'queued_jobs': len(self.jobs) - self.running,
+                'running_jobs': self.running
+            }
@@ -0,0 +1,313 @@
+import heapq
+import socket
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+
+SORT_FIELDS = ('ip', 'hostname', 'last_seen', 'status')
+SEARCH_FIELDS = ('hostname', 'ip', 'mac')
+MAX_CACHED_QUERIES = 32
+SPLICE_MIN = 32  # More edits than this to one list are spliced in one pass instead of made one by one
+REWRITE_FRACTION = 8  # Edits to more than 1/8 of a list rewrite and re-sort it instead
+SPLICE_RUNS = 64  # Untouched stretches longer than 1/64 of a list are left in place by a splice
+LAST_SEEN = SORT_FIELDS.index('last_seen')
+
+
+# Sort key for IPs: numeric, IPv4 before IPv6, anything unparsable first.
+# inet_pton is several times faster than ipaddress for rebuilding indexes.
+def ip_sort_key(ip):
+    for version, family in ((4, socket.AF_INET), (6, socket.AF_INET6)):
+        try:
+            return (version, int.from_bytes(socket.inet_pton(family, ip), 'big'), ip)
+        except (OSError, TypeError):
+            continue
+    return (0, 0, ip)
+
+
+# Index keys are plain strings: the field value, NUL, then the IP as a
+# version digit, 32 hex digits and the address itself. They compare like
+# (value, ip_sort_key(ip)), are unique per device, and strings are neither
+# walked by the garbage collector nor re-hashed, which keeps re-indexing a
+# whole table after a full scan cheap.
+def ip_key(ip):
+    version, number, _ = ip_sort_key(ip)
+    return f"{version}{number:032x}{ip}"
+
+
+def sort_key(field, value, ip_part):
+    if field == 'ip':
+        value = ''
+    elif field == 'hostname':
+        value = (value or '').lower()
+    return f"{value or ''}\0{ip_part}"
+
+
+def key_ip(key):
+    return key.rpartition('\0')[2][33:]
+
+
+def search_texts(device):
+    return ((device.hostname or '').lower(), device.ip, (device.mac or '').lower())
+
+
+# Page cursor: the sort field value and IP of the last device of a page
+def make_cursor(field, key):
+    value, _, ip_part = key.rpartition('\0')
+    return ip_part[33:] if field == 'ip' else f"{value}|{ip_part[33:]}"
+
+
+def parse_cursor(field, cursor):
+    value, _, ip = cursor.rpartition('|')
+    return sort_key(field, value, ip_key(ip))
+
+
+class Partition:
+    __slots__ = ('keys', 'blocked')
+
+    def __init__(self):
+        self.keys = {field: [] for field in SORT_FIELDS}  # field -> sorted keys
+        self.blocked = 0
+
+
+# Sorted indexes over the device table for paged listings. Devices are
+# partitioned by (segment, status), each partition holding one sorted key
+# list per sort field, so a status or segment filter picks partitions and
+# the total is a sum of their lengths. A page bisects to the cursor in each
+# picked partition and merges them, which costs the same on any table size.
+# Hostname, IP and MAC prefixes are found by bisecting sorted "text\0ip"
+# lists. Queries that only match a few devices (a search, blocked=true) are
+# sorted once and cached until the index changes.
+class DeviceIndex:
+    def __init__(self, devices=(), version=0):
+        self.version = version
+        self.partitions = {}  # (segment, status) -> Partition
+        self.entries = {}  # ip -> (partition key, blocked, [key per sort field], search texts)
+        self.search = {field: [] for field in SEARCH_FIELDS}  # field -> sorted "text\0ip"
+        self.blocked = set()
+        self.queries = OrderedDict()  # query -> sorted keys of every match
+
+        for device in devices:
+            self._add(device, list.append)
+        for partition in self.partitions.values():
+            for keys in partition.keys.values():
+                keys.sort()
+        for entries in self.search.values():
+            entries.sort()
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Index a device, adding its keys to each list with `add(list, key)`
+    def _add(self, device, add):
+        ip_part = ip_key(device.ip)
+        partition_key = (device.segment, device.status)
+        keys = [sort_key(field, getattr(device, field), ip_part) for field in SORT_FIELDS]
+        texts = search_texts(device)
+        self.entries[device.ip] = (partition_key, device.blocked, keys, texts)
+
+        partition = self.partitions.get(partition_key)
+        if partition is None:
+            partition = self.partitions[partition_key] = Partition()
+        for field, key in zip(SORT_FIELDS, keys):
+            add(partition.keys[field], key)
+        for field, text in zip(SEARCH_FIELDS, texts):
+            add(self.search[field], f"{text}\0{device.ip}")
+        if device.blocked:
+            partition.blocked += 1
+            self.blocked.add(device.ip)
+
+    def _remove(self, ip, edits):
+        partition_key, blocked, keys, texts = self.entries.pop(ip)
+        partition = self.partitions[partition_key]
+        for field, key in zip(SORT_FIELDS, keys):
+            edits.discard(partition.keys[field], key)
+        for field, text in zip(SEARCH_FIELDS, texts):
+            edits.discard(self.search[field], f"{text}\0{ip}")
+        if blocked:
+            partition.blocked -= 1
+            self.blocked.discard(ip)
+
+    # Re-index devices from [(ip, device or None when it was removed)]. Only
+    # the lists of partitions (and search fields) the changes touch are
+    # edited; see Edits.
+    def update(self, changes):
+        self.queries.clear()
+        edits = Edits()
+        for ip, device in changes:
+            entry = self.entries.get(ip)
+            if entry is not None and device is not None:
+                partition_key, blocked, keys, texts = entry
+                if partition_key == (device.segment, device.status) and blocked == device.blocked \
+                        and texts == search_texts(device):
+                    # Same status, hostname, IP and MAC: only last_seen can have moved
+                    key = keys[LAST_SEEN]
+                    new_key = sort_key('last_seen', device.last_seen, key.rpartition('\0')[2])
+                    if new_key != key:
+                        last_seen_keys = self.partitions[partition_key].keys['last_seen']
+                        edits.discard(last_seen_keys, key)
+                        edits.add(last_seen_keys, new_key)
+                        keys[LAST_SEEN] = new_key
+                    continue
+            if entry is not None:
+                self._remove(ip, edits)
+            if device is not None:
+                self._add(device, edits.add)
+        edits.apply()
+        for partition_key in [key for key, partition in self.partitions.items() if not partition.keys['ip']]:
+            del self.partitions[partition_key]
+
+    def _select(self, status, segment):
+        return [partition for (partition_segment, partition_status), partition in self.partitions.items()
+                if (status is None or partition_status in status)
+                and (segment is None or partition_segment == segment)]
+
+    # Sorted keys of every device matching a prefix search and/or the
+    # blocked flag, cached until the index changes
+    def _matches(self, field, status, segment, blocked, prefix):
+        query = (field, status, segment, blocked, prefix)
+        keys = self.queries.get(query)
+        if keys is not None:
+            self.queries.move_to_end(query)
+            return keys
+
+        if prefix:
+            ips = set()
+            for entries in self.search.values():
+                start = bisect_left(entries, prefix)
+                for entry in entries[start:bisect_left(entries, prefix + '\uffff', start)]:
+                    ips.add(entry.rpartition('\0')[2])
+        else:
+            ips = self.blocked
+        position = SORT_FIELDS.index(field)
+        keys = []
+        for ip in ips:
+            (partition_segment, partition_status), device_blocked, device_keys, _ = self.entries[ip]
+            if ((status is None or partition_status in status) and (segment is None or partition_segment == segment)
+                    and (blocked is None or device_blocked == blocked)):
+                keys.append(device_keys[position])
+        keys.sort()
+
+        self.queries[query] = keys
+        while len(self.queries) > MAX_CACHED_QUERIES:
+            self.queries.popitem(last=False)
+        return keys
+
+    # One page of keys after `cursor` (a key, None for the first page).
+    # `status` is a frozenset of statuses or None; `blocked` True/False/None.
+    # Returns (keys, more, total matching).
+    def page(self, field, descending=False, cursor=None, limit=100, status=None, segment=None,
+             blocked=None, prefix=None):
+        if prefix or blocked:
+            lists = [self._matches(field, status, segment, blocked, prefix)]
+            total = len(lists[0])
+            skip_blocked = False
+        else:
+            partitions = self._select(status, segment)
+            lists = [partition.keys[field] for partition in partitions]
+            total = sum(len(partition.keys['ip']) for partition in partitions)
+            skip_blocked = blocked is False
+            if skip_blocked:
+                total -= sum(partition.blocked for partition in partitions)
+
+        runs = [_run(keys, cursor, descending) for keys in lists if keys]
+        merged = runs[0] if len(runs) == 1 else heapq.merge(*runs, reverse=descending)
+        keys = []
+        for key in merged:
+            if skip_blocked and key_ip(key) in self.blocked:
+                continue
+            if len(keys) == limit:
+                return keys, True, total
+            keys.append(key)
+        return keys, False, total
+
+
+# Changes to sorted key lists, collected per list and applied together. A
+# list with a few edits gets them in place (insort, bisect and delete);
+# with more, the new list is spliced together in one pass from slices of
+# the old one around the edit points, so a shard's worth of changes to a
+# 100k-device partition costs about as much as the edits, not a sort. Only
+# when much of a list changed (a full scan) is it filtered and re-sorted.
+class Edits:
+    def __init__(self):
+        self.lists = {}  # id(list) -> (list, removed keys, added keys)
+
+    def _pending(self, keys):
+        pending = self.lists.get(id(keys))
+        if pending is None:
+            pending = self.lists[id(keys)] = (keys, set(), [])
+        return pending
+
+    def add(self, keys, key):
+        self._pending(keys)[2].append(key)
+
+    def discard(self, keys, key):
+        self._pending(keys)[1].add(key)
+
+    def apply(self):
+        for keys, removed, added in self.lists.values():
+            # A key removed and added back (a device moved to another
+            # partition keeps its search keys) stays where it is
+            unchanged = removed.intersection(added)
+            if unchanged:
+                removed -= unchanged
+                added = [key for key in added if key not in unchanged]
+            edits = len(removed) + len(added)
+            if edits > len(keys) // REWRITE_FRACTION:
+                if removed:
+                    keys[:] = [key for key in keys if key not in removed]
+                keys.extend(added)
+                keys.sort()
+                continue
+            if edits > SPLICE_MIN:
+                _splice(keys, removed, added)
+                continue
+            for key in removed:
+                index = bisect_left(keys, key)
+                if index < len(keys) and keys[index] == key:
+                    del keys[index]
+            for key in added:
+                insort(keys, key)
+        self.lists.clear()
+
+
+# Replace sorted `keys` in place with keys - removed + added. Edit points
+# more than 1/SPLICE_RUNS of the list apart are spliced as separate runs,
+# last first so earlier indexes stay valid; the keys between runs are
+# only shifted, not copied.
+def _splice(keys, removed, added):
+    added = sorted(added)
+    positions = [bisect_left(keys, key) for key in added]
+    drops = sorted(index for index in (bisect_left(keys, key) for key in removed)
+                   if index < len(keys) and keys[index] in removed)
+    runs = []
+    gap = len(keys) // SPLICE_RUNS
+    for point in sorted(positions + drops):
+        if runs and point - runs[-1][1] <= gap:
+            runs[-1][1] = point
+        else:
+            runs.append([point, point])
+
+    for low, high in reversed(runs):
+        high = min(high + 1, len(keys))
+        spliced = []
+        start = low
+        pending = bisect_left(positions, low)  # Next added key in this run
+        for stop in drops[bisect_left(drops, low):bisect_left(drops, high)] + [high]:
+            # Added keys go before the key at their position, which may be dropped
+            while pending < len(added) and positions[pending] <= stop:
+                position = positions[pending]
+                spliced.extend(keys[start:position])
+                spliced.append(added[pending])
+                start = position
+                pending += 1
+            spliced.extend(keys[start:stop])
+            start = stop + 1
+        keys[low:high] = spliced
+
+
+# Keys after the cursor in sort order, read in place
+def _run(keys, cursor, descending):
+    if descending:
+        end = len(keys) if cursor is None else bisect_left(keys, cursor)
+        return (keys[i] for i in range(end - 1, -1, -1))
+    start = 0 if cursor is None else bisect_right(keys, cursor)
+    return (keys[i] for i in range(start, len(keys)))
@@ -0,0 +1,52 @@
+import logging
+import threading
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+# Lets each message template (the format string, before its arguments are
+# filled in) through at most `rate` times per `period` seconds. The first
+# message of the next period says how many were dropped, so a scan that
+# finds thousands of hosts logs a handful of lines instead of one per host.
+class RateLimitFilter(logging.Filter):
+    def __init__(self, rate=20, period=1.0, max_templates=1000):
+        super().__init__()
+        self.rate = rate
+        self.period = period
+        self.max_templates = max_templates
+        self.windows = {}  # (logger, template) -> [window start, passed, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = record.created
+        with self.lock:
+            window = self.windows.get(key)
+            if window is not None and now - window[0] < self.period:
+                if window[1] < self.rate:
+                    window[1] += 1
+                    return True
+                window[2] += 1
+                return False
+
+            suppressed = window[2] if window is not None else 0
+            if window is None and len(self.windows) >= self.max_templates:
+                # Forget templates whose window is over
+                self.windows = {k: w for k, w in self.windows.items() if now - w[0] < self.period}
+            self.windows[key] = [now, 1, 0]
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+        return True
+
+
+# Log to stderr at `level`, rate limited per message template. Safe to call
+# more than once (e.g. from every web worker's create_app()).
+def setup_logging(level='INFO', rate=20, period=1.0):
+    root = logging.getLogger()
+    root.setLevel(level)
+    if any(isinstance(f, RateLimitFilter) for handler in root.handlers for f in handler.filters):
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(RateLimitFilter(rate, period))
+    root.addHandler(handler)
@@ -0,0 +1,109 @@
+import logging
+import os
+import subprocess
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+PROC_NET_ARP = '/proc/net/arp'
+INCOMPLETE_MACS = ('00:00:00:00:00:00', '(incomplete)', '')
+
+
+# Parse /proc/net/arp into {ip: mac}
+def parse_proc_net_arp(text):
+    table = {}
+    for line in text.splitlines()[1:]:
+        parts = line.split()
+        if len(parts) < 4:
+            continue
+        ip, flags, mac = parts[0], parts[2], parts[3].lower()
+        # Flags 0x0 means the entry is incomplete
+        if flags == '0x0' or mac in INCOMPLETE_MACS:
+            continue
+        table[ip] = mac
+    return table
+
+
+# Parse `ip neigh show` output into {ip: mac}
+def parse_ip_neigh(text):
+    table = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if 'lladdr' not in parts or 'FAILED' in parts:
+            continue
+        mac = parts[parts.index('lladdr') + 1].lower()
+        if mac not in INCOMPLETE_MACS:
+            table[parts[0]] = mac
+    return table
+
+
+# Parse Windows `arp -a` output into {ip: mac}
+def parse_arp_a(text):
+    table = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].count('.') == 3 and parts[1].count('-') == 5:
+            table[parts[0]] = parts[1].replace('-', ':').lower()
+    return table
+
+
+# Read the whole kernel neighbor table with a single file read or command
+def read_neighbor_table():
+    if os.name == 'posix':
+        if os.path.exists(PROC_NET_ARP):
+            with open(PROC_NET_ARP) as f:
+                return parse_proc_net_arp(f.read())
+        try:
+            output = subprocess.check_output(['ip', 'neigh', 'show'], stderr=subprocess.DEVNULL)
+            return parse_ip_neigh(output.decode())
+        except (OSError, subprocess.CalledProcessError):
+            # macOS / BSD have no `ip`, fall back to one bulk `arp -an`
+            output = subprocess.check_output(['arp', '-an'], stderr=subprocess.DEVNULL).decode()
+            table = {}
+            for line in output.splitlines():
+                parts = line.split()
+                if len(parts) >= 4 and parts[1].startswith('('):
+                    mac = parts[3].lower()
+                    if mac not in INCOMPLETE_MACS:
+                        table[parts[1].strip('()')] = mac
+            return table
+    elif os.name == 'nt':
+        return parse_arp_a(subprocess.check_output(['arp', '-a']).decode(errors='ignore'))
+    return {}
+
+
+# IP -> MAC index built from the neighbor table, with entries kept for `ttl`
+# seconds after they were last seen so devices that briefly drop out of the
+# kernel table keep their MAC between scans
+class MacResolver:
+    def __init__(self, ttl=600, reader=read_neighbor_table):
+        self.ttl = ttl
+        self.reader = reader
+        self.entries = {}  # ip -> (mac, last_seen)
+        self.lock = threading.Lock()
+
+    # Re-read the neighbor table once and refresh the index
+    def refresh(self):
+        try:
+            table = self.reader()
+        except Exception as e:
+            log.error("Error reading neighbor table: %s", e)
+            return
+
+        now = time.monotonic()
+        with self.lock:
+            for ip, mac in table.items():
+                self.entries[ip] = (mac, now)
+
+            # Drop entries that have not been seen within the TTL
+            expired = [ip for ip, (_, seen) in self.entries.items() if now - seen > self.ttl]
+            for ip in expired:
+                del self.entries[ip]
+
+    # O(1) lookup, returns 'Unknown' when the MAC is not known
+    def lookup(self, ip):
+        entry = self.entries.get(ip)
+        if entry is None:
+            return 'Unknown'
+        return entry[0]
@@ -0,0 +1,186 @@
+import bisect
+import functools
+import math
+import threading
+import time
+
+# Seconds, from a single neighbor table read up to a full sweep of a large subnet
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _label_key(labels):
+    if len(labels) < 2:
+        return tuple(labels.items())
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in key) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+# Base for the metric types: one value per label set, updated under a
+# short per-metric lock so instrumented hot paths stay cheap
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}  # label key -> value
+        self.lock = threading.Lock()
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value in self.samples():
+            lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+# A gauge is either set by the code it describes, or computed by `fn` only
+# when the metrics are scraped. `fn` returns a number, or {value of `label`:
+# number} for one sample per label value.
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help, fn=None, label=None):
+        super().__init__(name, help)
+        self.fn = fn
+        self.label = label
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def samples(self):
+        if self.fn is None:
+            return super().samples()
+        value = self.fn()
+        if isinstance(value, dict):
+            return [(self.name, ((self.label, label_value),), number) for label_value, number in value.items()]
+        return [(self.name, (), value)]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+# Cumulative histogram with fixed buckets (Prometheus `le` semantics)
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # label key -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    # Context manager timing a block in seconds
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    # Decorator timing every call of a function
+    def timed(self, **labels):
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with _Timer(self, labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def samples(self):
+        with self.lock:
+            entries = [(key, list(entry)) for key, entry in self.values.items()]
+        samples = []
+        for key, entry in entries:
+            total = 0
+            for bound, count in zip(self.buckets + (math.inf,), entry):
+                total += count
+                samples.append((f"{self.name}_bucket", key + (('le', _format_value(float(bound))),), total))
+            samples.append((f"{self.name}_sum", key, entry[-1]))
+            samples.append((f"{self.name}_count", key, total))
+        return samples
+
+
+# Set of metrics rendered together in the Prometheus text format
+class MetricsRegistry:
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _add(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Duplicate metric {metric.name}")
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help):
+        return self._add(Counter(name, help))
+
+    def gauge(self, name, help, fn=None, label=None):
+        return self._add(Gauge(name, help, fn, label))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, buckets))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # One broken gauge callback must not take down the endpoint
+                lines.append(f"# {metric.name} unavailable: {e}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,118 @@
+import logging
+import os
+import socket
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+PROC_NET_ROUTE = '/proc/net/route'
+
+# rtnetlink multicast groups (linux/rtnetlink.h)
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+NETLINK_ROUTE = 0
+
+
+# Caches the local interface snapshot and recomputes it only when the kernel
+# reports an address or route change. get() is a plain attribute read; the
+# watcher thread does all the work. `version` goes up on every change.
+# cached() keeps snapshots of other interfaces (configured segments) until
+# the next kernel change, whichever interface it touched.
+class NetworkInfoProvider:
+    def __init__(self, compute, poll_interval=5.0, debounce=0.5):
+        self.compute = compute
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.snapshot = None
+        self.version = 0
+        self.generation = 0  # Bumped on every refresh, i.e. every kernel change
+        self.others = {}  # key -> (generation, snapshot)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def get(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            snapshot = self.refresh()
+        return snapshot
+
+    # Recompute the snapshot, bumping the version only if it changed
+    def refresh(self):
+        with self.lock:
+            self.generation += 1
+            snapshot = self.compute()
+            if snapshot != self.snapshot:
+                self.snapshot = snapshot
+                self.version += 1
+                log.info("Local Network Info (v%d): %s", self.version, snapshot)
+            return self.snapshot
+
+    # Snapshot computed by `compute()` for `key`, reused until the next
+    # refresh. Errors are not cached.
+    def cached(self, key, compute):
+        generation = self.generation
+        entry = self.others.get(key)
+        if entry is not None and entry[0] == generation:
+            return entry[1]
+        snapshot = compute()
+        self.others[key] = (generation, snapshot)
+        return snapshot
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._watch, name='netinfo-watcher', daemon=True)
+        self.thread.start()
+
+    def _watch(self):
+        try:
+            self._watch_netlink()
+        except (AttributeError, OSError) as e:
+            # No netlink (non-Linux or restricted sandbox), fall back to polling
+            log.warning("Netlink unavailable (%s), polling for network changes", e)
+            self._watch_poll()
+
+    # Block on rtnetlink notifications, refreshing after a burst settles
+    def _watch_netlink(self):
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+        try:
+            while True:
+                sock.settimeout(None)
+                sock.recv(65536)
+
+                # Drain the rest of the burst (an address change emits several messages)
+                sock.settimeout(self.debounce)
+                try:
+                    while True:
+                        sock.recv(65536)
+                except socket.timeout:
+                    pass
+
+                self.refresh()
+        finally:
+            sock.close()
+
+    # Cheap change check: compare the routing table text (or the full
+    # snapshot where /proc is missing) every poll_interval seconds
+    def _watch_poll(self):
+        last_routes = read_route_table()
+        while True:
+            time.sleep(self.poll_interval)
+            if last_routes is None:
+                self.refresh()
+                continue
+            routes = read_route_table()
+            if routes != last_routes:
+                last_routes = routes
+                self.refresh()
+
+
+def read_route_table():
+    if not os.path.exists(PROC_NET_ROUTE):
+        return None
+    with open(PROC_NET_ROUTE) as f:
+        return f.read()
+
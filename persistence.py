@@ -0,0 +1,139 @@
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    ip TEXT PRIMARY KEY,
+    hostname TEXT,
+    status TEXT,
+    last_seen TEXT,
+    first_seen TEXT,
+    mac TEXT,
+    vendor TEXT,
+    blocked INTEGER,
+    is_local INTEGER,
+    blocking_method TEXT,
+    segment TEXT,
+    services TEXT
+);
+CREATE TABLE IF NOT EXISTS blocked (
+    identifier TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS traffic (
+    timestamp REAL PRIMARY KEY,
+    download_rate REAL,
+    upload_rate REAL,
+    bytes_recv REAL,
+    bytes_sent REAL
+);
+"""
+
+DEVICE_COLUMNS = (
+    'ip', 'hostname', 'status', 'last_seen', 'first_seen',
+    'mac', 'vendor', 'blocked', 'is_local', 'blocking_method', 'segment', 'services'
+)
+
+# Columns added after the first release, with their types
+ADDED_COLUMNS = (('segment', 'TEXT'), ('services', 'TEXT'))
+
+
+# SQLite (WAL mode) store for the device table, blocked list and traffic
+# samples. Traffic samples are queued in memory and written in one
+# transaction per flush() so the background task does a single commit per
+# iteration.
+class StateStore:
+    def __init__(self, path, traffic_retention=7 * 86400):
+        self.path = path
+        self.traffic_retention = traffic_retention
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.lock = threading.Lock()
+        self.pending_samples = []
+
+    # Add columns introduced after a database was created
+    def _migrate(self):
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(devices)')}
+        for column, column_type in ADDED_COLUMNS:
+            if column not in columns:
+                with self.conn:
+                    self.conn.execute(f"ALTER TABLE devices ADD COLUMN {column} {column_type}")
+
+    def load_devices(self):
+        with self.lock:
+            rows = self.conn.execute(f"SELECT {', '.join(DEVICE_COLUMNS)} FROM devices").fetchall()
+        devices = []
+        for row in rows:
+            device = dict(zip(DEVICE_COLUMNS, row))
+            device['blocked'] = bool(device['blocked'])
+            device['is_local'] = bool(device['is_local'])
+            device['services'] = json.loads(device['services']) if device['services'] else None
+            # Neither up nor down until a scan sees it (or not); the scan's
+            # result is compared with the saved status for presence events
+            device['saved_status'] = device['status']
+            device['status'] = 'unknown'
+            devices.append(device)
+        return devices
+
+    def load_blocked(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute('SELECT identifier FROM blocked')]
+
+    # Traffic samples since `since`, averaged into `bucket`-second groups so a
+    # week of history replays quickly into the in-memory store
+    def load_traffic(self, since, bucket=60):
+        with self.lock:
+            return self.conn.execute(
+                'SELECT MAX(timestamp), AVG(download_rate), AVG(upload_rate), MAX(bytes_recv), MAX(bytes_sent) '
+                'FROM traffic WHERE timestamp >= ? GROUP BY CAST(timestamp / ? AS INTEGER) ORDER BY 1',
+                (since, bucket)
+            ).fetchall()
+
+    # Upsert device dicts in one transaction. A device not scanned since it
+    # was loaded ('unknown') keeps the status it was saved with.
+    def save_devices(self, devices):
+        if not devices:
+            return
+        # Lists (services) are stored as JSON text
+        rows = [
+            tuple(json.dumps(value) if isinstance(value, list) else value
+                  for value in (device.get(column) for column in DEVICE_COLUMNS))
+            for device in devices
+        ]
+        placeholders = ', '.join('?' for _ in DEVICE_COLUMNS)
+        updates = ', '.join(f"{column} = excluded.{column}" for column in DEVICE_COLUMNS
+                            if column not in ('ip', 'status'))
+        with self.lock, self.conn:
+            self.conn.executemany(
+                f"INSERT INTO devices ({', '.join(DEVICE_COLUMNS)}) VALUES ({placeholders}) "
+                f"ON CONFLICT(ip) DO UPDATE SET {updates}, "
+                "status = CASE excluded.status WHEN 'unknown' THEN devices.status ELSE excluded.status END", rows
+            )
+
+    def save_blocked(self, identifiers):
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM blocked')
+            self.conn.executemany('INSERT OR IGNORE INTO blocked VALUES (?)', [(i,) for i in identifiers])
+
+    def queue_sample(self, timestamp, download_rate, upload_rate, bytes_recv, bytes_sent):
+        with self.lock:
+            self.pending_samples.append((timestamp, download_rate, upload_rate, bytes_recv, bytes_sent))
+
+    # Write queued samples and drop traffic older than the retention window
+    def flush(self):
+        with self.lock:
+            samples, self.pending_samples = self.pending_samples, []
+            if not samples:
+                return
+            with self.conn:
+                self.conn.executemany('INSERT OR REPLACE INTO traffic VALUES (?, ?, ?, ?, ?)', samples)
+                self.conn.execute('DELETE FROM traffic WHERE timestamp < ?', (time.time() - self.traffic_retention,))
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
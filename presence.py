@@ -0,0 +1,430 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+EVENT_TYPES = ('joined', 'left', 'ip_changed', 'mac_changed', 'hostname_changed')
+
+# Events counted as flaps: the device came or went
+FLAP_TYPES = frozenset(('joined', 'left'))
+
+# Every SPARSE_EVERY-th event of a segment goes into its time index
+SPARSE_EVERY = 64
+
+
+class PresenceError(Exception):
+    pass
+
+
+# Identifiers an event is indexed under: its IP and MAC, plus the previous
+# IP/MAC for ip_changed/mac_changed so both old and new addresses find it
+def event_keys(event):
+    _, event_type, ip, mac, old, _ = event
+    keys = {ip}
+    if mac and mac != 'Unknown':
+        keys.add(mac)
+    if event_type in ('ip_changed', 'mac_changed') and old and old != 'Unknown':
+        keys.add(old)
+    return keys
+
+
+# The device an event counts towards for flapping: its MAC when known, so a
+# device that changes IP is still one device
+def flap_key(event):
+    mac = event[3]
+    return mac if mac and mac != 'Unknown' else event[2]
+
+
+def event_to_dict(event):
+    timestamp, event_type, ip, mac, old, new = event
+    return {
+        'timestamp': timestamp,
+        'time': datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S"),
+        'type': event_type,
+        'ip': ip,
+        'mac': mac,
+        'old': old,
+        'new': new
+    }
+
+
+# Sorted event times (and line offsets) per key. While a segment is written
+# every key has its own arrays; when it is sealed they are packed into one
+# flat array each, key i owning entries starts[i]:starts[i + 1]. The packed
+# form is what is saved and loaded, so opening a log does not build
+# thousands of small arrays.
+class KeyedIndex:
+    def __init__(self, with_offsets=True):
+        self.with_offsets = with_offsets
+        self.growing = {}  # key -> (array('d') times, array('q') offsets)
+        self.positions = {}  # key -> i once packed
+        self.starts = array('q', [0])
+        self.times = array('d')
+        self.offsets = array('q')
+
+    def add(self, key, timestamp, offset=0):
+        entry = self.growing.get(key)
+        if entry is None:
+            entry = self.growing[key] = (array('d'), array('q'))
+        entry[0].append(timestamp)
+        if self.with_offsets:
+            entry[1].append(offset)
+
+    # (times, offsets, start, end) of a key, or None
+    def lookup(self, key):
+        i = self.positions.get(key)
+        if i is not None:
+            return self.times, self.offsets, self.starts[i], self.starts[i + 1]
+        entry = self.growing.get(key)
+        if entry is None:
+            return None
+        return entry[0], entry[1], 0, len(entry[0])
+
+    # Number of entries of every key between since and until
+    def counts(self, since, until):
+        counts = {}
+        times, starts = self.times, self.starts
+        for key, i in self.positions.items():
+            start, end = starts[i], starts[i + 1]
+            count = bisect_right(times, until, start, end) - bisect_left(times, since, start, end)
+            if count:
+                counts[key] = count
+        for key, (times, _) in self.growing.items():
+            count = bisect_right(times, until) - bisect_left(times, since)
+            if count:
+                counts[key] = counts.get(key, 0) + count
+        return counts
+
+    def pack(self):
+        for key, (times, offsets) in self.growing.items():
+            self.positions[key] = len(self.starts) - 1
+            self.times.extend(times)
+            self.offsets.extend(offsets)
+            self.starts.append(len(self.times))
+        self.growing = {}
+
+    # Keys are IPs and MACs, so they can be joined with newlines
+    def header(self):
+        return {'keys': '\n'.join(self.positions), 'length': len(self.times)}
+
+    def columns(self):
+        return (self.starts, self.times, self.offsets) if self.with_offsets else (self.starts, self.times)
+
+    def load(self, header, take):
+        keys = header['keys'].split('\n') if header['keys'] else []
+        self.positions = dict(zip(keys, range(len(keys))))
+        self.starts = take('q', len(keys) + 1)
+        self.times = take('d', header['length'])
+        if self.with_offsets:
+            self.offsets = take('q', header['length'])
+
+
+# One file of the log plus its indexes. Events are stored one compact JSON
+# array per line; the indexes hold (time, byte offset) pairs in time order,
+# so a query bisects to the matching events and reads only those lines.
+class LogSegment:
+    def __init__(self, directory, seq):
+        self.seq = seq
+        self.path = os.path.join(directory, f"{seq:010d}.log")
+        self.index_path = os.path.join(directory, f"{seq:010d}.idx")
+        self.first = None
+        self.last = None
+        self.count = 0
+        self.size = 0
+        self.sparse_times = array('d')  # Time index: every SPARSE_EVERY-th event
+        self.sparse_offsets = array('q')
+        self.devices = KeyedIndex()  # IP or MAC -> event times and line offsets
+        self.flaps = KeyedIndex(with_offsets=False)  # flap_key -> joined/left times
+
+    def add(self, event, offset):
+        timestamp = event[0]
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+        if self.count % SPARSE_EVERY == 0:
+            self.sparse_times.append(timestamp)
+            self.sparse_offsets.append(offset)
+        self.count += 1
+        for key in event_keys(event):
+            self.devices.add(key, timestamp, offset)
+        if event[1] in FLAP_TYPES:
+            self.flaps.add(flap_key(event), timestamp)
+
+    def overlaps(self, since, until):
+        return self.first is not None and self.last >= since and self.first <= until
+
+    # Rebuild the indexes by reading the log (a segment that was not sealed,
+    # e.g. after a crash). A torn last line is skipped.
+    def scan(self):
+        offset = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    self.add(tuple(json.loads(line)), offset)
+                except (ValueError, TypeError):
+                    log.warning("Skipping damaged presence event at %s:%d", self.path, offset)
+                offset += len(line)
+        self.size = offset
+
+    # Pack the indexes and write them next to the log: one JSON header line,
+    # then the raw arrays in header order
+    def save_index(self):
+        self.devices.pack()
+        self.flaps.pack()
+        header = {
+            'first': self.first, 'last': self.last, 'count': self.count, 'size': self.size,
+            'sparse': len(self.sparse_times), 'devices': self.devices.header(), 'flaps': self.flaps.header()
+        }
+        temporary = self.index_path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(json.dumps(header, separators=(',', ':')).encode() + b'\n')
+            for column in (self.sparse_times, self.sparse_offsets) + self.devices.columns() + self.flaps.columns():
+                column.tofile(f)
+        os.replace(temporary, self.index_path)
+
+    def load_index(self):
+        with open(self.index_path, 'rb') as f:
+            header = json.loads(f.readline())
+            data = memoryview(f.read())
+        position = 0
+
+        def take(typecode, length):
+            nonlocal position
+            column = array(typecode)
+            end = position + length * column.itemsize
+            column.frombytes(data[position:end])
+            position = end
+            return column
+
+        self.first, self.last = header['first'], header['last']
+        self.count, self.size = header['count'], header['size']
+        self.sparse_times = take('d', header['sparse'])
+        self.sparse_offsets = take('q', header['sparse'])
+        self.devices.load(header['devices'], take)
+        self.flaps.load(header['flaps'], take)
+        if position != len(data):
+            raise ValueError(f"Truncated index {self.index_path}")
+
+    # Events of one identifier between since and until, oldest first
+    def read_device(self, key, since, until):
+        entry = self.devices.lookup(key)
+        if entry is None:
+            return []
+        times, offsets, start, end = entry
+        start, end = bisect_left(times, since, start, end), bisect_right(times, until, start, end)
+        events = []
+        if start < end:
+            with open(self.path, 'rb') as f:
+                for offset in offsets[start:end]:
+                    f.seek(offset)
+                    events.append(tuple(json.loads(f.readline())))
+        return events
+
+    # All events between since and until, newest first. Reads one time
+    # index block (SPARSE_EVERY lines) at a time backwards from `until`, so
+    # asking for the newest few events reads a block or two.
+    def iter_range(self, since, until):
+        block = bisect_right(self.sparse_times, until) - 1
+        with open(self.path, 'rb') as f:
+            while block >= 0:
+                start = self.sparse_offsets[block]
+                end = self.sparse_offsets[block + 1] if block + 1 < len(self.sparse_offsets) else self.size
+                f.seek(start)
+                events = []
+                for line in f.read(end - start).splitlines():
+                    try:
+                        events.append(tuple(json.loads(line)))
+                    except ValueError:
+                        continue
+                for event in reversed(events):
+                    if event[0] < since:
+                        return
+                    if event[0] <= until:
+                        yield event
+                block -= 1
+
+    def delete(self):
+        for path in (self.path, self.index_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+# Append-only log of device presence events: (timestamp, type, ip, mac, old,
+# new) with type one of EVENT_TYPES. record() only queues events; they are
+# written in one append per flush() (or every `batch_size` events) to the
+# current segment file, which is sealed with its index once it reaches
+# `segment_bytes` or spans `segment_seconds`. Sealed segments are dropped
+# oldest first when the log exceeds `max_bytes` or they are older than
+# `max_age`. Queries only open the segments whose time range overlaps and
+# read the indexed lines, never the whole log. One log at a time can have
+# a directory open (an exclusive flock on its lock file): a second writer
+# would seal the first one's segment and append at offsets it never indexed.
+class PresenceLog:
+    def __init__(self, directory, segment_bytes=1 << 20, segment_seconds=86400,
+                 max_bytes=64 << 20, max_age=30 * 86400, batch_size=1000):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.segments = []  # Oldest first; the last one is being written
+        self.pending = []
+        self.last_timestamp = 0.0
+        self.file = None
+        self.lock_file = None
+        self.lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock_file = open(os.path.join(self.directory, 'lock'), 'a')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.lock_file.close()
+            raise PresenceError(f"Presence log {self.directory} is already open")
+        seqs = sorted(int(name[:-4]) for name in os.listdir(self.directory)
+                      if name.endswith('.log') and name[:-4].isdigit())
+        for seq in seqs:
+            segment = LogSegment(self.directory, seq)
+            try:
+                segment.load_index()
+            except (OSError, ValueError, KeyError):
+                # Not sealed (the process stopped while writing it)
+                segment = LogSegment(self.directory, seq)
+                segment.scan()
+                segment.save_index()
+            if segment.count:
+                self.segments.append(segment)
+                self.last_timestamp = max(self.last_timestamp, segment.last)
+            else:
+                segment.delete()
+        self._start_segment(seqs[-1] + 1 if seqs else 0)
+        self._enforce_retention(time.time())
+
+    def _start_segment(self, seq):
+        segment = LogSegment(self.directory, seq)
+        self.file = open(segment.path, 'ab')
+        self.segments.append(segment)
+
+    # Queue events. Timestamps never go backwards so the indexes stay sorted.
+    def record(self, events):
+        with self.lock:
+            for event in events:
+                timestamp = max(event[0], self.last_timestamp)
+                self.last_timestamp = timestamp
+                self.pending.append((timestamp,) + tuple(event[1:]))
+            if len(self.pending) >= self.batch_size:
+                self._write()
+
+    # Write queued events, seal a full segment and apply retention
+    def flush(self):
+        with self.lock:
+            self._write()
+            self._enforce_retention(time.time())
+
+    def _write(self):
+        if not self.pending:
+            return
+        segment = self.segments[-1]
+        chunks = []
+        offset = segment.size
+        for event in self.pending:
+            line = json.dumps(event, separators=(',', ':')).encode() + b'\n'
+            segment.add(event, offset)
+            chunks.append(line)
+            offset += len(line)
+        self.file.write(b''.join(chunks))
+        self.file.flush()
+        segment.size = offset
+        self.pending = []
+        if segment.size >= self.segment_bytes or segment.last - segment.first >= self.segment_seconds:
+            self._seal()
+
+    def _seal(self):
+        segment = self.segments[-1]
+        self.file.close()
+        segment.save_index()
+        self._start_segment(segment.seq + 1)
+
+    def _enforce_retention(self, now):
+        total = sum(segment.size for segment in self.segments)
+        while len(self.segments) > 1:
+            oldest = self.segments[0]
+            if total <= self.max_bytes and oldest.last >= now - self.max_age:
+                break
+            oldest.delete()
+            total -= oldest.size
+            self.segments.pop(0)
+
+    # Events newest first, at most `limit`. `device` is an IP or MAC; without
+    # it every event in the time range is returned. `types` limits the
+    # event types.
+    def query(self, device=None, since=0.0, until=None, types=None, limit=1000):
+        until = time.time() if until is None else until
+        events = []
+        with self.lock:
+            self._write()
+            for segment in reversed(self.segments):
+                if not segment.overlaps(since, until):
+                    continue
+                if device is None:
+                    matches = segment.iter_range(since, until)
+                else:
+                    matches = reversed(segment.read_device(device, since, until))
+                for event in matches:
+                    if types is None or event[1] in types:
+                        events.append(event)
+                        if len(events) >= limit:
+                            return [event_to_dict(event) for event in events]
+        return [event_to_dict(event) for event in events]
+
+    # Devices that joined or left at least `min_count` times between since
+    # and until, most flaps first, as [{'device', 'count'}]. Reads only the
+    # flap indexes, not the log.
+    def flapping(self, min_count, since, until=None):
+        until = time.time() if until is None else until
+        counts = {}
+        with self.lock:
+            self._write()
+            for segment in self.segments:
+                if not segment.overlaps(since, until):
+                    continue
+                for key, count in segment.flaps.counts(since, until).items():
+                    counts[key] = counts.get(key, 0) + count
+        flapping = [{'device': key, 'count': count} for key, count in counts.items() if count >= min_count]
+        flapping.sort(key=lambda item: (-item['count'], item['device']))
+        return flapping
+
+    def stats(self):
+        with self.lock:
+            return {
+                'segments': len(self.segments),
+                'events': sum(segment.count for segment in self.segments),
+                'bytes': sum(segment.size for segment in self.segments),
+                'pending': len(self.pending),
+                'oldest': self.segments[0].first if self.segments[0].count else None
+            }
+
+    # Write queued events and seal the current segment
+    def close(self):
+        with self.lock:
+            self._write()
+            self.file.close()
+            segment = self.segments[-1]
+            if segment.count:
+                segment.save_index()
+            else:
+                self.segments.pop()
+                segment.delete()
+            self.lock_file.close()
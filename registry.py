@@ -0,0 +1,501 @@
+import threading
+import time
+from collections import OrderedDict
+
+from listing import DeviceIndex, key_ip, make_cursor, parse_cursor
+
+DEVICE_FIELDS = (
+    'ip', 'hostname', 'status', 'last_seen', 'first_seen',
+    'mac', 'vendor', 'blocked', 'is_local', 'blocking_method', 'segment',
+    'rx_bytes', 'tx_bytes', 'rx_rate', 'tx_rate', 'services'
+)
+
+# Per-device traffic counters, filled in by bandwidth accounting
+TRAFFIC_FIELDS = ('rx_bytes', 'tx_bytes', 'rx_rate', 'tx_rate')
+
+# Fields whose change is reported by merge(); last_seen changes on every scan
+TRACKED_FIELDS = ('hostname', 'status', 'mac', 'vendor', 'is_local', 'blocked', 'segment')
+
+
+# Compact device record
+class Device:
+    __slots__ = DEVICE_FIELDS
+
+    def __init__(self, ip, hostname='Unknown', status='up', last_seen=None, first_seen=None,
+                 mac='Unknown', vendor='Unknown', blocked=False, is_local=False, blocking_method=None,
+                 segment=None, rx_bytes=0, tx_bytes=0, rx_rate=0.0, tx_rate=0.0, services=None):
+        self.ip = ip
+        self.hostname = hostname
+        self.status = status
+        self.last_seen = last_seen
+        self.first_seen = first_seen
+        self.mac = mac
+        self.vendor = vendor
+        self.blocked = blocked
+        self.is_local = is_local
+        self.blocking_method = blocking_method
+        self.segment = segment  # Name of the network segment the device was last seen on
+        self.rx_bytes = rx_bytes
+        self.tx_bytes = tx_bytes
+        self.rx_rate = rx_rate
+        self.tx_rate = tx_rate
+        self.services = services  # Open ports from service probing, None until probed
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data[field] for field in DEVICE_FIELDS if field in data})
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in DEVICE_FIELDS}
+        if data['blocking_method'] is None:
+            del data['blocking_method']
+        return data
+
+
+# Device table indexed by IP, MAC and segment. All lookups are O(1), merging
+# a scan is O(discovered) instead of O(discovered * known), and per-segment
+# queries only touch that segment's devices. `on_events` receives the
+# presence events of every merge and mark_gone() as a list of (timestamp,
+# type, ip, mac, old, new) tuples (see presence.EVENT_TYPES). Devices
+# restored from disk have status 'unknown' until a scan sees them or marks
+# them gone; that first observation is compared with the status they were
+# saved with, so only a real change across the restart records an event.
+class DeviceRegistry:
+    def __init__(self, on_events=None):
+        self.on_events = on_events
+        self.by_ip = {}
+        self.by_mac = {}
+        self.by_segment = {}  # segment -> set of IPs
+        self.lock = threading.RLock()
+        self.version = 0  # Bumped on every change
+        self.segment_versions = {}  # segment -> version of its last change
+        # ip -> version of its last change, oldest first, so changed_since()
+        # only walks the records that actually changed
+        self.changes = OrderedDict()
+        # (version, records) shared by readers until the next change
+        self._snapshot = (-1, ())
+        # Sort indexes for page(), brought up to date from `changes` when read
+        self._listing = None
+        self.saved_status = {}  # ip -> status saved before a restart, while 'unknown'
+
+    # Start a new version and return it (caller holds the lock)
+    def _bump(self):
+        self.version += 1
+        return self.version
+
+    def _mark(self, ip, version, segment=None):
+        self.changes[ip] = version
+        self.changes.move_to_end(ip)
+        if segment is None:
+            device = self.by_ip.get(ip)
+            segment = device.segment if device is not None else None
+        self.segment_versions[segment] = version
+
+    def _index_segment(self, device):
+        self.by_segment.setdefault(device.segment, set()).add(device.ip)
+
+    def _unindex_segment(self, ip, segment):
+        ips = self.by_segment.get(segment)
+        if ips is not None:
+            ips.discard(ip)
+            if not ips:
+                del self.by_segment[segment]
+        # The old segment lost a device
+        self.segment_versions[segment] = self.version
+
+    def __len__(self):
+        return len(self.by_ip)
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.by_ip.values()))
+
+    def segments(self):
+        with self.lock:
+            return list(self.by_segment)
+
+    # Devices on one segment (a snapshot list)
+    def in_segment(self, segment):
+        with self.lock:
+            return [self.by_ip[ip] for ip in self.by_segment.get(segment, ())]
+
+    def segment_version(self, segment):
+        return self.segment_versions.get(segment, 0)
+
+    # Find a device by IP or MAC
+    def get(self, identifier):
+        device = self.by_ip.get(identifier)
+        if device is None:
+            device = self.by_mac.get(identifier)
+        return device
+
+    def _index_mac(self, device, old_mac=None):
+        if old_mac and old_mac != 'Unknown' and self.by_mac.get(old_mac) is device:
+            del self.by_mac[old_mac]
+        if device.mac and device.mac != 'Unknown':
+            self.by_mac[device.mac] = device
+
+    def add(self, device):
+        with self.lock:
+            old = self.by_ip.get(device.ip)
+            if old is not None and old.segment != device.segment:
+                self._unindex_segment(device.ip, old.segment)
+            self.by_ip[device.ip] = device
+            self._index_mac(device)
+            self._index_segment(device)
+            self._mark(device.ip, self._bump())
+            return device
+
+    # Bulk-load saved device dicts (e.g. from disk at startup)
+    def load(self, device_dicts):
+        with self.lock:
+            version = self._bump()
+            for data in device_dicts:
+                device = Device.from_dict(data)
+                old = self.by_ip.get(device.ip)
+                if old is not None and old.segment != device.segment:
+                    self._unindex_segment(device.ip, old.segment)
+                if device.status == 'unknown':
+                    self.saved_status[device.ip] = data.get('saved_status')
+                self.by_ip[device.ip] = device
+                self._index_mac(device)
+                self._index_segment(device)
+                self._mark(device.ip, version)
+
+    def _clear(self):
+        self.by_ip.clear()
+        self.by_mac.clear()
+        self.by_segment.clear()
+        self.segment_versions.clear()
+        self.changes.clear()
+        self.saved_status.clear()
+        self._listing = None
+        self._snapshot = (-1, ())
+
+    # Drop every device. The version keeps counting up so cached ETags
+    # don't match, and on_events stays attached. changed_since() callers
+    # can't see what was dropped and must reload.
+    def clear(self):
+        with self.lock:
+            self._clear()
+            self._bump()
+
+    # Mirror another registry (a web worker following the engine process).
+    # Full records replace the local ones and removed IPs are dropped, all
+    # under the source's version so ETags and changed_since() answers match
+    # it. `reset` empties the table first (for a full snapshot).
+    def sync(self, records, removed=(), version=None, reset=False):
+        with self.lock:
+            if reset or (version is not None and version < self.version):
+                # Changes under the old version numbers can't be replayed
+                self._listing = None
+            if reset:
+                self._clear()
+            self.version = self.version + 1 if version is None else version
+            for data in records:
+                device = Device.from_dict(data)
+                old = self.by_ip.get(device.ip)
+                if old is not None:
+                    if self.by_mac.get(old.mac) is old:
+                        del self.by_mac[old.mac]
+                    if old.segment != device.segment:
+                        self._unindex_segment(device.ip, old.segment)
+                self.by_ip[device.ip] = device
+                self._index_mac(device)
+                self._index_segment(device)
+                self._mark(device.ip, self.version)
+            for ip in removed:
+                device = self.by_ip.pop(ip, None)
+                if device is None:
+                    continue
+                if self.by_mac.get(device.mac) is device:
+                    del self.by_mac[device.mac]
+                self.saved_status.pop(ip, None)
+                self._unindex_segment(ip, device.segment)
+                self._mark(ip, self.version, device.segment)
+            # The version may go backwards (the engine restarted)
+            self._snapshot = (-1, ())
+
+    def remove(self, ip):
+        with self.lock:
+            device = self.by_ip.pop(ip, None)
+            if device is not None:
+                if self.by_mac.get(device.mac) is device:
+                    del self.by_mac[device.mac]
+                version = self._bump()
+                self.saved_status.pop(ip, None)
+                self._unindex_segment(ip, device.segment)
+                self._mark(ip, version, device.segment)
+            return device
+
+    # Status a scan result is compared with: for a restored device, the one
+    # it was saved with (None if unknown, which records no event)
+    def _last_status(self, device):
+        if device.status == 'unknown':
+            return self.saved_status.get(device.ip)
+        return device.status
+
+    # Merge discovered device dicts. Returns (added, changed) sets of IPs.
+    def merge(self, discovered):
+        added = set()
+        changed = set()
+        events = []
+        now = time.time()
+
+        with self.lock:
+            if not discovered:
+                return added, changed
+            version = self._bump()
+
+            for new_device in discovered:
+                existing = self.by_ip.get(new_device['ip'])
+                if existing is None:
+                    self.by_ip[new_device['ip']] = device = Device.from_dict(new_device)
+                    # A known MAC at a new address moved; it only joined if it was offline
+                    moved_from = self.by_mac.get(device.mac)
+                    if moved_from is not None:
+                        events.append((now, 'ip_changed', device.ip, device.mac, moved_from.ip, device.ip))
+                    if moved_from is None or self._last_status(moved_from) == 'down':
+                        events.append((now, 'joined', device.ip, device.mac, None, None))
+                    self._index_mac(device)
+                    self._index_segment(device)
+                    self._mark(device.ip, version)
+                    added.add(device.ip)
+                    continue
+
+                before = tuple(getattr(existing, field) for field in TRACKED_FIELDS)
+                old_mac = existing.mac
+                old_segment = existing.segment
+                old_hostname = existing.hostname
+                came_back = self._last_status(existing) == 'down' and new_device['status'] != 'down'
+                self.saved_status.pop(existing.ip, None)
+
+                existing.status = new_device['status']
+                existing.last_seen = new_device['last_seen']
+
+                # Update hostname if we have a better one
+                if new_device['hostname'] != 'Unknown':
+                    existing.hostname = new_device['hostname']
+                    if old_hostname not in ('Unknown', existing.hostname):
+                        events.append((now, 'hostname_changed', existing.ip, existing.mac,
+                                       old_hostname, existing.hostname))
+
+                if new_device['mac'] != 'Unknown':
+                    existing.mac = new_device['mac']
+                    if existing.mac != old_mac:
+                        self._index_mac(existing, old_mac)
+                        if old_mac != 'Unknown':
+                            events.append((now, 'mac_changed', existing.ip, existing.mac, old_mac, existing.mac))
+
+                if new_device.get('vendor', 'Unknown') != 'Unknown':
+                    existing.vendor = new_device['vendor']
+
+                if came_back:
+                    events.append((now, 'joined', existing.ip, existing.mac, None, None))
+
+                # Mark if this is the local machine
+                existing.is_local = new_device['is_local']
+
+                if new_device.get('segment') is not None:
+                    existing.segment = new_device['segment']
+                    if existing.segment != old_segment:
+                        self._unindex_segment(existing.ip, old_segment)
+                        self._index_segment(existing)
+
+                # last_seen moves on every scan, so every merged record is
+                # newer for changed_since() even if nothing else changed
+                self._mark(existing.ip, version)
+
+                if tuple(getattr(existing, field) for field in TRACKED_FIELDS) != before:
+                    changed.add(existing.ip)
+
+        if events and self.on_events:
+            self.on_events(events)
+        return added, changed
+
+    # Mark devices that are up but were not seen as down. `keep(ip)` can
+    # protect devices whose part of the network was not scanned, and
+    # `segment` limits the check to one segment's devices.
+    # Returns the set of IPs that went down.
+    def mark_gone(self, seen_ips, keep=None, segment=None):
+        gone = set()
+        events = []
+        now = time.time()
+        with self.lock:
+            if segment is None:
+                candidates = self.by_ip.items()
+            else:
+                candidates = ((ip, self.by_ip[ip]) for ip in self.by_segment.get(segment, ()))
+            for ip, device in candidates:
+                if device.status == 'down' or ip in seen_ips:
+                    continue
+                if keep is not None and keep(ip):
+                    continue
+                was_up = self._last_status(device) == 'up'
+                self.saved_status.pop(ip, None)
+                device.status = 'down'
+                gone.add(ip)
+                if not was_up:
+                    continue
+                # A device whose MAC now answers on another IP moved (ip_changed), it did not leave
+                if device.mac == 'Unknown' or self.by_mac.get(device.mac) is device:
+                    events.append((now, 'left', ip, device.mac, None, None))
+            if gone:
+                version = self._bump()
+                for ip in gone:
+                    self._mark(ip, version)
+        if events and self.on_events:
+            self.on_events(events)
+        return gone
+
+    # Merge a complete scan result. Returns (added, changed, gone).
+    def apply_scan(self, discovered):
+        added, changed = self.merge(discovered)
+        gone = self.mark_gone({d['ip'] for d in discovered})
+        return added, changed, gone
+
+    # Set fields of a device returned by get() under the lock and record the
+    # change (not for `segment`, which is indexed)
+    def update(self, device, **fields):
+        with self.lock:
+            for field, value in fields.items():
+                setattr(device, field, value)
+            self._mark(device.ip, self._bump())
+        return device
+
+    # Record an in-place change made through a device returned by get()
+    def touch(self, device):
+        with self.lock:
+            self._mark(device.ip, self._bump())
+
+    # Store per-device traffic counters from {ip: {rx_bytes, tx_bytes,
+    # rx_rate, tx_rate}}. Returns the IPs of known devices whose counters changed.
+    def apply_traffic(self, usage):
+        changed = set()
+        with self.lock:
+            for ip, counters in usage.items():
+                device = self.by_ip.get(ip)
+                if device is None:
+                    continue
+                values = tuple(counters[field] for field in TRAFFIC_FIELDS)
+                if tuple(getattr(device, field) for field in TRAFFIC_FIELDS) == values:
+                    continue
+                for field, value in zip(TRAFFIC_FIELDS, values):
+                    setattr(device, field, value)
+                changed.add(ip)
+            if changed:
+                version = self._bump()
+                for ip in changed:
+                    self._mark(ip, version)
+        return changed
+
+    # Store service probe results from {ip: services}. Returns the IPs of
+    # known devices whose services changed.
+    def apply_services(self, results):
+        changed = set()
+        with self.lock:
+            for ip, services in results.items():
+                device = self.by_ip.get(ip)
+                if device is None or device.services == services:
+                    continue
+                device.services = services
+                changed.add(ip)
+            if changed:
+                version = self._bump()
+                for ip in changed:
+                    self._mark(ip, version)
+        return changed
+
+    # Records changed after `version` and IPs removed since then. With a
+    # segment, changed records on other segments are left out (removed IPs
+    # are always reported, their segment is gone with them).
+    def changed_since(self, version, segment=None):
+        with self.lock:
+            changed = []
+            removed = []
+            for ip in reversed(self.changes):
+                if self.changes[ip] <= version:
+                    break
+                device = self.by_ip.get(ip)
+                if device is None:
+                    removed.append(ip)
+                elif segment is None or device.segment == segment:
+                    changed.append(device.to_dict())
+            return changed, removed
+
+    # Changes after `version`, oldest first, for shipping in pages: (records,
+    # removed IPs, version reached, more). A page ends on a version boundary
+    # so it can be resumed from the version reached; it goes past `limit`
+    # rather than split one version.
+    def changes_page(self, version, limit):
+        with self.lock:
+            pending = []
+            for ip in reversed(self.changes):
+                if self.changes[ip] <= version:
+                    break
+                pending.append(ip)
+            records = []
+            removed = []
+            reached = version
+            for ip in reversed(pending):
+                ip_version = self.changes[ip]
+                if ip_version != reached and len(records) + len(removed) >= limit:
+                    return records, removed, reached, True
+                reached = ip_version
+                device = self.by_ip.get(ip)
+                if device is None:
+                    removed.append(ip)
+                else:
+                    records.append(device.to_dict())
+            return records, removed, self.version, False
+
+    # Every record as a dict, as of one version. Copy-on-write: the tuple is
+    # built once per version and then shared, so readers of an unchanged
+    # table take no lock and never hold up a merge. Treat it as read-only.
+    def snapshot(self):
+        version, records = self._snapshot
+        if version == self.version:
+            return records
+        with self.lock:
+            if self._snapshot[0] != self.version:
+                self._snapshot = (self.version, tuple(device.to_dict() for device in self.by_ip.values()))
+            return self._snapshot[1]
+
+    # Sort indexes caught up with the current version (caller holds the
+    # lock): the records changed since the last read are re-indexed
+    def _listing_index(self):
+        index = self._listing
+        if index is None or index.version > self.version:
+            index = self._listing = DeviceIndex(self.by_ip.values(), self.version)
+        elif index.version < self.version:
+            pending = []
+            for ip in reversed(self.changes):
+                if self.changes[ip] <= index.version:
+                    break
+                pending.append((ip, self.by_ip.get(ip)))
+            index.update(pending)
+            index.version = self.version
+        return index
+
+    # One page of device dicts sorted by `sort` (see listing.SORT_FIELDS),
+    # after the `cursor` of the previous page. `status` is a set of statuses,
+    # `blocked` True/False and `prefix` a lowercase hostname, IP or MAC
+    # prefix; None means no filter. Returns (records, next cursor or None,
+    # total matching). Cursors hold the last sort value, so paging stays
+    # consistent while the table changes.
+    def page(self, sort='ip', descending=False, cursor=None, limit=100, status=None, segment=None,
+             blocked=None, prefix=None):
+        if status is not None:
+            status = frozenset(status)  # Part of the query cache key
+        with self.lock:
+            index = self._listing_index()
+            keys, more, total = index.page(sort, descending, parse_cursor(sort, cursor) if cursor else None,
+                                           limit, status, segment, blocked, prefix)
+            records = [self.by_ip[key_ip(key)].to_dict() for key in keys]
+        return records, make_cursor(sort, keys[-1]) if more else None, total
+
+    def to_list(self, segment=None):
+        if segment is None:
+            return list(self.snapshot())
+        with self.lock:
+            return [self.by_ip[ip].to_dict() for ip in self.by_segment.get(segment, ())]
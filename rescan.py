@@ -0,0 +1,136 @@
+import heapq
+import threading
+import time
+
+
+class HostState:
+    __slots__ = ('confidence', 'misses', 'last_seen', 'next_probe')
+
+    def __init__(self):
+        self.confidence = 0.0  # Moving average of probe results, 1.0 = always up
+        self.misses = 0  # Consecutive probes without an answer
+        self.last_seen = None
+        self.next_probe = 0.0
+
+
+# Decides what each scan cycle probes. Hosts that answer are re-probed every
+# base_interval; each consecutive miss doubles the wait (up to max_backoff
+# times), so addresses that are rarely up cost less and less. A full sweep of
+# the subnet still runs every full_interval to pick up hosts nobody knew about.
+class RescanPlanner:
+    def __init__(self, base_interval=60, full_interval=900, max_backoff=16, smoothing=0.3, retry_delay=10):
+        self.base_interval = base_interval
+        self.full_interval = full_interval
+        self.max_backoff = max_backoff
+        self.smoothing = smoothing
+        self.retry_delay = retry_delay  # seconds before a due host that was not probed is due again
+        self.hosts = {}  # ip -> HostState
+        self.heap = []  # (next_probe, ip); stale entries are skipped when popped
+        self.last_full = None
+        self.last_full_scope = None  # CIDR of the last full sweep
+        self.full_requested = False
+        self.lock = threading.Lock()
+
+    # Make the next cycle a full sweep
+    def request_full(self):
+        with self.lock:
+            self.full_requested = True
+
+    # A full sweep is due on the first cycle, after full_interval, when
+    # requested and whenever the scanned subnet changes
+    def full_due(self, scope=None, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            return (self.full_requested or self.last_full is None or scope != self.last_full_scope
+                    or now - self.last_full >= self.full_interval)
+
+    def record_full(self, scope=None, now=None):
+        with self.lock:
+            self.last_full = time.monotonic() if now is None else now
+            self.last_full_scope = scope
+            self.full_requested = False
+
+    # IPs whose next probe is due. Anything due within a tenth of the base
+    # interval is included so hosts don't slip to the following cycle.
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        horizon = now + self.base_interval * 0.1
+        targets = {}
+        with self.lock:
+            while self.heap and self.heap[0][0] <= horizon:
+                next_probe, ip = heapq.heappop(self.heap)
+                state = self.hosts.get(ip)
+                # A stale entry can carry the same time as the live one
+                if state is not None and state.next_probe == next_probe:
+                    targets[ip] = None
+        return list(targets)
+
+    # Record a probe result for one host and schedule its next probe
+    def observe(self, ip, up, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            state = self.hosts.get(ip)
+            if state is None:
+                if not up:
+                    return  # Never seen, nothing to track
+                state = self.hosts[ip] = HostState()
+            state.confidence += self.smoothing * ((1.0 if up else 0.0) - state.confidence)
+            if up:
+                state.misses = 0
+                state.last_seen = now
+            else:
+                state.misses += 1
+            backoff = min(2 ** state.misses, self.max_backoff)
+            state.next_probe = now + self.base_interval * backoff
+            heapq.heappush(self.heap, (state.next_probe, ip))
+            self._compact()
+
+    # Rebuild the heap once stale entries outnumber the live ones. They are
+    # normally dropped by due(), which never runs in full scan mode.
+    def _compact(self):
+        if len(self.heap) > 2 * len(self.hosts) + 64:
+            self.heap = [(state.next_probe, ip) for ip, state in self.hosts.items()]
+            heapq.heapify(self.heap)
+
+    # Put hosts that due() handed out but that were never probed (outside the
+    # scanned subnet, in a failed shard, or the scan failed) back on the
+    # schedule after retry_delay, leaving their confidence alone
+    def retry(self, ips, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            for ip in ips:
+                state = self.hosts.get(ip)
+                if state is None:
+                    continue
+                state.next_probe = now + self.retry_delay
+                heapq.heappush(self.heap, (state.next_probe, ip))
+            self._compact()
+
+    # Record the results of a probe round: everything in `probed` that is not
+    # in `seen` missed
+    def observe_many(self, probed, seen, now=None):
+        now = time.monotonic() if now is None else now
+        for ip in probed:
+            self.observe(ip, ip in seen, now)
+
+    def get(self, ip):
+        with self.lock:
+            state = self.hosts.get(ip)
+            if state is None:
+                return None
+            return {
+                'confidence': round(state.confidence, 3),
+                'misses': state.misses,
+                'next_probe_in': max(0.0, round(state.next_probe - time.monotonic(), 1))
+            }
+
+    def stats(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            backed_off = sum(1 for state in self.hosts.values() if state.misses)
+            return {
+                'tracked_hosts': len(self.hosts),
+                'backed_off_hosts': backed_off,
+                'seconds_since_full_scan': None if self.last_full is None else round(now - self.last_full, 1),
+                'full_scan_interval': self.full_interval
+            }
@@ -0,0 +1,81 @@
+import ipaddress
+import threading
+
+from rescan import RescanPlanner
+
+
+# One monitored network segment: an interface (or one subnet on it) with its
+# own scan worker, rescan schedule and interface stats. `info` returns the
+# segment's network details in the same shape as get_local_network_info().
+class Segment:
+    def __init__(self, name, info, scan_interval=None):
+        self.name = name
+        self.info = info
+        self.scan_interval = scan_interval  # None = use the global scan_interval
+        self.planner = RescanPlanner()
+        self.stats = {}
+        self.stats_version = 0
+        self.last_scan_time = None
+        self.thread = None
+
+    def describe(self):
+        info = self.info()
+        return {
+            'name': self.name,
+            'interface': info['interface'],
+            'cidr': info['cidr'],
+            'local_ip': info['local_ip'],
+            'scan_interval': self.scan_interval,
+            'last_scan_time': self.last_scan_time
+        }
+
+
+# Parse a segment spec: "eth0", "eth0.10=10.10.0.0/24" or a dict with
+# interface, cidr, name and scan_interval keys.
+# Returns (name, interface, cidr or None, scan_interval or None).
+def parse_segment_spec(spec):
+    if isinstance(spec, str):
+        interface, _, cidr = spec.partition('=')
+        spec = {'interface': interface.strip(), 'cidr': cidr.strip() or None}
+
+    interface = spec.get('interface')
+    if not interface:
+        raise ValueError(f"Segment {spec!r} has no interface")
+    cidr = spec.get('cidr')
+    if cidr:
+        cidr = str(ipaddress.ip_network(cidr, strict=False))
+    name = spec.get('name') or (f"{interface}:{cidr}" if cidr else interface)
+    scan_interval = spec.get('scan_interval')
+    if scan_interval is not None and (not isinstance(scan_interval, int) or scan_interval < 30):
+        raise ValueError(f"Segment {name} has an invalid scan interval")
+    return name, interface, cidr, scan_interval
+
+
+# Segments by name, in configuration order. The first one is the primary
+# segment: it also drives the host-wide traffic chart.
+class SegmentSet:
+    def __init__(self):
+        self.segments = {}
+        self.lock = threading.Lock()
+
+    def add(self, segment):
+        with self.lock:
+            if segment.name in self.segments:
+                raise ValueError(f"Duplicate segment {segment.name}")
+            self.segments[segment.name] = segment
+        return segment
+
+    def get(self, name):
+        return self.segments.get(name)
+
+    @property
+    def primary(self):
+        with self.lock:
+            return next(iter(self.segments.values()), None)
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.segments.values()))
+
+    def __len__(self):
+        return len(self.segments)
@@ -24,6 +24,31 @@ let chartDatasets = {
     upload: [],
     labels: []
 };
+let currentRange = '1h';
+
+// Device table: pages are fetched from the server (sorted, filtered and
+// searched there) as the list is scrolled, and only the rows in view are in
+// the DOM. Pushed deltas update loaded rows in place.
+const DEVICE_PAGE_SIZE = 200;
+const DEVICE_OVERSCAN = 10;  // Rows rendered above and below the visible ones
+const DEVICE_RELOAD_MS = 3000;  // Added or dropped devices reload the loaded rows at most this often
+let deviceRows = [];  // Devices loaded so far, in server order
+let deviceIndex = new Map();  // ip -> position in deviceRows
+let deviceTotal = 0;
+let deviceCursor = null;  // Cursor of the next page, null when everything is loaded
+let deviceLoading = false;
+let deviceQueryId = 0;  // Bumped on every reload so answers to older queries are dropped
+let deviceSort = { sort: 'ip', order: 'asc' };
+let deviceRowHeight = 57;  // Measured once from the first rendered row
+let deviceRowMeasured = false;
+let deviceReloadTimer = null;
+let deviceSearchTimer = null;
+let devicesLoaded = false;
+let realtimeEnabled = true;
+
+// Traffic samples arrive every second; the chart is refetched at most this often
+const CHART_REFRESH_MS = 5000;
+let lastChartRefresh = 0;
 
 // Function to format bytes into human-readable format
 function formatBytes(bytes, decimals = 2) {
@@ -43,71 +68,33 @@ function formatBandwidth(bytesPerSec) {
     return formatBytes(bytesPerSec) + '/s';
 }
 
+// Function to show stats on the dashboard cards
+function applyStats(data) {
+    document.getElementById('network-status').textContent = 'Online';
+    document.getElementById('active-devices').textContent = data.active_devices;
+    document.getElementById('blocked-devices').textContent = data.blocked_devices || 0;
+    document.getElementById('download-stats').textContent = formatBandwidth(data.download_rate);
+    document.getElementById('upload-stats').textContent = formatBandwidth(data.upload_rate);
+    document.getElementById('local-ip').textContent = data.local_ip;
+    document.getElementById('gateway-ip').textContent = data.gateway_ip;
+    document.getElementById('interface').textContent = data.interface;
+    lastUpdateTime.textContent = data.timestamp;
+}
+
 // Function to update dashboard stats
 function updateDashboardStats() {
     fetch('/api/stats')
         .then(response => response.json())
-        .then(data => {
-            document.getElementById('network-status').textContent = 'Online';
-            document.getElementById('active-devices').textContent = data.active_devices;
-            document.getElementById('blocked-devices').textContent = data.blocked_devices || 0;
-            document.getElementById('download-stats').textContent = formatBandwidth(data.download_rate);
-            document.getElementById('upload-stats').textContent = formatBandwidth(data.upload_rate);
-            document.getElementById('local-ip').textContent = data.local_ip;
-            document.getElementById('gateway-ip').textContent = data.gateway_ip;
-            document.getElementById('interface').textContent = data.interface;
-            lastUpdateTime.textContent = data.timestamp;
-        })
+        .then(applyStats)
         .catch(error => {
             console.error('Error fetching stats:', error);
             showToast('Error fetching network stats', 'error');
         });
 }
 
-// Function to update traffic chart
+// Function to update traffic chart for the selected time range
 function updateTrafficChart() {
-    fetch('/api/traffic-history')
-        .then(response => response.json())
-        .then(data => {
-            // Format timestamps for display
-            const formattedLabels = data.timestamps.map(timestamp => {
-                const date = new Date(timestamp);
-                return date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
-            });
-            
-            // Calculate data rates for display
-            const downloadRates = [];
-            const uploadRates = [];
-            
-            for (let i = 1; i < data.download.length; i++) {
-                // Calculate time difference in seconds
-                const prevTime = new Date(data.timestamps[i-1]);
-                const currTime = new Date(data.timestamps[i]);
-                const timeDiff = (currTime - prevTime) / 1000;
-                
-                // Calculate rates in bytes per second
-                const downloadRate = (data.download[i] - data.download[i-1]) / timeDiff;
-                const uploadRate = (data.upload[i] - data.upload[i-1]) / timeDiff;
-                
-                downloadRates.push(downloadRate / 1024); // Convert to KB/s for better visualization
-                uploadRates.push(uploadRate / 1024);
-            }
-            
-            // Add a placeholder for the first point since we can't calculate a rate
-            if (downloadRates.length > 0) {
-                downloadRates.unshift(downloadRates[0]);
-                uploadRates.unshift(uploadRates[0]);
-            }
-            
-            chartDatasets.labels = formattedLabels;
-            chartDatasets.download = downloadRates;
-            chartDatasets.upload = uploadRates;
-            
-            updateChart();
-        })
-        .catch(error => {
-            console.error('Error fetching traffic history:', error);
-        });
+    fetchChartData(currentRange);
 }
 
 // Function to initialize and update the chart
@@ -200,110 +187,238 @@ function updateChart() {
     }
 }
 
-// Function to update device list
+// Query string for one page of the device table
+function deviceQueryString(cursor, limit) {
+    const params = new URLSearchParams({ limit, sort: deviceSort.sort, order: deviceSort.order });
+    const search = deviceSearch.value.trim();
+    if (search) params.set('q', search);
+    if (cursor) params.set('cursor', cursor);
+    return params.toString();
+}
+
+function reindexDeviceRows() {
+    deviceIndex = new Map(deviceRows.map((device, position) => [device.ip, position]));
+}
+
+// Function to (re)load the device list from the first page. As many rows as
+// are loaded now are fetched again, so the scroll position holds.
 function updateDeviceList() {
-    fetch('/api/devices')
+    const queryId = ++deviceQueryId;
+    const limit = Math.min(Math.max(deviceRows.length, DEVICE_PAGE_SIZE), 1000);
+    deviceLoading = true;
+    fetch(`/api/devices?${deviceQueryString(null, limit)}`)
         .then(response => response.json())
         .then(data => {
-            const devicesList = document.getElementById('devices-list');
-            devicesList.innerHTML = '';
-            
-            const searchTerm = deviceSearch.value.toLowerCase();
-            
-            const filteredDevices = data.filter(device => {
-                return device.hostname.toLowerCase().includes(searchTerm) ||
-                       device.ip.toLowerCase().includes(searchTerm) ||
-                       device.mac.toLowerCase().includes(searchTerm);
-            });
-            
-            filteredDevices.forEach(device => {
-                const row = document.createElement('tr');
-                
-                // Status column
-                const statusCell = document.createElement('td');
-                const statusDiv = document.createElement('div');
-                statusDiv.className = 'device-status';
-                
-                const statusIndicator = document.createElement('span');
-                statusIndicator.className = 'status-indicator';
-                
-                let statusText = '';
-                
-                if (device.blocked) {
-                    statusIndicator.classList.add('status-blocked');
-                    statusText = 'Blocked';
-                } else if (device.status === 'up') {
-                    statusIndicator.classList.add('status-online');
-                    statusText = 'Online';
-                } else {
-                    statusIndicator.classList.add('status-offline');
-                    statusText = 'Offline';
-                }
-                
-                statusDiv.appendChild(statusIndicator);
-                statusDiv.appendChild(document.createTextNode(statusText));
-                statusCell.appendChild(statusDiv);
-                row.appendChild(statusCell);
-                
-                // Hostname column
-                const hostnameCell = document.createElement('td');
-                hostnameCell.textContent = device.hostname;
-                row.appendChild(hostnameCell);
-                
-                // IP column
-                const ipCell = document.createElement('td');
-                ipCell.textContent = device.ip;
-                row.appendChild(ipCell);
-                
-                // MAC column
-                const macCell = document.createElement('td');
-                macCell.textContent = device.mac;
-                row.appendChild(macCell);
-                
-                // Last seen column
-                const lastSeenCell = document.createElement('td');
-                lastSeenCell.textContent = device.last_seen;
-                row.appendChild(lastSeenCell);
-                
-                // Actions column
-                const actionsCell = document.createElement('td');
-                const actionsDiv = document.createElement('div');
-                actionsDiv.className = 'device-actions';
-                
-                // Block/Unblock Button
-                const blockBtn = document.createElement('button');
-                blockBtn.className = 'action-btn';
-                
-                if (device.blocked) {
-                    blockBtn.classList.add('btn-unblock');
-                    blockBtn.innerHTML = '<i class="fas fa-unlock"></i> Unblock';
-                    blockBtn.addEventListener('click', () => showConfirmModal('unblock', device));
-                } else {
-                    blockBtn.classList.add('btn-block');
-                    blockBtn.innerHTML = '<i class="fas fa-ban"></i> Block';
-                    blockBtn.addEventListener('click', () => showConfirmModal('block', device));
-                }
-                
-                // Kick Button
-                const kickBtn = document.createElement('button');
-                kickBtn.className = 'action-btn btn-kick';
-                kickBtn.innerHTML = '<i class="fas fa-power-off"></i> Kick';
-                kickBtn.addEventListener('click', () => showConfirmModal('kick', device));
-                
-                actionsDiv.appendChild(blockBtn);
-                actionsDiv.appendChild(kickBtn);
-                actionsCell.appendChild(actionsDiv);
-                row.appendChild(actionsCell);
-                
-                devicesList.appendChild(row);
-            });
+            if (queryId !== deviceQueryId) return;
+            deviceRows = data.devices;
+            deviceCursor = data.next_cursor;
+            deviceTotal = data.total;
+            reindexDeviceRows();
+            devicesLoaded = true;
+            deviceLoading = false;
+            renderDeviceList();
         })
         .catch(error => {
+            if (queryId === deviceQueryId) deviceLoading = false;
             console.error('Error fetching devices:', error);
             showToast('Error fetching device list', 'error');
         });
 }
 
+// Function to append the next page when the list is scrolled near its end
+function loadMoreDevices() {
+    if (deviceLoading || !deviceCursor) return;
+    const queryId = deviceQueryId;
+    deviceLoading = true;
+    fetch(`/api/devices?${deviceQueryString(deviceCursor, DEVICE_PAGE_SIZE)}`)
+        .then(response => response.json())
+        .then(data => {
+            if (queryId !== deviceQueryId) return;
+            // A device whose sort value moved past the cursor can come back; keep the first copy
+            data.devices.forEach(device => {
+                if (deviceIndex.has(device.ip)) return;
+                deviceIndex.set(device.ip, deviceRows.length);
+                deviceRows.push(device);
+            });
+            deviceCursor = data.next_cursor;
+            deviceTotal = data.total;
+            deviceLoading = false;
+            renderDeviceList();
+        })
+        .catch(error => {
+            if (queryId === deviceQueryId) deviceLoading = false;
+            console.error('Error fetching devices:', error);
+        });
+}
+
+function scheduleDeviceReload() {
+    if (deviceReloadTimer) return;
+    deviceReloadTimer = setTimeout(() => {
+        deviceReloadTimer = null;
+        updateDeviceList();
+    }, DEVICE_RELOAD_MS);
+}
+
+// Function to apply a pushed device delta to the loaded rows
+function applyDeviceDelta(delta) {
+    if (!devicesLoaded) return;
+    
+    [...delta.added, ...delta.changed, ...delta.gone].forEach(device => {
+        const position = deviceIndex.get(device.ip);
+        if (position !== undefined) deviceRows[position] = device;
+    });
+    delta.seen.forEach(ip => {
+        const position = deviceIndex.get(ip);
+        if (position !== undefined) deviceRows[position].last_seen = delta.last_seen;
+    });
+    
+    // New, dropped or changed devices can move between pages and change the total
+    if (delta.added.length || delta.changed.length || delta.gone.length) {
+        scheduleDeviceReload();
+    }
+    
+    if (document.getElementById('devices').classList.contains('active-section')) {
+        renderDeviceList();
+    }
+}
+
+// Empty row standing in for the rows scrolled out of view
+function deviceSpacerRow(height) {
+    const row = document.createElement('tr');
+    row.className = 'spacer-row';
+    const cell = document.createElement('td');
+    cell.colSpan = 6;
+    cell.style.height = `${height}px`;
+    row.appendChild(cell);
+    return row;
+}
+
+// Function to render the rows of the device list that are in view
+function renderDeviceList() {
+    const container = document.querySelector('.device-list');
+    const devicesList = document.getElementById('devices-list');
+    
+    const first = Math.max(0, Math.floor(container.scrollTop / deviceRowHeight) - DEVICE_OVERSCAN);
+    const last = Math.min(deviceRows.length,
+                          first + Math.ceil(container.clientHeight / deviceRowHeight) + 2 * DEVICE_OVERSCAN);
+    
+    devicesList.innerHTML = '';
+    if (first > 0) devicesList.appendChild(deviceSpacerRow(first * deviceRowHeight));
+    deviceRows.slice(first, last).forEach(device => devicesList.appendChild(buildDeviceRow(device)));
+    if (last < deviceRows.length) devicesList.appendChild(deviceSpacerRow((deviceRows.length - last) * deviceRowHeight));
+    
+    document.getElementById('device-count').textContent = deviceTotal > deviceRows.length
+        ? `Showing ${deviceRows.length} of ${deviceTotal} devices`
+        : `${deviceTotal} devices`;
+    
+    // Spacers are sized from the first real row (the table is hidden until the tab is opened)
+    const row = devicesList.querySelector('tr:not(.spacer-row)');
+    if (!deviceRowMeasured && row && row.offsetHeight) {
+        deviceRowMeasured = true;
+        if (row.offsetHeight !== deviceRowHeight) {
+            deviceRowHeight = row.offsetHeight;
+            renderDeviceList();
+            return;
+        }
+    }
+    
+    if (last >= deviceRows.length - DEVICE_OVERSCAN) loadMoreDevices();
+}
+
+// Function to build the table row of one device
+function buildDeviceRow(device) {
+    const row = document.createElement('tr');
+    
+    // Status column
+    const statusCell = document.createElement('td');
+    const statusDiv = document.createElement('div');
+    statusDiv.className = 'device-status';
+    
+    const statusIndicator = document.createElement('span');
+    statusIndicator.className = 'status-indicator';
+    
+    let statusText = '';
+    
+    if (device.blocked) {
+        statusIndicator.classList.add('status-blocked');
+        statusText = 'Blocked';
+    } else if (device.status === 'up') {
+        statusIndicator.classList.add('status-online');
+        statusText = 'Online';
+    } else if (device.status === 'unknown') {
+        // Restored at startup, not scanned yet
+        statusIndicator.classList.add('status-unknown');
+        statusText = 'Unknown';
+    } else {
+        statusIndicator.classList.add('status-offline');
+        statusText = 'Offline';
+    }
+    
+    statusDiv.appendChild(statusIndicator);
+    statusDiv.appendChild(document.createTextNode(statusText));
+    statusCell.appendChild(statusDiv);
+    row.appendChild(statusCell);
+    
+    // Hostname column
+    const hostnameCell = document.createElement('td');
+    hostnameCell.textContent = device.hostname;
+    row.appendChild(hostnameCell);
+    
+    // IP column
+    const ipCell = document.createElement('td');
+    ipCell.textContent = device.ip;
+    row.appendChild(ipCell);
+    
+    // MAC column
+    const macCell = document.createElement('td');
+    macCell.textContent = device.mac;
+    // Vendor and open ports on hover
+    const details = [];
+    if (device.vendor && device.vendor !== 'Unknown') details.push(device.vendor);
+    if (device.services && device.services.length) {
+        details.push(device.services.map(s => `${s.port}/${s.service}`).join(', '));
+    }
+    if (details.length) macCell.title = details.join(' - ');
+    row.appendChild(macCell);
+    
+    // Last seen column
+    const lastSeenCell = document.createElement('td');
+    lastSeenCell.textContent = device.last_seen;
+    row.appendChild(lastSeenCell);
+    
+    // Actions column
+    const actionsCell = document.createElement('td');
+    const actionsDiv = document.createElement('div');
+    actionsDiv.className = 'device-actions';
+    
+    // Block/Unblock Button
+    const blockBtn = document.createElement('button');
+    blockBtn.className = 'action-btn';
+    
+    if (device.blocked) {
+        blockBtn.classList.add('btn-unblock');
+        blockBtn.innerHTML = '<i class="fas fa-unlock"></i> Unblock';
+        blockBtn.addEventListener('click', () => showConfirmModal('unblock', device));
+    } else {
+        blockBtn.classList.add('btn-block');
+        blockBtn.innerHTML = '<i class="fas fa-ban"></i> Block';
+        blockBtn.addEventListener('click', () => showConfirmModal('block', device));
+    }
+    
+    // Kick Button
+    const kickBtn = document.createElement('button');
+    kickBtn.className = 'action-btn btn-kick';
+    kickBtn.innerHTML = '<i class="fas fa-power-off"></i> Kick';
+    kickBtn.addEventListener('click', () => showConfirmModal('kick', device));
+    
+    actionsDiv.appendChild(blockBtn);
+    actionsDiv.appendChild(kickBtn);
+    actionsCell.appendChild(actionsDiv);
+    row.appendChild(actionsCell);
+    
+    return row;
+}
+
 // Function to show confirmation modal
 function showConfirmModal(action, device) {
     let title, message;
@@ -529,9 +644,13 @@ navLinks.forEach(link => {
         const targetId = link.getAttribute('href').substring(1);
         document.getElementById(targetId).classList.add('active-section');
         
-        // If navigating to devices tab, update device list
+        // If navigating to devices tab, show the list (pushed deltas keep it current)
         if (targetId === 'devices') {
-            updateDeviceList();
+            if (devicesLoaded) {
+                renderDeviceList();
+            } else {
+                updateDeviceList();
+            }
         }
     });
 });
@@ -540,7 +659,45 @@ navLinks.forEach(link => {
 refreshBtn.addEventListener('click', refreshDashboard);
 refreshDevicesBtn.addEventListener('click', refreshDeviceList);
 saveSettingsBtn.addEventListener('click', saveSettings);
-deviceSearch.addEventListener('input', updateDeviceList);
+deviceSearch.addEventListener('input', () => {
+    // Searches run on the server once typing pauses
+    clearTimeout(deviceSearchTimer);
+    deviceSearchTimer = setTimeout(() => {
+        deviceRows = [];
+        document.querySelector('.device-list').scrollTop = 0;
+        updateDeviceList();
+    }, 250);
+});
+
+// Only the rows in view are rendered; redraw once per frame while scrolling
+let deviceScrollFrame = null;
+document.querySelector('.device-list').addEventListener('scroll', () => {
+    if (deviceScrollFrame) return;
+    deviceScrollFrame = requestAnimationFrame(() => {
+        deviceScrollFrame = null;
+        renderDeviceList();
+    });
+});
+
+// Sortable columns: click to sort, click again to reverse
+document.querySelectorAll('#devices-table th[data-sort]').forEach(header => {
+    header.addEventListener('click', () => {
+        const sort = header.dataset.sort;
+        if (deviceSort.sort === sort) {
+            deviceSort.order = deviceSort.order === 'asc' ? 'desc' : 'asc';
+        } else {
+            // Newest first is the useful default for last seen
+            deviceSort = { sort, order: sort === 'last_seen' ? 'desc' : 'asc' };
+        }
+        document.querySelectorAll('#devices-table th[data-sort]').forEach(th => {
+            th.classList.remove('sorted-asc', 'sorted-desc');
+        });
+        header.classList.add(`sorted-${deviceSort.order}`);
+        deviceRows = [];
+        document.querySelector('.device-list').scrollTop = 0;
+        updateDeviceList();
+    });
+});
 modalCancel.addEventListener('click', closeConfirmModal);
 closeModal.addEventListener('click', closeConfirmModal);
 
@@ -551,17 +708,50 @@ window.addEventListener('click', (e) => {
     }
 });
 
+// Function to subscribe to server-pushed updates. The browser reconnects on
+// its own and resumes from the last event id it received.
+function connectEvents() {
+    const source = new EventSource('/api/events');
+    
+    source.addEventListener('reset', () => {
+        // Events were missed while disconnected, reload everything once
+        updateDashboardStats();
+        updateTrafficChart();
+        if (devicesLoaded) updateDeviceList();
+    });
+    source.addEventListener('stats', (e) => applyStats(JSON.parse(e.data)));
+    source.addEventListener('devices', (e) => applyDeviceDelta(JSON.parse(e.data)));
+    source.addEventListener('traffic', (e) => {
+        const sample = JSON.parse(e.data);
+        document.getElementById('download-stats').textContent = formatBandwidth(sample.download_rate);
+        document.getElementById('upload-stats').textContent = formatBandwidth(sample.upload_rate);
+        
+        const now = Date.now();
+        if (realtimeEnabled && now - lastChartRefresh >= CHART_REFRESH_MS) {
+            lastChartRefresh = now;
+            updateTrafficChart();
+        }
+    });
+    source.onerror = () => {
+        console.warn('Live update connection lost, reconnecting...');
+    };
+}
+
 // Initialize dashboard
 document.addEventListener('DOMContentLoaded', () => {
     // Initial data load
     updateDashboardStats();
     updateTrafficChart();
     
-    // Set up periodic refresh (every 10 seconds for dashboard)
-    setInterval(() => {
-        updateDashboardStats();
-        updateTrafficChart();
-    }, 10000);
+    if (window.EventSource) {
+        connectEvents();
+    } else {
+        // Fall back to periodic refresh (every 10 seconds for dashboard)
+        setInterval(() => {
+            updateDashboardStats();
+            if (realtimeEnabled) updateTrafficChart();
+        }, 10000);
+    }
 });
 
 
@@ -603,6 +793,7 @@ document.querySelectorAll('.time-btn').forEach(btn => {
 
 // Function to fetch chart data based on time range
 function fetchChartData(range) {
+    currentRange = range;
     fetch(`/api/traffic-history?range=${range}`)
         .then(response => response.json())
         .then(data => {
@@ -617,20 +808,21 @@ function fetchChartData(range) {
 
 // Function to update chart with new data
 function updateChartWithData(data) {
-    // Format the data as needed for the chart
-    const formattedLabels = data.timestamps.map(timestamp => {
+    // Longer ranges span several days, so include the date in the labels
+    const labelFormat = data.range === '7d'
+        ? { weekday: 'short', hour: '2-digit', minute: '2-digit' }
+        : { hour: '2-digit', minute: '2-digit' };
+    
+    chartDatasets.labels = data.timestamps.map(timestamp => {
         const date = new Date(timestamp);
-        return date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+        return date.toLocaleString([], labelFormat);
     });
     
-    // Calculate rates as before
-    // ... existing rate calculation code ...
+    // The server already computes rates (bytes/s), convert to KB/s for display
+    chartDatasets.download = data.download_rate.map(rate => rate / 1024);
+    chartDatasets.upload = data.upload_rate.map(rate => rate / 1024);
     
-    // Update chart
-    networkChart.data.labels = formattedLabels;
-    networkChart.data.datasets[0].data = downloadRates;
-    networkChart.data.datasets[1].data = uploadRates;
-    networkChart.update();
+    updateChart();
 }
 
 
@@ -938,18 +1130,13 @@ realtimeToggle.innerHTML = `
 // Insert before the chart
 document.querySelector('.chart-card').insertBefore(realtimeToggle, document.getElementById('network-chart'));
 
-// Add event listener
-let realtimeInterval;
+// Add event listener (the chart follows pushed traffic samples while enabled)
 document.getElementById('realtime-checkbox').addEventListener('change', (e) => {
-    if (e.target.checked) {
-        // Enable real-time updates
-        realtimeInterval = setInterval(() => {
-            updateTrafficChart();
-        }, 5000); // Update every 5 seconds
+    realtimeEnabled = e.target.checked;
+    if (realtimeEnabled) {
+        updateTrafficChart();
         showToast('Real-time updates enabled', 'info');
     } else {
-        // Disable real-time updates
-        clearInterval(realtimeInterval);
         showToast('Real-time updates disabled', 'info');
     }
 });
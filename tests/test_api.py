@@ -0,0 +1,63 @@
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    app.devices.sync([], version=0, reset=True)
+    app.response_cache.clear()
+    app.devices.merge([{
+        'ip': '10.0.0.1', 'hostname': 'nas', 'status': 'up', 'last_seen': '2024-01-01 00:00:00',
+        'first_seen': '2024-01-01 00:00:00', 'mac': 'aa:00:00:00:00:01', 'vendor': 'Unknown',
+        'blocked': False, 'is_local': False
+    }])
+    return app.app.test_client()
+
+
+def test_devices_etag_answers_304_until_the_epoch_changes(client, monkeypatch):
+    response = client.get('/api/devices')
+    etag = response.headers['ETag']
+    assert app.etag_epoch in etag
+    assert client.get('/api/devices', headers={'If-None-Match': etag}).status_code == 304
+
+    # A restarted process counts versions from zero again
+    monkeypatch.setattr(app, 'etag_epoch', 'restarted')
+    response = client.get('/api/devices', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_since_newer_than_the_server_asks_for_a_reload(client):
+    version = app.devices.version
+    delta = client.get(f"/api/devices?since={version - 1}").get_json()
+    assert delta['reset'] is False
+    assert [record['ip'] for record in delta['changed']] == ['10.0.0.1']
+
+    delta = client.get(f"/api/devices?since={version + 100}").get_json()
+    assert delta['reset'] is True
+    assert delta['version'] == version
+    assert delta['changed'] == [] and delta['removed'] == []
+
+
+def test_stats_etag_carries_the_epoch(client):
+    etag = client.get('/api/stats').headers['ETag']
+    assert app.etag_epoch in etag
+    assert client.get('/api/stats', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_workers_use_the_engine_stats_version(client, monkeypatch):
+    for name in ('etag_epoch', 'network_stats', 'stats_version'):
+        monkeypatch.setattr(app, name, getattr(app, name))
+    # This worker's own counter has drifted from the engine's
+    app.stats_version = 41
+    app.apply_engine_snapshot({'version': 3, 'devices': [], 'epoch': 'engine1',
+                               'stats': {'version': 7, 'total_devices': 0}})
+    response = client.get('/api/stats')
+    assert response.headers['ETag'] == 'W/"stats-engine1-7"'
+    assert response.get_json()['version'] == 7
+
+    app.apply_engine_event('stats', {'version': 8, 'total_devices': 2})
+    response = client.get('/api/stats')
+    assert response.headers['ETag'] == 'W/"stats-engine1-8"'
+    assert response.get_json()['total_devices'] == 2
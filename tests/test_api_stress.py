@@ -0,0 +1,147 @@
+import ipaddress
+import random
+import threading
+import time
+
+import pytest
+
+import app
+from firewall import NullBackend
+from segments import Segment, SegmentSet
+
+CLIENTS = 8
+SECONDS = 1.5
+CIDR = '10.99.0.0/22'  # 4 shards of /24
+
+
+# Slow fake sweep that records how many shard sweeps run at once
+class FakeScanner:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.sweeps = 0
+
+    def sweep(self, hosts, timeout=0):
+        with self.lock:
+            self.active += 1
+            self.sweeps += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(0.02)
+            if isinstance(hosts, str):
+                hosts = [str(ip) for ip in ipaddress.ip_network(hosts).hosts()]
+            rng = random.Random()
+            return [{'ip': ip, 'status': 'up', 'mac': f"02:00:00:00:{i // 256 % 256:02x}:{i % 256:02x}"}
+                    for i, ip in enumerate(hosts) if rng.random() < 0.3]
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def stress_segment(monkeypatch):
+    scanner = FakeScanner()
+    monkeypatch.setattr(app, 'make_discovery_backend', lambda network_info: scanner)
+    monkeypatch.setattr(app.hostname_resolver, 'lookup', lambda ip: None)
+    monkeypatch.setattr(app.mac_resolver, 'reader', lambda: {})
+    monkeypatch.setattr(app.firewall, 'backend', NullBackend())
+    monkeypatch.setattr(app, 'scan_shard_prefix', 24)
+    monkeypatch.setattr(app, 'scan_mode', 'full')
+    monkeypatch.setattr(app, 'blocked_devices', [])
+    segments = SegmentSet()
+    segments.add(Segment('stress', lambda: {
+        'local_ip': '10.99.0.1', 'gateway_ip': '10.99.0.254', 'interface': 'lo',
+        'netmask': 'Unknown', 'cidr': CIDR, 'hostname': 'stress'
+    }))
+    monkeypatch.setattr(app, 'segments', segments)
+    app.devices.sync([], version=0, reset=True)
+    app.response_cache.clear()
+    return segments.get('stress'), scanner
+
+
+def client(stop, errors, counts):
+    test_client = app.app.test_client()
+    rng = random.Random()
+    while not stop.is_set():
+        roll = rng.random()
+        ip = f"10.99.{rng.randint(0, 3)}.{rng.randint(1, 250)}"
+        if roll < 0.4:
+            response = test_client.get('/api/devices')
+        elif roll < 0.55:
+            response = test_client.get(f"/api/devices?since={max(0, app.devices.version - 5)}")
+        elif roll < 0.75:
+            response = test_client.get('/api/stats')
+        elif roll < 0.85:
+            response = test_client.get('/api/scan')
+        elif roll < 0.93:
+            response = test_client.post('/api/block-device', json={'identifier': ip})
+        else:
+            response = test_client.post('/api/unblock-device', json={'identifier': ip})
+        counts[0] += 1
+        # Unknown devices answer 404, anything 5xx is a bug
+        if response.status_code >= 500:
+            errors.append((response.request.path, response.status_code))
+
+
+def test_api_under_scans_stays_consistent_and_bounded(stress_segment, monkeypatch):
+    segment, scanner = stress_segment
+
+    # Scans of the segment, whether from the loop or /api/scan, must never overlap
+    scans = {'active': 0, 'max_active': 0, 'count': 0}
+    scan_lock = threading.Lock()
+    scan_and_save = app.scan_and_save
+
+    def counted_scan(*args, **kwargs):
+        with scan_lock:
+            scans['active'] += 1
+            scans['count'] += 1
+            scans['max_active'] = max(scans['max_active'], scans['active'])
+        try:
+            return scan_and_save(*args, **kwargs)
+        finally:
+            with scan_lock:
+                scans['active'] -= 1
+    monkeypatch.setattr(app, 'scan_and_save', counted_scan)
+
+    base_threads = threading.active_count()
+    stop = threading.Event()
+    errors = []
+    counts = [0]
+
+    def scan_loop():
+        while not stop.is_set():
+            future, _ = app.scan_flight.submit(segment.name, app.scan_and_save, segment=segment)
+            future.result()
+
+    threads = [threading.Thread(target=scan_loop, daemon=True)]
+    threads += [threading.Thread(target=client, args=(stop, errors, counts), daemon=True) for _ in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+    max_threads = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < SECONDS:
+        max_threads = max(max_threads, threading.active_count())
+        time.sleep(0.02)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=30)
+    # Let a scan started by a last /api/scan finish before the fixture undoes the patches
+    deadline = time.monotonic() + 30
+    while app.scan_flight.running(segment.name) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert not errors, errors[:10]
+    assert counts[0] > 0 and scans['count'] > 1
+    # Joined scan requests never start a second scan of the segment
+    assert scans['max_active'] == 1
+    shards = len(list(ipaddress.ip_network(CIDR).subnets(new_prefix=24)))
+    assert scanner.max_active <= min(app.scan_workers, shards), scanner.max_active
+    # Indexes still agree with the table
+    assert sum(len(ips) for ips in app.devices.by_segment.values()) == len(app.devices)
+    assert len(app.devices.snapshot()) == len(app.devices)
+    # Clients, the scan loop, the background pool, one scan's shard workers,
+    # the DNS pool and a few single service threads (firewall, timers)
+    dns_workers = app.hostname_resolver.pool._max_workers
+    limit = base_threads + CLIENTS + 1 + app.background_workers + app.scan_workers + dns_workers + 4
+    assert max_threads <= limit, (max_threads, limit)
@@ -0,0 +1,119 @@
+import socket
+import struct
+
+import pytest
+
+from arp_scan import ETH_P_ARP, ArpScanBackend, ArpScanError, build_arp_request, mac_to_bytes, parse_arp_reply
+
+LOCAL_MAC = '02:00:00:00:00:01'
+
+
+def arp_reply(ip, mac, opcode=2):
+    ethernet = mac_to_bytes(LOCAL_MAC) + mac_to_bytes(mac) + struct.pack('!H', ETH_P_ARP)
+    return ethernet + struct.pack('!HHBBH6s4s6s4s', 1, 0x0800, 6, 4, opcode,
+                                  mac_to_bytes(mac), socket.inet_aton(ip),
+                                  mac_to_bytes(LOCAL_MAC), socket.inet_aton('10.0.0.1'))
+
+
+# Stand-in for the AF_PACKET socket: answers requests for `hosts` and
+# delivers any `noise` frames first
+class FakeSocket:
+    def __init__(self, hosts, noise=()):
+        self.hosts = hosts
+        self.inbox = list(noise)
+        self.sent = []
+        self.closed = False
+
+    def setblocking(self, flag):
+        assert flag is False
+
+    def send(self, frame):
+        target = socket.inet_ntoa(frame[38:42])
+        self.sent.append(target)
+        if target in self.hosts:
+            self.inbox.append(arp_reply(target, self.hosts[target]))
+        return len(frame)
+
+    def recv(self, size):
+        if not self.inbox:
+            raise BlockingIOError
+        return self.inbox.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+def make_backend(sock, rate=100000):
+    return ArpScanBackend('eth0', '10.0.0.1', LOCAL_MAC, rate=rate, reply_wait=0.02,
+                          socket_factory=lambda interface: sock)
+
+
+def test_sweep_returns_answering_hosts_with_macs():
+    hosts = {'10.0.0.7': 'aa:bb:cc:00:00:07', '10.0.0.200': 'aa:bb:cc:00:00:c8'}
+    sock = FakeSocket(hosts)
+    results = make_backend(sock).sweep('10.0.0.0/24')
+
+    found = {result['ip']: result['mac'] for result in results}
+    assert found == {'10.0.0.1': LOCAL_MAC, **hosts}
+    assert all(result['status'] == 'up' for result in results)
+    # Every address but our own was asked once, in address order
+    assert len(sock.sent) == 255 and '10.0.0.1' not in sock.sent
+    assert sock.sent[:2] == ['10.0.0.0', '10.0.0.2']
+    assert sock.closed
+
+
+def test_sweep_of_an_ip_list_ignores_unrequested_replies():
+    sock = FakeSocket({'10.0.0.5': 'aa:00:00:00:00:05', '10.0.0.6': 'aa:00:00:00:00:06'},
+                      noise=[arp_reply('10.0.0.99', 'aa:00:00:00:00:99')])
+    results = make_backend(sock).sweep(['10.0.0.5', '10.0.0.8'])
+    assert results == [{'ip': '10.0.0.5', 'status': 'up', 'mac': 'aa:00:00:00:00:05'}]
+
+
+def test_malformed_and_foreign_frames_are_skipped():
+    request = build_arp_request(mac_to_bytes(LOCAL_MAC), '10.0.0.1', '10.0.0.3')
+    ipv4 = arp_reply('10.0.0.3', 'aa:00:00:00:00:03')[:12] + b'\x08\x00' + b'\x00' * 28
+    noise = [b'', b'\x00' * 10, arp_reply('10.0.0.3', 'aa:00:00:00:00:03')[:41], ipv4, request,
+             arp_reply('10.0.0.3', 'aa:00:00:00:00:33', opcode=1)]
+    for frame in noise:
+        assert parse_arp_reply(frame) is None
+
+    sock = FakeSocket({'10.0.0.3': 'aa:00:00:00:00:03'}, noise=noise)
+    results = make_backend(sock).sweep(['10.0.0.3'])
+    assert results == [{'ip': '10.0.0.3', 'status': 'up', 'mac': 'aa:00:00:00:00:03'}]
+
+
+def test_timeout_fails_the_sweep():
+    sock = FakeSocket({'10.0.0.2': 'aa:00:00:00:00:02'})
+    # 200 packets/s: a /24 would take over a second. Addresses never asked
+    # must not come back as missing, so the whole shard fails.
+    with pytest.raises(ArpScanError):
+        make_backend(sock, rate=200).sweep('10.0.0.0/24', timeout=0.05)
+    assert 0 < len(sock.sent) < 50
+    assert sock.closed
+
+
+def test_full_transmit_queue_is_retried():
+    class BusySocket(FakeSocket):
+        attempts = 0
+
+        def send(self, frame):
+            self.attempts += 1
+            if self.attempts % 3:
+                raise BlockingIOError
+            return super().send(frame)
+
+    sock = BusySocket({'10.0.0.5': 'aa:00:00:00:00:05'})
+    results = make_backend(sock).sweep(['10.0.0.4', '10.0.0.5', '10.0.0.6'])
+    assert sock.sent == ['10.0.0.4', '10.0.0.5', '10.0.0.6']
+    assert results == [{'ip': '10.0.0.5', 'status': 'up', 'mac': 'aa:00:00:00:00:05'}]
+
+
+def test_socket_is_closed_when_sending_fails():
+    class BrokenSocket(FakeSocket):
+        def send(self, frame):
+            raise OSError('network is down')
+
+    sock = BrokenSocket({})
+    with pytest.raises(OSError):
+        make_backend(sock).sweep(['10.0.0.2'])
+    assert sock.closed
@@ -0,0 +1,37 @@
+from bandwidth import BandwidthAccounting, parse_conntrack
+
+
+# A TCP and a UDP flow between the same addresses and ports, as read from
+# /proc (with the address family) and from the conntrack tool (without)
+def dump(tcp, udp, prefix='ipv4     2 '):
+    return (
+        f"{prefix}tcp      6 431999 ESTABLISHED src=192.168.1.10 dst=1.1.1.1 sport=40000 dport=443 "
+        f"packets=10 bytes={tcp[0]} src=1.1.1.1 dst=192.168.1.10 sport=443 dport=40000 "
+        f"packets=10 bytes={tcp[1]} [ASSURED] mark=0 use=1\n"
+        f"{prefix}udp      17 29 src=192.168.1.10 dst=1.1.1.1 sport=40000 dport=443 packets=5 bytes={udp[0]} "
+        f"src=1.1.1.1 dst=192.168.1.10 sport=443 dport=40000 packets=5 bytes={udp[1]} mark=0 use=1\n"
+        f"{prefix}icmp     1 29 src=192.168.1.10 dst=1.1.1.1 type=8 code=0 id=7 packets=1 bytes=84 "
+        f"[UNREPLIED] src=1.1.1.1 dst=192.168.1.10 type=0 code=0 id=7 packets=0 bytes=0 mark=0 use=1\n"
+    )
+
+
+def test_flows_are_keyed_by_protocol():
+    for prefix in ('ipv4     2 ', ''):
+        flows = parse_conntrack(dump((1000, 5000), (300, 700), prefix))
+        assert flows == {
+            ('tcp', '192.168.1.10', '1.1.1.1', 'sport=40000 dport=443'): (1000, 5000),
+            ('udp', '192.168.1.10', '1.1.1.1', 'sport=40000 dport=443'): (300, 700),
+            ('icmp', '192.168.1.10', '1.1.1.1', 'type=8 code=0'): (84, 0),
+        }
+
+
+def test_same_ports_over_tcp_and_udp_are_counted_apart():
+    dumps = iter([dump((1000, 5000), (300, 700)), dump((1500, 9000), (300, 700)),
+                  dump((1500, 9000), (400, 900))])
+    accounting = BandwidthAccounting(reader=lambda: next(dumps))
+    accounting.poll(now=0)
+    # Only TCP grew: UDP's unchanged counts must not be charged against it
+    assert accounting.poll(now=10) == {'192.168.1.10': [4000, 500]}
+    assert accounting.rates['192.168.1.10'] == (400.0, 50.0)
+    assert accounting.poll(now=20) == {'192.168.1.10': [200, 100]}
+    assert accounting.totals['192.168.1.10'] == [4200, 600]
@@ -0,0 +1,75 @@
+import json
+import socket
+import types
+
+import pytest
+
+from engine_link import EngineClient, EngineError, EngineServer, _Handler, parse_address
+from events import EventBus
+
+
+@pytest.mark.parametrize('address', ['127.0.0.1:7000', 'localhost:7000', ':7000', '127.0.0.2:7000', '::1:7000'])
+def test_tcp_addresses_on_loopback_are_accepted(address):
+    family, target = parse_address(address)
+    assert family == socket.AF_INET and target[1] == 7000
+
+
+@pytest.mark.parametrize('address', ['0.0.0.0:7000', '192.168.1.5:7000', 'engine.lan:7000', '[::]:7000'])
+def test_tcp_addresses_off_loopback_are_refused(address):
+    with pytest.raises(ValueError):
+        parse_address(address)
+
+
+def test_unix_socket_paths():
+    assert parse_address('network_guardian.sock') == (socket.AF_UNIX, 'network_guardian.sock')
+    assert parse_address('/run/ng/engine:1') == (socket.AF_UNIX, '/run/ng/engine:1')
+
+
+def make_engine(token=None):
+    calls = []
+    handlers = {'http': lambda *args: calls.append(args) or [200, 'application/json', '{}', {}]}
+    engine = EngineServer('unused.sock', EventBus(), lambda: {'version': 0}, handlers, token=token)
+    return engine, calls
+
+
+# Send one request line to a handler over a stand-in socket pair, return the reply line
+def exchange(engine, message):
+    ours, theirs = socket.socketpair()
+    with ours, theirs:
+        ours.sendall(json.dumps(message).encode() + b'\n')
+        _Handler(theirs, None, types.SimpleNamespace(engine=engine))
+        theirs.shutdown(socket.SHUT_WR)
+        with ours.makefile('rb') as reader:
+            line = reader.readline()
+    return json.loads(line) if line else None
+
+
+def test_requests_without_the_token_are_refused():
+    engine, calls = make_engine(token='s3cret')
+    request = {'op': 'http', 'args': ['POST', '/api/block', '', None]}
+    assert exchange(engine, request) == {'error': 'Invalid engine token'}
+    assert exchange(engine, dict(request, token='guess')) == {'error': 'Invalid engine token'}
+    assert exchange(engine, {'op': 'subscribe'}) == {'error': 'Invalid engine token'}
+    assert calls == []
+
+    assert exchange(engine, dict(request, token='s3cret')) == {'result': [200, 'application/json', '{}', {}]}
+    assert calls == [('POST', '/api/block', '', None)]
+
+
+def test_no_token_configured_accepts_requests():
+    engine, calls = make_engine()
+    assert exchange(engine, {'op': 'http', 'args': ['GET', '/', '', None]})['result'][0] == 200
+    assert exchange(engine, {'op': 'nope'}) == {'error': "Unknown operation 'nope'"}
+
+
+def test_client_sends_its_token(tmp_path):
+    engine, calls = make_engine(token='s3cret')
+    engine.address = str(tmp_path / 'engine.sock')
+    engine.start()
+    try:
+        assert EngineClient(engine.address, token='s3cret').call('http', 'GET', '/', '', None)[0] == 200
+        with pytest.raises(EngineError, match='Invalid engine token'):
+            EngineClient(engine.address, token='wrong').call('http', 'GET', '/', '', None)
+    finally:
+        engine.stop()
+    assert len(calls) == 1
@@ -0,0 +1,144 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from firewall import SET_NAME, TABLE, CommandRunner, Firewall, FirewallError, IpsetBackend, NftablesBackend
+
+
+# Records every command instead of running it; fails the ones `fail(args)` picks
+class FakeRunner:
+    def __init__(self, fail=None):
+        self.calls = []
+        self.fail = fail
+
+    def run(self, args, input=None):
+        self.calls.append((list(args), input))
+        if self.fail is not None and self.fail(args):
+            raise FirewallError(f"{' '.join(args)} failed: permission denied")
+        return ''
+
+
+def make_firewall(backend_class, fail=None):
+    runner = FakeRunner(fail)
+    return Firewall(backend_class(runner), batch_delay=0.01), runner
+
+
+def test_nftables_burst_is_one_transaction():
+    firewall, runner = make_firewall(NftablesBackend)
+    firewall.block(['10.0.0.2'])
+    firewall.block(['10.0.0.1', '10.0.0.3'])
+    firewall.unblock(['10.0.0.3'])
+    assert firewall.flush(timeout=5)
+
+    setup, batch = runner.calls
+    assert setup[0] == ['nft', '-f', '-']
+    assert f"set {SET_NAME}" in setup[1] and f"delete table inet {TABLE}" in setup[1]
+    assert batch == (['nft', '-f', '-'], (
+        f"add element inet {TABLE} {SET_NAME} {{ 10.0.0.1, 10.0.0.2 }}\n"
+        f"add element inet {TABLE} {SET_NAME} {{ 10.0.0.3 }}\n"
+        f"delete element inet {TABLE} {SET_NAME} {{ 10.0.0.3 }}\n"))
+    assert firewall.desired == {'10.0.0.1', '10.0.0.2'}
+
+
+def test_nftables_unblock_and_reconcile():
+    firewall, runner = make_firewall(NftablesBackend)
+    firewall.reconcile(['10.0.0.5', '10.0.0.4'])
+    assert runner.calls[-1] == (['nft', '-f', '-'], (
+        f"flush set inet {TABLE} {SET_NAME}\n"
+        f"add element inet {TABLE} {SET_NAME} {{ 10.0.0.4, 10.0.0.5 }}\n"))
+
+    firewall.unblock(['10.0.0.4'])
+    assert firewall.flush(timeout=5)
+    # Setup ran once, for the reconcile
+    assert len(runner.calls) == 3
+    assert runner.calls[-1][1] == (f"add element inet {TABLE} {SET_NAME} {{ 10.0.0.4 }}\n"
+                                   f"delete element inet {TABLE} {SET_NAME} {{ 10.0.0.4 }}\n")
+
+    firewall.reconcile([])
+    assert runner.calls[-1][1] == f"flush set inet {TABLE} {SET_NAME}\n"
+
+
+def test_ipset_batches_and_swaps():
+    # `iptables -C` fails for missing rules, which are then inserted
+    firewall, runner = make_firewall(IpsetBackend, fail=lambda args: args[:2] == ['iptables', '-C'])
+    firewall.block(['10.0.0.2', '10.0.0.1'])
+    firewall.unblock(['10.0.0.9'])
+    assert firewall.flush(timeout=5)
+
+    commands = [args for args, _ in runner.calls]
+    assert commands[0] == ['ipset', 'restore', '-exist']
+    assert [args[:2] for args in commands[1:9]] == [['iptables', '-C'], ['iptables', '-I']] * 4
+    assert runner.calls[-1] == (['ipset', 'restore', '-exist'],
+                                f"add {SET_NAME} 10.0.0.1\nadd {SET_NAME} 10.0.0.2\ndel {SET_NAME} 10.0.0.9\n")
+
+    firewall.reconcile(['10.0.0.7'])
+    assert runner.calls[-1][1] == (f"create {SET_NAME}_new hash:ip\nflush {SET_NAME}_new\n"
+                                   f"add {SET_NAME}_new 10.0.0.7\n"
+                                   f"swap {SET_NAME}_new {SET_NAME}\ndestroy {SET_NAME}_new\n")
+
+
+# A runner whose commands hang until released, like a slow nft
+class SlowRunner(FakeRunner):
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def run(self, args, input=None):
+        result = super().run(args, input)
+        self.started.set()
+        assert self.release.wait(10)
+        return result
+
+
+def test_callers_do_not_wait_for_a_running_command():
+    runner = SlowRunner()
+    firewall = Firewall(NftablesBackend(runner), batch_delay=0.01)
+    firewall.block(['10.0.0.1'])
+    assert runner.started.wait(5)
+
+    # While the setup command hangs, more changes are still queued at once
+    start = time.monotonic()
+    firewall.block(['10.0.0.2'])
+    firewall.unblock(['10.0.0.1'])
+    assert time.monotonic() - start < 1
+    assert not firewall.flush(timeout=0.05)
+
+    runner.release.set()
+    assert firewall.flush(timeout=5)
+    setup, first, second = runner.calls
+    assert first[1] == f"add element inet {TABLE} {SET_NAME} {{ 10.0.0.1 }}\n"
+    assert second[1] == (f"add element inet {TABLE} {SET_NAME} {{ 10.0.0.2 }}\n"
+                         f"add element inet {TABLE} {SET_NAME} {{ 10.0.0.1 }}\n"
+                         f"delete element inet {TABLE} {SET_NAME} {{ 10.0.0.1 }}\n")
+    assert firewall.desired == {'10.0.0.2'}
+
+
+def test_failed_command_is_logged_and_reconcile_repairs(caplog):
+    failing = [True]
+    firewall, runner = make_firewall(NftablesBackend, fail=lambda args: failing[0])
+    firewall.block(['10.0.0.1'])
+    assert firewall.flush(timeout=5)
+    assert 'Error applying firewall changes' in caplog.text
+    # The desired state survives a failed command
+    assert firewall.desired == {'10.0.0.1'}
+
+    # Setup failed too, so it is retried with the next change
+    failing[0] = False
+    firewall.reconcile(firewall.desired)
+    setup, replace = runner.calls[-2:]
+    assert 'delete table' in setup[1]
+    assert replace[1].endswith(f"add element inet {TABLE} {SET_NAME} {{ 10.0.0.1 }}\n")
+
+    failing[0] = True
+    firewall.reconcile(['10.0.0.2'])
+    assert 'Error reconciling firewall' in caplog.text
+
+
+def test_command_runner_raises_on_nonzero_exit():
+    runner = CommandRunner(use_sudo=False)
+    assert runner.run([sys.executable, '-c', 'print("ok")']) == 'ok\n'
+    with pytest.raises(FirewallError, match='nope'):
+        runner.run([sys.executable, '-c', 'import sys; sys.stderr.write("nope"); sys.exit(3)'])
@@ -0,0 +1,166 @@
+import json
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import pytest
+from werkzeug.serving import make_server
+
+import app
+from fleet import FleetCollector, FleetSender
+from listing import ip_sort_key
+from registry import DeviceRegistry
+
+
+def make_devices(site, count, status='up', hostname='host'):
+    return [{
+        'ip': f"10.{site}.{i >> 8 & 255}.{i & 255}",
+        'hostname': f"{hostname}-{i}",
+        'status': status,
+        'last_seen': '2024-01-01 00:00:00',
+        'first_seen': '2024-01-01 00:00:00',
+        'mac': f"02:00:{site:02x}:00:{i >> 8 & 255:02x}:{i & 255:02x}",
+        'vendor': 'Unknown',
+        'blocked': False,
+        'is_local': False
+    } for i in range(count)]
+
+
+# The app's /api/fleet/* routes on a loopback port
+class Server:
+    def __init__(self, port=0):
+        self.server = make_server('127.0.0.1', port, app.app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(app, 'fleet_collector', FleetCollector(max_inflight=1, retry_after=0.2, stale_after=30))
+    monkeypatch.setattr(app, 'fleet_token', None)
+    servers = [Server()]
+    yield servers
+    servers[-1].stop()
+
+
+def get(port, path):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=10) as response:
+        return json.loads(response.read())
+
+
+def wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def synced(senders):
+    return all(sender.acked_version == sender.registry.version and not sender.samples for sender in senders)
+
+
+# Every device on the collector, following next_cursor through small pages
+def walk(port, **query):
+    items = []
+    cursor = None
+    while True:
+        params = dict(query, limit=37, **({'cursor': cursor} if cursor else {}))
+        page = get(port, f"/api/fleet/devices?{urllib.parse.urlencode(params)}")
+        items.extend((item['site'], item['ip'], item['status']) for item in page['devices'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return items
+
+
+def test_two_sensors_sync_through_outages_and_a_collector_restart(server):
+    port = server[0].port
+    senders = []
+    for site, count in ((1, 150), (2, 90)):
+        registry = DeviceRegistry()
+        registry.merge(make_devices(site, count))
+        sender = FleetSender(f"http://127.0.0.1:{port}", f"site-{site}", registry, interval=0.05,
+                             batch_size=50, max_backoff=0.2)
+        for second in range(10):
+            sender.queue_sample(time.time() - 10 + second, 1e6, 2e5, second * 1e6, second * 2e5)
+        senders.append(sender)
+    site_a, site_b = senders
+
+    # Backpressure: while the only push slot is taken, sensors are turned
+    # away with 503 and come back after Retry-After
+    collector = app.fleet_collector
+    collector.slots.acquire()
+    for sender in senders:
+        sender.start()
+    try:
+        wait_for(lambda: collector.rejected >= 2)
+        assert all(sender.acked_version is None for sender in senders)
+    finally:
+        collector.slots.release()
+    wait_for(lambda: synced(senders))
+    totals = get(port, '/api/fleet/stats')['totals']
+    assert (totals['sites'], totals['total_devices'], totals['active_devices']) == (2, 240, 240)
+
+    # Deltas only touch their own site
+    version_b = collector.sites['site-2'].registry.version
+    site_a.registry.merge(make_devices(1, 10, hostname='renamed'))
+    site_a.registry.remove('10.1.0.20')
+    wait_for(lambda: synced(senders))
+    mirrored = collector.sites['site-1'].registry
+    assert len(mirrored) == 149 and mirrored.get('10.1.0.20') is None
+    assert mirrored.get('10.1.0.3').hostname == 'renamed-3'
+    assert collector.sites['site-2'].registry.version == version_b
+
+    # Outage: the collector goes away while both sites change, then comes
+    # back on the same port; the sensors resend what was not acknowledged
+    server[0].stop()
+    site_a.registry.merge(make_devices(1, 150, status='down'))
+    site_b.registry.merge(make_devices(2, 110))
+    for sender in senders:
+        sender.queue_sample(time.time(), 1e6, 2e5, 1e9, 2e8)
+    wait_for(lambda: all(sender.failures for sender in senders))
+    server.append(Server(port))
+    wait_for(lambda: synced(senders))
+    totals = get(port, '/api/fleet/stats')['totals']
+    assert (totals['total_devices'], totals['active_devices']) == (260, 110)
+    for sender in senders:
+        # Every traffic sample arrived once
+        assert collector.sites[sender.site].sample == sender.sample_seq
+
+    # A restarted collector process knows nothing: the sensors' next deltas
+    # are refused (409) and they resync in full
+    app.fleet_collector = FleetCollector(max_inflight=1, retry_after=0.2, stale_after=30)
+    wait_for(lambda: get(port, '/api/fleet/stats')['totals']['total_devices'] == 260)
+    for sender in senders:
+        sender.stop()
+
+    # Pages cover the fleet once, ordered by site and then IP
+    items = walk(port)
+    expected = sorted([(sender.site, record['ip'], record['status'])
+                       for sender in senders for record in sender.registry.snapshot()],
+                      key=lambda item: (item[0], ip_sort_key(item[1])))
+    assert items == expected
+    assert walk(port, site='site-2') == [item for item in expected if item[0] == 'site-2']
+    assert walk(port, status='down') == [item for item in expected if item[2] == 'down']
+
+
+def test_busy_collector_answers_503_with_retry_after():
+    collector = FleetCollector(max_inflight=1, retry_after=4)
+    push = json.dumps({'site': 'a', 'instance': 'i1', 'reset': True, 'base': 0, 'version': 1,
+                       'devices': make_devices(1, 3)}).encode()
+    collector.slots.acquire()
+    status, _, headers = collector.handle_push(push, None)
+    assert status == 503 and 2 <= float(headers['Retry-After']) <= 6
+    assert collector.rejected == 1
+    collector.slots.release()
+
+    status, body, _ = collector.handle_push(push, None)
+    assert status == 200 and body['version'] == 1
+    # A delta from an instance the collector doesn't know asks for a resync
+    delta = json.dumps({'site': 'a', 'instance': 'i2', 'base': 1, 'version': 2, 'devices': []}).encode()
+    assert collector.handle_push(delta, None)[0] == 409
@@ -0,0 +1,93 @@
+import glob
+import os
+import subprocess
+import threading
+import time
+
+import pytest
+
+from kick_scheduler import KickScheduler
+
+MAX_JOBS = 4
+
+
+# Direct children of this process, read from /proc (Linux only)
+def child_count():
+    children = set()
+    for path in glob.glob(f"/proc/{os.getpid()}/task/*/children"):
+        with open(path) as f:
+            children.update(f.read().split())
+    return len(children)
+
+
+# Stand-in for arping: a short-lived real process, recording how many run at once
+class FakeArping:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.calls = []
+
+    def __call__(self, args):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.calls.append(args[1])
+        try:
+            subprocess.run(['sleep', '0.002'])
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/task'), reason="counts child processes in /proc")
+def test_many_kicks_stay_within_thread_and_process_bounds():
+    expired = []
+    arping = FakeArping()
+    scheduler = KickScheduler(on_expire=expired.append, max_jobs=MAX_JOBS, runner=arping)
+
+    base_threads = threading.active_count()
+    max_threads = max_children = 0
+    ips = [f"10.0.{i // 250}.{i % 250 + 1}" for i in range(200)]
+    kicks = ips + ips[:50]  # 250 kicks, 50 of them repeats
+
+    # Repeats must arrive before the first unblocks fire to be coalesced
+    for i, ip in enumerate(kicks):
+        scheduler.submit(ip, [['arping', ip], ['arping', ip]])
+        scheduler.schedule(ip, 1.0)
+        if i % 10 == 0:
+            max_threads = max(max_threads, threading.active_count())
+            max_children = max(max_children, child_count())
+
+    deadline = time.monotonic() + 30
+    while scheduler.stats()['pending_unblocks'] or scheduler.stats()['running_jobs']:
+        assert time.monotonic() < deadline, scheduler.stats()
+        max_threads = max(max_threads, threading.active_count())
+        max_children = max(max_children, child_count())
+        time.sleep(0.005)
+    scheduler.pool.shutdown()
+
+    # One timer thread plus the bounded job pool
+    assert max_threads <= base_threads + 1 + MAX_JOBS, max_threads
+    assert max_children <= MAX_JOBS, max_children
+    assert arping.max_active <= MAX_JOBS
+    # Every device was kicked, and repeated kicks are coalesced into a single unblock
+    assert set(arping.calls) == set(ips)
+    assert sorted(expired) == sorted(ips)
+
+
+def test_repeated_kick_extends_the_deadline_and_cancel_drops_it():
+    expired = []
+    scheduler = KickScheduler(on_expire=expired.append, runner=lambda args: None)
+    assert scheduler.schedule('10.0.0.1', 0.05) is True
+    assert scheduler.schedule('10.0.0.1', 0.2) is False
+    assert scheduler.schedule('10.0.0.2', 0.05) is True
+    assert scheduler.cancel('10.0.0.2') is True
+
+    time.sleep(0.1)
+    assert expired == []
+    deadline = time.monotonic() + 5
+    while not expired and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert expired == ['10.0.0.1']
+    assert scheduler.stats()['pending_unblocks'] == 0
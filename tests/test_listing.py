@@ -0,0 +1,140 @@
+import random
+
+from listing import Edits, ip_sort_key
+from registry import DeviceRegistry
+
+SEGMENTS = ('10.0.0.0/22', '10.0.4.0/22', '10.0.8.0/22')
+COUNT = 3000
+
+
+def make_device(i, rng, last_seen='2024-01-01 00:00:00'):
+    return {
+        'ip': f"10.0.{i // 256}.{i % 256}",
+        'hostname': rng.choice(['Unknown', f"host-{i % 50}", f"NAS-{i % 5}"]),
+        'status': 'up' if rng.random() < 0.7 else 'down',
+        'last_seen': last_seen,
+        'first_seen': '2024-01-01 00:00:00',
+        'mac': f"02:00:00:00:{i // 256:02x}:{i % 256:02x}",
+        'vendor': 'Unknown',
+        'blocked': rng.random() < 0.1,
+        'is_local': False,
+        'segment': SEGMENTS[i // 1024]
+    }
+
+
+def make_registry(count=COUNT, seed=1):
+    registry = DeviceRegistry()
+    registry.merge([make_device(i, random.Random(seed + i)) for i in range(1, count + 1)])
+    registry.page()  # Build the index, so later merges are caught up
+    return registry
+
+
+# Every matching IP in page order, computed from the snapshot
+def expected(registry, sort='ip', descending=False, status=None, segment=None, blocked=None, prefix=None):
+    def key(record):
+        value = record[sort].lower() if sort == 'hostname' else record[sort]
+        return ('' if sort == 'ip' else value, ip_sort_key(record['ip']))
+
+    records = [record for record in registry.snapshot()
+               if (status is None or record['status'] in status)
+               and (segment is None or record['segment'] == segment)
+               and (blocked is None or record['blocked'] == blocked)
+               and (not prefix or record['hostname'].lower().startswith(prefix)
+                    or record['ip'].startswith(prefix) or record['mac'].lower().startswith(prefix))]
+    return [record['ip'] for record in sorted(records, key=key, reverse=descending)]
+
+
+# Follow cursors to the end, returning every IP and the totals reported
+def walk(registry, limit=37, **query):
+    ips, totals = [], set()
+    cursor = None
+    while True:
+        records, cursor, total = registry.page(cursor=cursor, limit=limit, **query)
+        ips.extend(record['ip'] for record in records)
+        totals.add(total)
+        if cursor is None:
+            return ips, totals
+
+
+QUERIES = (
+    {},
+    {'sort': 'hostname'},
+    {'sort': 'hostname', 'descending': True},
+    {'sort': 'last_seen', 'descending': True, 'status': {'up'}},
+    {'sort': 'status', 'segment': '10.0.4.0/22'},
+    {'blocked': True},
+    {'sort': 'hostname', 'blocked': False, 'status': {'down'}},
+    {'prefix': 'nas-'},
+    {'prefix': '10.0.9.', 'sort': 'last_seen'},
+    {'prefix': '02:00:00:00:01', 'blocked': False},
+)
+
+
+def test_edits_keep_lists_sorted():
+    rng = random.Random(3)
+    # A few edits, splices and a rewrite, with spread and clustered removals
+    for count, clustered in ((0, False), (5, False), (40, False), (40, True), (300, False), (1200, False)):
+        keys = sorted({f"{rng.randrange(10 ** 6):06d}" for _ in range(1000)})
+        count = min(count, len(keys) // 2)
+        removed = set(keys[300:300 + count] if clustered else rng.sample(keys, count))
+        added = {f"{rng.randrange(10 ** 6):06d}" for _ in range(count)} - set(keys)
+        added |= set(rng.sample(sorted(removed), len(removed) // 4))  # Removed and added back
+        edits = Edits()
+        for key in removed:
+            edits.discard(keys, key)
+        for key in added:
+            edits.add(keys, key)
+        want = sorted((set(keys) - removed) | added)
+        edits.apply()
+        assert keys == want
+
+
+def test_filters_and_sorts_match_the_table():
+    registry = make_registry()
+    for query in QUERIES:
+        want = expected(registry, **query)
+        ips, totals = walk(registry, **query)
+        assert ips == want, query
+        assert totals == {len(want)}, query
+
+
+def test_catch_up_after_shard_merges():
+    registry = make_registry()
+    rng = random.Random(5)
+    for shard, minute in ((5, 1), (0, 2), (11, 3), (5, 4), (6, 5)):
+        # Part of an incremental scan: a range of devices seen again, some changed
+        devices = [make_device(i, rng, last_seen=f"2024-01-01 00:{minute:02d}:00")
+                   for i in range(shard * 256 + 1, shard * 256 + 65)]
+        for moved in devices[:10]:
+            moved['segment'] = SEGMENTS[(SEGMENTS.index(moved['segment']) + 1) % 3]
+        # ...and the last few of the range did not answer
+        registry.merge(devices[:-3])
+        scanned = {device['ip'] for device in devices}
+        registry.mark_gone(scanned - {device['ip'] for device in devices[-3:]}, keep=lambda ip: ip not in scanned)
+        for query in QUERIES:
+            assert walk(registry, **query)[0] == expected(registry, **query), (shard, query)
+
+
+def test_cursor_is_stable_while_devices_change():
+    registry = make_registry()
+    rng = random.Random(7)
+    seen, changed = [], set()
+    cursor = None
+    minute = 0
+    while True:
+        records, cursor, _ = registry.page(sort='last_seen', cursor=cursor, limit=200)
+        seen.extend(record['ip'] for record in records)
+        if cursor is None:
+            break
+        # Between pages, devices are seen again (moving them past the
+        # cursor's last_seen) and a few change status or hostname
+        minute += 1
+        devices = [make_device(i, rng, last_seen=f"2024-01-01 00:{minute:02d}:00")
+                   for i in rng.sample(range(1, COUNT + 1), 40)]
+        registry.merge(devices)
+        changed.update(device['ip'] for device in devices)
+
+    # Devices that never changed are listed exactly once, in their original order
+    unchanged = [ip for ip in seen if ip not in changed]
+    assert len(unchanged) == len(set(unchanged)) == COUNT - len(changed)
+    assert unchanged == [ip for ip in expected(make_registry(), sort='last_seen') if ip not in changed]
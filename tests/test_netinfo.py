@@ -0,0 +1,50 @@
+import pytest
+
+from netinfo import NetworkInfoProvider
+
+
+def test_get_computes_once_until_refresh():
+    calls = []
+    provider = NetworkInfoProvider(lambda: calls.append(1) or {'local_ip': '10.0.0.1'})
+    assert provider.get() == {'local_ip': '10.0.0.1'}
+    provider.get()
+    assert len(calls) == 1 and provider.version == 1
+
+    # Same snapshot after a kernel change: recomputed, version kept
+    provider.refresh()
+    assert len(calls) == 2 and provider.version == 1
+
+
+def test_cached_snapshots_follow_kernel_changes():
+    provider = NetworkInfoProvider(lambda: {'interface': 'eth0'})
+    addresses = {'eth1': '10.1.0.1'}
+    calls = []
+
+    def eth1():
+        calls.append(1)
+        return {'interface': 'eth1', 'local_ip': addresses['eth1']}
+
+    assert provider.cached(('eth1', None), eth1)['local_ip'] == '10.1.0.1'
+    assert provider.cached(('eth1', None), eth1)['local_ip'] == '10.1.0.1'
+    assert len(calls) == 1
+
+    # Another interface changed: the default snapshot is the same, eth1's is recomputed
+    addresses['eth1'] = '10.1.0.2'
+    provider.refresh()
+    assert provider.cached(('eth1', None), eth1)['local_ip'] == '10.1.0.2'
+    assert len(calls) == 2
+
+
+def test_cached_does_not_keep_errors():
+    provider = NetworkInfoProvider(lambda: {})
+    state = {'up': False}
+
+    def eth2():
+        if not state['up']:
+            raise ValueError('Interface eth2 has no IPv4 address')
+        return {'interface': 'eth2'}
+
+    with pytest.raises(ValueError):
+        provider.cached('eth2', eth2)
+    state['up'] = True
+    assert provider.cached('eth2', eth2) == {'interface': 'eth2'}
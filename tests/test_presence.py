@@ -0,0 +1,168 @@
+import os
+import time
+
+import pytest
+
+from persistence import StateStore
+from presence import PresenceError, PresenceLog
+from registry import DeviceRegistry
+
+DAY = 86400.0
+# Recent enough that retention by age keeps everything
+T = time.time() - 3600
+END = T + 3600
+
+
+# An event `offset` seconds after T
+def event(offset, event_type, ip, mac='aa:00:00:00:00:01', old=None, new=None):
+    return (T + offset, event_type, ip, mac, old, new)
+
+
+def offsets(items):
+    return [round(item['timestamp'] - T, 3) for item in items]
+
+
+def test_query_by_device_time_and_type(tmp_path):
+    presence = PresenceLog(str(tmp_path))
+    presence.record([
+        event(100, 'joined', '10.0.0.1'),
+        event(200, 'ip_changed', '10.0.0.2', old='10.0.0.1', new='10.0.0.2'),
+        event(300, 'left', '10.0.0.2'),
+        event(400, 'joined', '10.0.0.7', mac='aa:00:00:00:00:07'),
+    ])
+
+    # Newest first, found by MAC, new IP and the old IP of the move
+    assert [item['type'] for item in presence.query('aa:00:00:00:00:01')] == ['left', 'ip_changed', 'joined']
+    assert [item['type'] for item in presence.query('10.0.0.1')] == ['ip_changed', 'joined']
+    assert offsets(presence.query('10.0.0.2')) == [300, 200]
+
+    assert offsets(presence.query(since=T + 150, until=T + 350)) == [300, 200]
+    assert [item['ip'] for item in presence.query(types={'joined'})] == ['10.0.0.7', '10.0.0.1']
+    assert offsets(presence.query(limit=2)) == [400, 300]
+    assert presence.query('10.9.9.9') == []
+
+
+def test_flapping_counts_joins_and_leaves_per_device(tmp_path):
+    presence = PresenceLog(str(tmp_path), segment_bytes=512)
+    flaps = [event(i, 'joined' if i % 2 == 0 else 'left', f"10.0.0.{i % 3 + 1}") for i in range(10)]
+    flaps.append(event(100, 'joined', '10.0.0.9', mac='aa:00:00:00:00:09'))
+    flaps.append(event(101, 'hostname_changed', '10.0.0.9', mac='aa:00:00:00:00:09', old='a', new='b'))
+    presence.record(flaps)
+    presence.flush()
+    assert len(presence.segments) > 1
+
+    # One MAC across several IPs is one device; hostname changes are no flaps
+    assert presence.flapping(4, since=T) == [{'device': 'aa:00:00:00:00:01', 'count': 10}]
+    assert presence.flapping(1, since=T + 5) == [
+        {'device': 'aa:00:00:00:00:01', 'count': 5}, {'device': 'aa:00:00:00:00:09', 'count': 1}]
+    assert presence.flapping(1, since=T, until=T + 0.5) == [{'device': 'aa:00:00:00:00:01', 'count': 1}]
+
+
+def test_reopen_reads_sealed_and_unsealed_segments(tmp_path):
+    presence = PresenceLog(str(tmp_path), segment_bytes=256)
+    presence.record([event(i, 'joined' if i % 2 == 0 else 'left', '10.0.0.1') for i in range(20)])
+    presence.flush()
+    presence.record([event(100, 'joined', '10.0.0.5', mac='aa:00:00:00:00:05')])
+    presence.flush()
+    before = presence.query()
+    assert len(before) == 21
+    # Stopped without close(): the last segment has no index and is rebuilt from its log
+    presence.file.close()
+    presence.lock_file.close()
+
+    reopened = PresenceLog(str(tmp_path), segment_bytes=256)
+    assert reopened.query() == before
+    assert offsets(reopened.query('aa:00:00:00:00:05')) == [100]
+    assert reopened.flapping(20, since=T) == [{'device': 'aa:00:00:00:00:01', 'count': 20}]
+
+    # Timestamps never go back, even across a restart
+    reopened.record([event(50, 'left', '10.0.0.5', mac='aa:00:00:00:00:05')])
+    assert offsets(reopened.query('10.0.0.5')) == [100, 100]
+    reopened.close()
+    assert PresenceLog(str(tmp_path)).stats()['events'] == 22
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    presence = PresenceLog(str(tmp_path))
+    presence.record([event(1, 'joined', '10.0.0.1'), event(2, 'left', '10.0.0.1')])
+    presence.flush()
+    presence.file.write(b'[3.0,"joi')
+    presence.file.close()
+    presence.lock_file.close()
+
+    reopened = PresenceLog(str(tmp_path))
+    assert [item['type'] for item in reopened.query()] == ['left', 'joined']
+
+
+def test_retention_by_size_drops_oldest_segments(tmp_path):
+    presence = PresenceLog(str(tmp_path), segment_bytes=300, max_bytes=1200)
+    # Each flush is one append, so a segment holds at least one batch
+    for batch in range(8):
+        presence.record([event(i, 'joined', f"10.0.{i}.1", mac=f"aa:00:00:00:{i:02x}:01")
+                         for i in range(batch * 10, batch * 10 + 10)])
+        presence.flush()
+    stats = presence.stats()
+    assert stats['bytes'] <= 1200
+    assert stats['segments'] == len([name for name in os.listdir(tmp_path) if name.endswith('.log')])
+    # What is left is the newest events
+    assert offsets(presence.query(limit=1)) == [79]
+    assert presence.query('10.0.0.1') == []
+    assert stats['oldest'] > T
+
+
+def test_retention_by_age(tmp_path):
+    presence = PresenceLog(str(tmp_path), segment_bytes=200, max_age=DAY)
+    presence.record([event(-3 * DAY + i, 'joined', '10.0.0.1') for i in range(5)])
+    presence.flush()
+    presence.record([event(i, 'left', '10.0.0.2', mac='aa:00:00:00:00:02') for i in range(5)])
+    presence.flush()
+    assert [item['ip'] for item in presence.query(since=0.0)] == ['10.0.0.2'] * 5
+
+    # Also applied when the log is opened
+    presence.close()
+    assert PresenceLog(str(tmp_path), max_age=60).stats()['events'] == 0
+
+
+def saved_device(i, status):
+    return {
+        'ip': f"10.0.0.{i}", 'hostname': 'Unknown', 'status': status, 'last_seen': '2024-01-01 00:00:00',
+        'first_seen': '2024-01-01 00:00:00', 'mac': f"aa:00:00:00:00:{i:02x}", 'vendor': 'Unknown',
+        'blocked': False, 'is_local': False
+    }
+
+
+def test_restart_records_only_real_presence_changes(tmp_path):
+    store = StateStore(str(tmp_path / 'state.db'))
+    store.save_devices([saved_device(1, 'up'), saved_device(2, 'up'), saved_device(3, 'down')])
+    presence = PresenceLog(str(tmp_path / 'presence'))
+    registry = DeviceRegistry(on_events=presence.record)
+    registry.load(store.load_devices())
+    assert {device.status for device in registry} == {'unknown'}
+
+    # Saving a device before the first scan keeps the status it was saved with
+    store.save_devices([dict(registry.get('10.0.0.2').to_dict(), blocked=True)])
+    assert {record['ip']: record['saved_status'] for record in store.load_devices()}['10.0.0.2'] == 'up'
+
+    # The first scan sees 10.0.0.1 (still up) and 10.0.0.3 (was down), and
+    # not 10.0.0.2 (was up)
+    seen = [saved_device(1, 'up'), saved_device(3, 'up')]
+    registry.merge(seen)
+    registry.mark_gone({record['ip'] for record in seen})
+    assert [(item['type'], item['ip']) for item in presence.query(since=0.0)] == [
+        ('left', '10.0.0.2'), ('joined', '10.0.0.3')]
+    assert presence.query('10.0.0.1', since=0.0) == []
+    presence.close()
+    store.close()
+
+
+def test_a_directory_is_opened_by_one_log_at_a_time(tmp_path):
+    presence = PresenceLog(str(tmp_path))
+    with pytest.raises(PresenceError):
+        PresenceLog(str(tmp_path))
+    presence.record([event(1, 'joined', '10.0.0.1')])
+    presence.close()
+
+    reopened = PresenceLog(str(tmp_path))
+    reopened.record([event(2, 'left', '10.0.0.1')])
+    assert [item['type'] for item in reopened.query('10.0.0.1')] == ['left', 'joined']
+    reopened.close()
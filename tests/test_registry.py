@@ -0,0 +1,217 @@
+from registry import DeviceRegistry
+
+
+def device(ip, mac='Unknown', hostname='Unknown', status='up', segment=None, last_seen='2024-01-01 00:00:00'):
+    return {
+        'ip': ip,
+        'hostname': hostname,
+        'status': status,
+        'last_seen': last_seen,
+        'first_seen': '2024-01-01 00:00:00',
+        'mac': mac,
+        'vendor': 'Unknown',
+        'blocked': False,
+        'is_local': False,
+        'segment': segment
+    }
+
+
+def recording_registry():
+    events = []
+    registry = DeviceRegistry(on_events=events.extend)
+    return registry, events
+
+
+def event_types(events):
+    return sorted((event[1], event[2]) for event in events)
+
+
+def test_merge_reports_added_and_changed():
+    registry, events = recording_registry()
+    added, changed = registry.merge([device('10.0.0.1', 'aa:00:00:00:00:01'), device('10.0.0.2')])
+    assert added == {'10.0.0.1', '10.0.0.2'}
+    assert changed == set()
+    assert event_types(events) == [('joined', '10.0.0.1'), ('joined', '10.0.0.2')]
+
+    # Only last_seen moved: merged, but not changed
+    added, changed = registry.merge([device('10.0.0.1', 'aa:00:00:00:00:01', last_seen='2024-01-01 00:01:00')])
+    assert (added, changed) == (set(), set())
+    assert registry.get('10.0.0.1').last_seen == '2024-01-01 00:01:00'
+
+    added, changed = registry.merge([device('10.0.0.2', hostname='printer')])
+    assert (added, changed) == (set(), {'10.0.0.2'})
+    assert registry.get('10.0.0.2').hostname == 'printer'
+
+    # An unknown hostname or MAC never overwrites a known one
+    registry.merge([device('10.0.0.2')])
+    assert registry.get('10.0.0.2').hostname == 'printer'
+    assert registry.get('aa:00:00:00:00:01').ip == '10.0.0.1'
+
+
+def test_merge_mac_change_reindexes_mac():
+    registry, events = recording_registry()
+    registry.merge([device('10.0.0.1', 'aa:00:00:00:00:01')])
+    del events[:]
+    _, changed = registry.merge([device('10.0.0.1', 'aa:00:00:00:00:02')])
+    assert changed == {'10.0.0.1'}
+    assert registry.get('aa:00:00:00:00:01') is None
+    assert registry.get('aa:00:00:00:00:02').ip == '10.0.0.1'
+    assert [event[1:] for event in events] == [
+        ('mac_changed', '10.0.0.1', 'aa:00:00:00:00:02', 'aa:00:00:00:00:01', 'aa:00:00:00:00:02')]
+
+
+def test_merge_mac_moving_to_new_ip_is_ip_changed_not_joined():
+    registry, events = recording_registry()
+    registry.merge([device('10.0.0.1', 'aa:00:00:00:00:01')])
+    del events[:]
+    added, _ = registry.merge([device('10.0.0.9', 'aa:00:00:00:00:01')])
+    assert added == {'10.0.0.9'}
+    assert registry.get('aa:00:00:00:00:01').ip == '10.0.0.9'
+    assert event_types(events) == [('ip_changed', '10.0.0.9')]
+
+    # The old address going quiet is not a leave: its MAC answers elsewhere
+    del events[:]
+    assert registry.mark_gone({'10.0.0.9'}) == {'10.0.0.1'}
+    assert events == []
+
+
+def test_merge_segment_move():
+    registry = DeviceRegistry()
+    registry.merge([device('10.0.0.1', segment='lan')])
+    lan_version = registry.segment_version('lan')
+    _, changed = registry.merge([device('10.0.0.1', segment='iot')])
+    assert changed == {'10.0.0.1'}
+    assert registry.in_segment('lan') == []
+    assert [d.ip for d in registry.in_segment('iot')] == ['10.0.0.1']
+    assert registry.segments() == ['iot']
+    # Both segments changed: one lost a device, the other gained it
+    assert registry.segment_version('lan') > lan_version
+    assert registry.segment_version('iot') == registry.version
+
+    # A record without a segment leaves it alone
+    registry.merge([device('10.0.0.1')])
+    assert registry.get('10.0.0.1').segment == 'iot'
+
+
+def test_mark_gone_keep_and_segment():
+    registry, events = recording_registry()
+    registry.merge([device('10.0.0.1', segment='lan'), device('10.0.0.2', segment='lan'),
+                    device('10.0.1.1', segment='iot'), device('10.0.0.3', segment='lan')])
+    del events[:]
+
+    # Only the lan segment is checked and 10.0.0.2 sits in an unscanned shard
+    gone = registry.mark_gone({'10.0.0.1'}, keep=lambda ip: ip == '10.0.0.2', segment='lan')
+    assert gone == {'10.0.0.3'}
+    assert registry.get('10.0.1.1').status == 'up'
+    assert registry.get('10.0.0.2').status == 'up'
+    assert registry.get('10.0.0.3').status == 'down'
+    assert event_types(events) == [('left', '10.0.0.3')]
+
+    # Already down devices are not reported again
+    version = registry.version
+    assert registry.mark_gone({'10.0.0.1'}, keep=lambda ip: ip == '10.0.0.2', segment='lan') == set()
+    assert registry.version == version
+
+    del events[:]
+    registry.merge([device('10.0.0.3', segment='lan')])
+    assert event_types(events) == [('joined', '10.0.0.3')]
+
+
+def test_changed_since():
+    registry = DeviceRegistry()
+    registry.merge([device('10.0.0.1', segment='lan'), device('10.0.1.1', segment='iot')])
+    start = registry.version
+    assert registry.changed_since(start) == ([], [])
+
+    registry.merge([device('10.0.0.1', hostname='nas', segment='lan')])
+    registry.merge([device('10.0.1.1', hostname='cam', segment='iot')])
+    registry.remove('10.0.0.1')
+    changed, removed = registry.changed_since(start)
+    assert [record['ip'] for record in changed] == ['10.0.1.1']
+    assert removed == ['10.0.0.1']
+
+    changed, removed = registry.changed_since(start, segment='lan')
+    assert changed == [] and removed == ['10.0.0.1']
+    changed, _ = registry.changed_since(0)
+    assert [record['hostname'] for record in changed] == ['cam']
+
+
+def test_snapshot_is_shared_until_the_next_change():
+    registry = DeviceRegistry()
+    registry.merge([device('10.0.0.1'), device('10.0.0.2')])
+    first = registry.snapshot()
+    assert sorted(record['ip'] for record in first) == ['10.0.0.1', '10.0.0.2']
+    assert registry.snapshot() is first
+
+    registry.merge([device('10.0.0.2', hostname='tv')])
+    second = registry.snapshot()
+    assert second is not first
+    assert {record['ip']: record['hostname'] for record in second}['10.0.0.2'] == 'tv'
+    # The old snapshot is untouched
+    assert {record['ip']: record['hostname'] for record in first}['10.0.0.2'] == 'Unknown'
+
+
+def test_page_walks_every_device_once():
+    registry = DeviceRegistry()
+    registry.merge([device(f"10.0.{i // 256}.{i % 256}", hostname=f"host-{i % 7}",
+                           status='up' if i % 3 else 'down') for i in range(1, 501)])
+    seen = []
+    cursor = None
+    while True:
+        records, cursor, total = registry.page(sort='hostname', cursor=cursor, limit=64)
+        assert total == 500
+        seen.extend(records)
+        if cursor is None:
+            break
+    assert len({record['ip'] for record in seen}) == 500
+    keys = [(record['hostname'], tuple(int(part) for part in record['ip'].split('.'))) for record in seen]
+    assert keys == sorted(keys)
+
+    records, _, total = registry.page(status={'down'}, limit=1000)
+    assert total == len(records) == 166
+    assert all(record['status'] == 'down' for record in records)
+
+
+def restored(ip, mac, saved_status, hostname='Unknown'):
+    return dict(device(ip, mac, hostname=hostname, status='unknown'), saved_status=saved_status)
+
+
+def test_restored_devices_record_only_changes_since_they_were_saved():
+    registry, events = recording_registry()
+    registry.load([restored('10.0.0.1', 'aa:00:00:00:00:01', 'up', hostname='nas'),
+                   restored('10.0.0.2', 'aa:00:00:00:00:02', 'up'),
+                   restored('10.0.0.3', 'aa:00:00:00:00:03', 'down'),
+                   restored('10.0.0.4', 'aa:00:00:00:00:04', 'up'),
+                   restored('10.0.0.5', 'aa:00:00:00:00:05', 'down')])
+    assert {device.status for device in registry} == {'unknown'}
+
+    # Still up (renamed while we were stopped), moved to a new IP, back up
+    # after being down, gone after being up, and still down
+    registry.merge([device('10.0.0.1', 'aa:00:00:00:00:01', hostname='nas2'),
+                    device('10.0.0.9', 'aa:00:00:00:00:02'),
+                    device('10.0.0.3', 'aa:00:00:00:00:03')])
+    assert registry.mark_gone({'10.0.0.1', '10.0.0.9', '10.0.0.3'}) == {'10.0.0.2', '10.0.0.4', '10.0.0.5'}
+    assert event_types(events) == [('hostname_changed', '10.0.0.1'), ('ip_changed', '10.0.0.9'),
+                                   ('joined', '10.0.0.3'), ('left', '10.0.0.4')]
+    assert registry.get('10.0.0.1').status == 'up'
+    assert registry.saved_status == {}
+
+    # From then on changes are recorded as usual
+    del events[:]
+    registry.merge([device('10.0.0.5', 'aa:00:00:00:00:05')])
+    registry.mark_gone({'10.0.0.5', '10.0.0.9', '10.0.0.3'})
+    assert event_types(events) == [('joined', '10.0.0.5'), ('left', '10.0.0.1')]
+
+
+def test_clear_keeps_the_event_hook():
+    registry, events = recording_registry()
+    registry.merge([device('10.0.0.1', 'aa:00:00:00:00:01')])
+    version = registry.version
+    registry.clear()
+    assert len(registry) == 0 and registry.get('aa:00:00:00:00:01') is None
+    assert registry.version > version
+    assert registry.snapshot() == ()
+
+    del events[:]
+    registry.merge([device('10.0.0.1', 'aa:00:00:00:00:01')])
+    assert event_types(events) == [('joined', '10.0.0.1')]
@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+sys.path.insert(0, BENCHMARKS)
+
+from regression import compare  # noqa: E402
+
+# Small enough for every test run; the API load is left to manual runs
+SMALL = ['--sizes', '10,200', '--repeat', '3', '--api-seconds', '0']
+
+
+def run_suite(baseline, *extra):
+    return subprocess.run([sys.executable, os.path.join(BENCHMARKS, 'regression.py'), *SMALL,
+                           '--baseline', str(baseline), *extra],
+                          capture_output=True, text=True, timeout=300)
+
+
+def test_same_tree_passes_against_a_fresh_baseline(tmp_path):
+    baseline = tmp_path / 'baseline.json'
+    recorded = run_suite(baseline)
+    assert recorded.returncode == 0, recorded.stdout + recorded.stderr
+    assert 'written' in recorded.stdout
+
+    compared = run_suite(baseline)
+    assert compared.returncode == 0, compared.stdout + compared.stderr
+    assert compared.stdout.rstrip().endswith('OK')
+
+    # Another configuration gets its own baseline instead of a mismatch
+    other = run_suite(baseline, '--loss', '0.05')
+    assert other.returncode == 0 and 'written' in other.stdout
+    with open(baseline) as f:
+        assert len(json.load(f)) == 2
+
+
+def result(value, unit='s', better='lower'):
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def test_compare_flags_only_checked_results_beyond_threshold_and_noise():
+    baseline = {
+        '1000.full_scan': result(0.100),
+        '1000.stage.merge': result(0.004),
+        '1000.full_scan_rate': result(10000, '/s', 'higher'),
+        'api.devices.p50': result(10.0, 'ms'),
+        'api.devices.rate': result(500, '/s', 'higher'),
+    }
+    current = {
+        '1000.full_scan': result(0.150),  # 1.5x slower
+        '1000.stage.merge': result(0.010),  # 2.5x, but under the noise floor
+        '1000.full_scan_rate': result(6000, '/s', 'higher'),  # Dropped below 1/1.4
+        'api.devices.p50': result(40.0, 'ms'),
+        'api.devices.rate': result(100, '/s', 'higher'),
+        '5000.full_scan': result(1.0),  # Not in the baseline
+    }
+    assert compare(current, baseline, 0.4, 1.0) == ['1000.full_scan', '1000.full_scan_rate']
+    # API p50 latencies only with --check-api; throughput never
+    assert compare(current, baseline, 0.4, 1.0, check_api=True) == [
+        '1000.full_scan', '1000.full_scan_rate', 'api.devices.p50']
@@ -0,0 +1,42 @@
+from rescan import RescanPlanner
+
+
+def test_heap_stays_bounded_without_due():
+    # Full scan mode observes every host on every scan and never calls due()
+    planner = RescanPlanner(base_interval=60)
+    ips = [f"10.0.{i // 256}.{i % 256}" for i in range(4000)]
+    for scan in range(50):
+        planner.observe_many(ips, set(ips[scan % 2::2]), now=scan * 60.0)
+    assert len(planner.hosts) == 4000
+    assert len(planner.heap) <= 2 * 4000 + 64
+
+    # Compaction keeps exactly one live entry per host
+    due = planner.due(now=1e9)
+    assert sorted(due) == sorted(ips)
+
+
+def test_missed_hosts_back_off():
+    planner = RescanPlanner(base_interval=10, max_backoff=4)
+    planner.observe('10.0.0.1', True, now=0.0)
+    planner.observe('10.0.0.2', True, now=0.0)
+    assert sorted(planner.due(now=10.0)) == ['10.0.0.1', '10.0.0.2']
+
+    planner.observe('10.0.0.1', True, now=10.0)
+    planner.observe('10.0.0.2', False, now=10.0)
+    assert planner.due(now=20.0) == ['10.0.0.1']
+    assert planner.due(now=30.0) == ['10.0.0.2']
+    # Never seen and not up: not tracked
+    planner.observe('10.0.0.3', False, now=0.0)
+    assert planner.get('10.0.0.3') is None
+
+
+def test_retry_reschedules_without_touching_confidence():
+    planner = RescanPlanner(base_interval=60, retry_delay=5)
+    planner.observe('10.0.0.1', True, now=0.0)
+    assert planner.due(now=60.0) == ['10.0.0.1']
+    confidence = planner.hosts['10.0.0.1'].confidence
+
+    planner.retry(['10.0.0.1', '10.0.0.9'], now=60.0)
+    assert planner.hosts['10.0.0.1'].confidence == confidence
+    assert '10.0.0.9' not in planner.hosts
+    assert planner.due(now=64.0) == ['10.0.0.1']
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+import app
+from rescan import RescanPlanner
+from segments import Segment
+
+INFO = {'local_ip': '10.0.0.1', 'gateway_ip': '10.0.0.254', 'interface': 'eth0',
+        'netmask': '255.255.255.0', 'cidr': '10.0.0.0/24', 'hostname': 'test'}
+
+
+# Discovery backend where every host answers, except that shards holding
+# one of `failing` raise
+class FakeBackend:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+
+    def sweep(self, hosts, timeout=0):
+        if self.failing & set(hosts):
+            raise OSError('nmap crashed')
+        return [{'ip': ip, 'status': 'up', 'mac': 'Unknown'} for ip in hosts]
+
+
+@pytest.fixture
+def segment(monkeypatch):
+    segment = Segment('test', lambda: INFO, scan_interval=60)
+    segment.planner = RescanPlanner(retry_delay=5)
+    monkeypatch.setattr(app, 'scan_mode', 'incremental')
+    monkeypatch.setattr(app, 'scan_shard_prefix', 30)  # Batches of 4 targets
+    monkeypatch.setattr(app.hostname_resolver, 'lookup', lambda ip: None)
+    monkeypatch.setattr(app.mac_resolver, 'reader', lambda: {})
+    monkeypatch.setattr(app, 'publish_device_delta', lambda *args, **kwargs: None)
+    app.devices.sync([], version=0, reset=True)
+    return segment
+
+
+# Track `ips` as up and overdue, after a full sweep of the segment
+def schedule(planner, ips):
+    planner.record_full(INFO['cidr'])
+    for ip in ips:
+        planner.observe(ip, True, now=time.monotonic() - 1000)
+
+
+def next_probe_in(planner, ip):
+    return planner.hosts[ip].next_probe - time.monotonic()
+
+
+def test_unprobed_targets_are_retried(segment, monkeypatch):
+    inside = [f"10.0.0.{i}" for i in range(10, 18)]
+    schedule(segment.planner, inside + ['192.168.1.5'])
+    # 10.0.0.10-13 share a batch with the failing host
+    monkeypatch.setattr(app, 'make_discovery_backend', lambda info: FakeBackend(failing={'10.0.0.12'}))
+
+    seen = app.scan_network(segment=segment)
+    assert seen == set(inside[4:])
+    for ip in inside[4:]:
+        assert 55 < next_probe_in(segment.planner, ip) <= 60
+    # The failed batch and the host outside the subnet come back soon
+    for ip in inside[:4] + ['192.168.1.5']:
+        assert 0 < next_probe_in(segment.planner, ip) <= 5
+    assert sorted(segment.planner.due(now=time.monotonic() + 5)) == sorted(inside[:4] + ['192.168.1.5'])
+
+
+def test_targets_are_retried_when_the_scan_fails(segment, monkeypatch):
+    inside = [f"10.0.0.{i}" for i in range(10, 14)]
+    schedule(segment.planner, inside)
+    monkeypatch.setattr(app, 'make_discovery_backend', lambda info: FakeBackend())
+
+    def broken_merge(discovered):
+        raise RuntimeError('disk full')
+    monkeypatch.setattr(app.devices, 'merge', broken_merge)
+
+    assert app.scan_network(segment=segment) == set()
+    assert sorted(segment.planner.due(now=time.monotonic() + 5)) == inside
@@ -0,0 +1,191 @@
+import logging
+import os
+import threading
+import time
+
+import psutil
+
+from traffic_store import RingBuffer
+
+log = logging.getLogger(__name__)
+
+PROC_NET_DEV = '/proc/net/dev'
+NIC_FIELDS = ('timestamp', 'download_rate', 'upload_rate', 'bytes_recv', 'bytes_sent')
+COUNTER_32 = 2 ** 32
+COUNTER_64 = 2 ** 64
+
+
+# {interface: (bytes_recv, packets_recv, bytes_sent, packets_sent)} from
+# /proc/net/dev text
+def parse_proc_net_dev(text):
+    counters = {}
+    for line in text.splitlines()[2:]:
+        name, _, data = line.partition(':')
+        fields = data.split()
+        if len(fields) < 10:
+            continue
+        counters[name.strip()] = (int(fields[0]), int(fields[1]), int(fields[8]), int(fields[9]))
+    return counters
+
+
+def read_proc_net_dev(path=PROC_NET_DEV):
+    with open(path) as f:
+        return parse_proc_net_dev(f.read())
+
+
+def read_psutil_counters():
+    return {
+        name: (c.bytes_recv, c.packets_recv, c.bytes_sent, c.packets_sent)
+        for name, c in psutil.net_io_counters(pernic=True).items()
+    }
+
+
+# One /proc read where available (no per-NIC syscalls), psutil elsewhere
+def default_reader():
+    if os.path.exists(PROC_NET_DEV):
+        return read_proc_net_dev
+    return read_psutil_counters
+
+
+# Increase of a kernel counter between two reads. A counter that went
+# backwards from the top half of its range wrapped (32-bit counters on some
+# drivers and 32-bit kernels); anything else was reset (interface
+# re-created) and counts from zero.
+def counter_delta(current, previous):
+    if current >= previous:
+        return current - previous
+    if COUNTER_32 // 2 < previous < COUNTER_32:
+        return current + COUNTER_32 - previous
+    if previous > COUNTER_64 // 2:
+        return current + COUNTER_64 - previous
+    return current
+
+
+# Per-NIC state: wrap-corrected running totals plus a ring buffer of samples
+class NicSeries:
+    __slots__ = ('raw', 'totals', 'buffer', 'packets_recv', 'packets_sent')
+
+    def __init__(self, raw, capacity):
+        self.raw = raw
+        self.totals = [raw[0], raw[2]]  # bytes_recv, bytes_sent (never go backwards)
+        self.packets_recv = raw[1]
+        self.packets_sent = raw[3]
+        self.buffer = RingBuffer(capacity, NIC_FIELDS)
+
+
+# Reads every NIC's counters once per `interval` on its own thread, so
+# traffic keeps being sampled however long a scan takes. Rates use the
+# monotonic clock; timestamps stored in the buffers are wall-clock.
+# Each NIC's ring buffer has a single writer (the sampler thread), so
+# readers take no lock: they see the buffer either before or after a sample.
+# on_sample(download_rate, upload_rate, bytes_recv, bytes_sent, timestamp) gets
+# the totals over all non-loopback NICs after every sample.
+class TrafficSampler:
+    def __init__(self, interval=1.0, capacity=3600, reader=None, on_sample=None,
+                 exclude=('lo',)):
+        self.interval = interval
+        self.capacity = capacity
+        self.reader = reader or default_reader()
+        self.on_sample = on_sample
+        self.exclude = set(exclude)
+        self.nics = {}  # name -> NicSeries
+        self.last_time = None
+        self.totals = None  # Latest summed sample over all counted NICs
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='traffic-sampler', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self.stopped.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                log.error("Error sampling traffic: %s", e)
+            # Fixed cadence; skip ticks instead of bursting after a stall
+            next_tick += self.interval
+            now = time.monotonic()
+            if next_tick < now:
+                next_tick = now + self.interval
+            self.stopped.wait(next_tick - now)
+
+    # Take one sample of every NIC
+    def sample(self, now=None, timestamp=None):
+        now = time.monotonic() if now is None else now
+        timestamp = time.time() if timestamp is None else timestamp
+        counters = self.reader()
+        elapsed = now - self.last_time if self.last_time is not None else 0
+        self.last_time = now
+
+        total_down = total_up = 0.0
+        total_recv = total_sent = 0
+        total_packets_recv = total_packets_sent = 0
+        for name, raw in counters.items():
+            series = self.nics.get(name)
+            if series is None:
+                # First sight of this NIC: nothing to diff against yet
+                series = self.nics[name] = NicSeries(raw, self.capacity)
+                received = sent = 0
+            else:
+                received = counter_delta(raw[0], series.raw[0])
+                sent = counter_delta(raw[2], series.raw[2])
+                series.totals[0] += received
+                series.totals[1] += sent
+                series.packets_recv += counter_delta(raw[1], series.raw[1])
+                series.packets_sent += counter_delta(raw[3], series.raw[3])
+                series.raw = raw
+
+            download_rate = received / elapsed if elapsed > 0 else 0.0
+            upload_rate = sent / elapsed if elapsed > 0 else 0.0
+            series.buffer.append((timestamp, download_rate, upload_rate, series.totals[0], series.totals[1]))
+
+            if name not in self.exclude:
+                total_down += download_rate
+                total_up += upload_rate
+                total_recv += series.totals[0]
+                total_sent += series.totals[1]
+                total_packets_recv += series.packets_recv
+                total_packets_sent += series.packets_sent
+
+        self.totals = {
+            'timestamp': timestamp,
+            'download_rate': total_down,
+            'upload_rate': total_up,
+            'bytes_recv': total_recv,
+            'bytes_sent': total_sent,
+            'packets_recv': total_packets_recv,
+            'packets_sent': total_packets_sent
+        }
+        if self.on_sample:
+            self.on_sample(total_down, total_up, total_recv, total_sent, timestamp)
+        return self.totals
+
+    # Latest sample of one NIC as a dict (with packet counts), or None
+    def latest(self, name):
+        series = self.nics.get(name)
+        if series is None:
+            return None
+        row = series.buffer.last()
+        if row is None:
+            return None
+        result = dict(zip(NIC_FIELDS, row))
+        result['packets_recv'] = series.packets_recv
+        result['packets_sent'] = series.packets_sent
+        return result
+
+    # The newest `points` samples of one NIC as {field: [values]}, or None
+    def history(self, name, points=60):
+        series = self.nics.get(name)
+        if series is None:
+            return None
+        return series.buffer.tail(points)
+
+    def interfaces(self):
+        return sorted(self.nics)
@@ -0,0 +1,170 @@
+import threading
+import time
+from array import array
+from datetime import datetime
+
+RAW_FIELDS = ('timestamp', 'download_rate', 'upload_rate', 'bytes_recv', 'bytes_sent')
+ROLLUP_FIELDS = (
+    'timestamp',
+    'download_avg', 'download_min', 'download_max',
+    'upload_avg', 'upload_min', 'upload_max',
+    'bytes_recv', 'bytes_sent'
+)
+
+# range -> (tier, number of points)
+RANGES = {
+    '1h': ('1m', 60),
+    '6h': ('1m', 360),
+    '24h': ('15m', 96),
+    '7d': ('1h', 168),
+}
+
+
+# Fixed-capacity ring buffer with one array('d') column per field
+class RingBuffer:
+    def __init__(self, capacity, fields):
+        self.capacity = capacity
+        self.fields = fields
+        self.columns = [array('d', bytes(8 * capacity)) for _ in fields]
+        self.next = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, values):
+        for column, value in zip(self.columns, values):
+            column[self.next] = value
+        self.next = (self.next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def last(self):
+        if self.size == 0:
+            return None
+        index = (self.next - 1) % self.capacity
+        return tuple(column[index] for column in self.columns)
+
+    # The newest n rows in chronological order, as {field: [values]}
+    def tail(self, n):
+        n = min(n, self.size)
+        start = (self.next - n) % self.capacity
+        result = {}
+        for field, column in zip(self.fields, self.columns):
+            if start + n <= self.capacity:
+                result[field] = column[start:start + n].tolist()
+            else:
+                result[field] = column[start:].tolist() + column[:(start + n) % self.capacity].tolist()
+        return result
+
+
+# Rolls raw samples up into fixed-width buckets with min/max/avg rates
+class RollupTier:
+    def __init__(self, resolution, capacity):
+        self.resolution = resolution
+        self.buffer = RingBuffer(capacity, ROLLUP_FIELDS)
+        self.bucket = None
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self.down_sum = self.up_sum = 0.0
+        self.down_min = self.up_min = float('inf')
+        self.down_max = self.up_max = 0.0
+        self.bytes_recv = self.bytes_sent = 0.0
+
+    def _row(self):
+        return (
+            self.bucket,
+            self.down_sum / self.count, self.down_min, self.down_max,
+            self.up_sum / self.count, self.up_min, self.up_max,
+            self.bytes_recv, self.bytes_sent
+        )
+
+    def add(self, timestamp, download_rate, upload_rate, bytes_recv, bytes_sent):
+        bucket = timestamp - timestamp % self.resolution
+        if self.bucket is not None and bucket != self.bucket and self.count:
+            self.buffer.append(self._row())
+            self._reset()
+        self.bucket = bucket
+
+        self.count += 1
+        self.down_sum += download_rate
+        self.up_sum += upload_rate
+        self.down_min = min(self.down_min, download_rate)
+        self.down_max = max(self.down_max, download_rate)
+        self.up_min = min(self.up_min, upload_rate)
+        self.up_max = max(self.up_max, upload_rate)
+        self.bytes_recv = bytes_recv
+        self.bytes_sent = bytes_sent
+
+    # The newest n buckets, including the one still being filled
+    def tail(self, n):
+        partial = self.count > 0
+        rows = self.buffer.tail(n - 1 if partial else n)
+        if partial:
+            for field, value in zip(ROLLUP_FIELDS, self._row()):
+                rows[field].append(value)
+        return rows
+
+
+# Traffic history with a raw ring buffer and 1m / 15m / 1h rollups. Memory
+# is fixed at construction time and range queries read at most a few
+# hundred points from the matching tier.
+class TrafficStore:
+    def __init__(self, raw_capacity=3600):
+        self.raw = RingBuffer(raw_capacity, RAW_FIELDS)
+        self.tiers = {
+            '1m': RollupTier(60, 360),
+            '15m': RollupTier(15 * 60, 96),
+            '1h': RollupTier(60 * 60, 168),
+        }
+        self.lock = threading.Lock()
+
+    def add_sample(self, download_rate, upload_rate, bytes_recv, bytes_sent, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            self.raw.append((timestamp, download_rate, upload_rate, bytes_recv, bytes_sent))
+            for tier in self.tiers.values():
+                tier.add(timestamp, download_rate, upload_rate, bytes_recv, bytes_sent)
+
+    # Newest raw sample as a dict, or None
+    def last(self):
+        with self.lock:
+            row = self.raw.last()
+        return dict(zip(RAW_FIELDS, row)) if row else None
+
+    # Chart data for one of RANGES, or the newest `points` raw samples when
+    # range_name is None. Timestamps are formatted like the rest of the app.
+    def query(self, range_name=None, points=20):
+        with self.lock:
+            if range_name is None:
+                rows = self.raw.tail(points)
+                download_rate, upload_rate = rows['download_rate'], rows['upload_rate']
+                extra = {}
+            else:
+                tier_name, points = RANGES[range_name]
+                rows = self.tiers[tier_name].tail(points)
+                download_rate, upload_rate = rows['download_avg'], rows['upload_avg']
+                extra = {
+                    'resolution': self.tiers[tier_name].resolution,
+                    'download_rate_min': rows['download_min'],
+                    'download_rate_max': rows['download_max'],
+                    'upload_rate_min': rows['upload_min'],
+                    'upload_rate_max': rows['upload_max'],
+                }
+
+        result = {
+            'range': range_name,
+            'timestamps': [format_timestamp(ts) for ts in rows['timestamp']],
+            'download': [int(value) for value in rows['bytes_recv']],
+            'upload': [int(value) for value in rows['bytes_sent']],
+            'download_rate': download_rate,
+            'upload_rate': upload_rate,
+        }
+        result.update(extra)
+        return result
+
+
+def format_timestamp(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,94 @@
+import csv
+import logging
+import os
+import threading
+
+log = logging.getLogger(__name__)
+
+BUNDLED_OUI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'oui.txt')
+
+# Full registries shipped by other packages, used on top of the bundled table
+SYSTEM_OUI_FILES = (
+    '/usr/share/nmap/nmap-mac-prefixes',
+    '/usr/share/arp-scan/ieee-oui.txt',
+    '/usr/share/ieee-data/oui.txt',
+)
+
+HEX_DIGITS = set('0123456789ABCDEF')
+
+
+# (prefix, vendor) pairs from an OUI file in any of the common layouts:
+# nmap-mac-prefixes / arp-scan ("001122 Vendor"), the IEEE oui.txt
+# ("00-11-22   (hex)    Vendor") and the IEEE CSVs ("MA-L,001122,Vendor,...")
+def parse_oui(lines):
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if '(hex)' in line or '(base 16)' in line:
+            prefix, _, vendor = line.partition('(hex)' if '(hex)' in line else '(base 16)')
+        elif line.startswith('MA-'):
+            fields = next(csv.reader([line]))
+            if len(fields) < 3:
+                continue
+            prefix, vendor = fields[1], fields[2]
+        else:
+            parts = line.split(None, 1)
+            if len(parts) != 2:
+                continue
+            prefix, vendor = parts
+        prefix = prefix.strip().replace('-', '').replace(':', '').upper()
+        vendor = vendor.strip()
+        if 6 <= len(prefix) <= 9 and set(prefix) <= HEX_DIGITS and vendor:
+            yield prefix, vendor
+
+
+# Vendor lookup by MAC prefix. Assignments are 24, 28 or 36 bits long (MA-L,
+# MA-M, MA-S), so the index is one dict per prefix length and a lookup is at
+# most three dict probes, longest prefix first. Files are read on first use.
+class OuiIndex:
+    def __init__(self, paths=(BUNDLED_OUI,) + SYSTEM_OUI_FILES):
+        self.paths = paths
+        self.tables = {}  # prefix length in hex digits -> {prefix: vendor}
+        self.lengths = ()
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return
+            for path in self.paths:
+                if not os.path.exists(path):
+                    continue
+                try:
+                    with open(path, encoding='utf-8', errors='replace') as f:
+                        for prefix, vendor in parse_oui(f):
+                            self.tables.setdefault(len(prefix), {})[prefix] = vendor
+                except OSError as e:
+                    log.warning("Error reading OUI table %s: %s", path, e)
+            self.lengths = tuple(sorted(self.tables, reverse=True))
+            self.loaded = True
+            log.info("Loaded %d MAC vendor prefixes", len(self))
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables.values())
+
+    # Vendor for a MAC, 'Randomized' for unknown locally administered
+    # addresses (private Wi-Fi MACs, containers) and 'Unknown' otherwise
+    def lookup(self, mac):
+        if not mac or mac == 'Unknown':
+            return 'Unknown'
+        if not self.loaded:
+            self.load()
+        digits = mac.replace(':', '').replace('-', '').upper()
+        for length in self.lengths:
+            vendor = self.tables[length].get(digits[:length])
+            if vendor is not None:
+                return vendor
+        try:
+            if int(digits[:2], 16) & 0x02:
+                return 'Randomized'
+        except ValueError:
+            pass
+        return 'Unknown'